@@ -0,0 +1,250 @@
+"""
+Analyse du marché immobilier
+Prix au m², médianes, quantiles, volumes et tendances 30/90 jours par commune et
+par zone. Les prix au m² sont matérialisés par jour et par commune : chaque analyse
+ne replie que les journées nouvelles, puis agrège en colonnes NumPy.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+FICHIER_ANALYSE = os.path.join(DOSSIER_ETAT, "analyse_marche.sqlite")
+
+# Prix au m² hors de cette plage : erreurs de saisie ou terrains, exclus des statistiques
+PRIX_M2_MIN = 200
+PRIX_M2_MAX = 20000
+FENETRES = (30, 90)
+QUANTILES = (0.25, 0.5, 0.75)
+SECONDES_JOUR = 86400
+
+
+def _transitions_heure(annee_min, annee_max):
+    """Instants UTC des changements d'heure de Paris et décalage en vigueur après chacun"""
+    instants, decalages = [], []
+    for annee in range(annee_min - 1, annee_max + 2):
+        for mois in (3, 10):
+            # Dernier dimanche du mois, 01:00 UTC
+            jour = datetime(annee, mois, 31)
+            jour -= timedelta(days=(jour.weekday() + 1) % 7)
+            instant = datetime(annee, mois, jour.day, 1, tzinfo=ZoneInfo("UTC"))
+            instants.append(instant.timestamp())
+            decalages.append(7200 if mois == 3 else 3600)
+    return np.array(instants), np.array(decalages)
+
+
+def jours_locaux(horodatages: np.ndarray) -> np.ndarray:
+    """Numéro de jour (heure de Paris) de chaque horodatage Unix, sans boucle par ligne"""
+    if len(horodatages) == 0:
+        return np.zeros(0, dtype=np.int64)
+    annees = 1970 + horodatages // (365.2425 * SECONDES_JOUR)
+    instants, decalages = _transitions_heure(int(annees.min()), int(annees.max()))
+    index = np.searchsorted(instants, horodatages, side="right") - 1
+    decalage = np.where(index >= 0, decalages[np.clip(index, 0, None)], 3600)
+    return ((horodatages + decalage) // SECONDES_JOUR).astype(np.int64)
+
+
+def _jour_local(date: datetime) -> int:
+    return int(jours_locaux(np.array([date.timestamp()]))[0])
+
+
+def statistiques_par_groupe(groupes: np.ndarray, valeurs: np.ndarray, nb_groupes: int,
+                            quantiles=QUANTILES):
+    """Effectif, moyenne et quantiles de `valeurs` pour chaque groupe, calculés en une passe triée
+
+    Retourne (effectifs, moyennes, quantiles) ; quantiles a la forme (len(quantiles), nb_groupes)
+    et vaut NaN pour les groupes vides (interpolation linéaire comme numpy.quantile).
+    """
+    effectifs = np.bincount(groupes, minlength=nb_groupes)
+    sommes = np.bincount(groupes, weights=valeurs, minlength=nb_groupes)
+    moyennes = np.divide(sommes, effectifs, out=np.full(nb_groupes, np.nan), where=effectifs > 0)
+    resultats = np.full((len(quantiles), nb_groupes), np.nan)
+    if len(valeurs) == 0:
+        return effectifs, moyennes, resultats
+
+    ordre = np.lexsort((valeurs, groupes))
+    tries = valeurs[ordre]
+    debuts = np.concatenate(([0], np.cumsum(effectifs)[:-1]))
+    non_vides = effectifs > 0
+    for i, q in enumerate(quantiles):
+        position = debuts + q * np.maximum(effectifs - 1, 0)
+        bas = np.floor(position).astype(np.int64)
+        haut = np.minimum(np.ceil(position).astype(np.int64), len(tries) - 1)
+        bas = np.minimum(bas, len(tries) - 1)
+        fraction = position - bas
+        interpole = tries[bas] * (1 - fraction) + tries[haut] * fraction
+        resultats[i] = np.where(non_vides, interpole, np.nan)
+    return effectifs, moyennes, resultats
+
+
+def formater_tendance(variation):
+    if variation is None or np.isnan(variation):
+        return "n/d"
+    if abs(variation) < 0.5:
+        return "stable"
+    return f"{variation:+.0f}%"
+
+
+class MoteurAnalyse:
+    """Agrégats journaliers des prix au m² et statistiques de marché glissantes"""
+
+    def __init__(self, stock, chemin=FICHIER_ANALYSE, horloge=None):
+        self.stock = stock
+        self.horloge = horloge or (lambda: datetime.now(TIMEZONE_FRANCE))
+        if chemin != ":memory:":
+            dossier = os.path.dirname(chemin)
+            if dossier:
+                os.makedirs(dossier, exist_ok=True)
+        self._verrou = threading.Lock()
+        self._connexion = sqlite3.connect(chemin, check_same_thread=False)
+        with self._connexion:
+            self._connexion.executescript("""
+                CREATE TABLE IF NOT EXISTS agregats_jour (
+                    jour INTEGER NOT NULL,
+                    commune_norm TEXT NOT NULL,
+                    commune TEXT,
+                    zone TEXT,
+                    nb INTEGER NOT NULL,
+                    prix_m2 BLOB NOT NULL,
+                    PRIMARY KEY (jour, commune_norm)
+                );
+            """)
+
+    # --- Matérialisation ---
+
+    def mettre_a_jour(self) -> int:
+        """Replie dans les agrégats les annonces apparues depuis le dernier jour matérialisé
+
+        Le dernier jour est recalculé (il pouvait être incomplet). Retourne le nombre
+        de (jour, commune) écrits.
+        """
+        maintenant = self.horloge()
+        with self._verrou:
+            dernier = self._connexion.execute("SELECT MAX(jour) FROM agregats_jour").fetchone()[0]
+        if dernier is None:
+            debut = datetime.fromtimestamp(0, TIMEZONE_FRANCE)
+        else:
+            # Minuit UTC du dernier jour, moins une marge couvrant le décalage de Paris ;
+            # le filtre sur le numéro de jour local élimine ensuite l'excédent
+            debut = datetime.fromtimestamp((dernier - 1) * SECONDES_JOUR, TIMEZONE_FRANCE)
+
+        lignes = self.stock.prix_par_jour(debut, maintenant + timedelta(seconds=1))
+        if not lignes:
+            return 0
+
+        communes_norm, communes, zones, prix, surfaces, horodatages = zip(*lignes)
+        prix_m2 = np.asarray(prix, dtype=np.float64) / np.asarray(surfaces, dtype=np.float64)
+        jours = jours_locaux(np.asarray(horodatages, dtype=np.int64))
+        codes_communes, index_communes = np.unique(np.asarray(communes_norm, dtype=object).astype(str),
+                                                   return_inverse=True)
+        garder = (prix_m2 >= PRIX_M2_MIN) & (prix_m2 <= PRIX_M2_MAX)
+        if dernier is not None:
+            garder &= jours >= dernier
+        prix_m2, jours, index_communes = prix_m2[garder], jours[garder], index_communes[garder]
+        lignes_gardees = np.flatnonzero(garder)
+        if len(prix_m2) == 0:
+            return 0
+
+        # Tri par (jour, commune, prix) : chaque groupe est un bloc contigu déjà trié
+        ordre = np.lexsort((prix_m2, index_communes, jours))
+        jours, index_communes, prix_m2 = jours[ordre], index_communes[ordre], prix_m2[ordre]
+        lignes_gardees = lignes_gardees[ordre]
+        cles = jours * len(codes_communes) + index_communes
+        coupures = np.flatnonzero(np.diff(cles)) + 1
+        debuts = np.concatenate(([0], coupures))
+        fins = np.concatenate((coupures, [len(cles)]))
+
+        enregistrements = []
+        for debut_bloc, fin_bloc in zip(debuts, fins):
+            ligne = lignes_gardees[debut_bloc]
+            enregistrements.append((
+                int(jours[debut_bloc]), str(codes_communes[index_communes[debut_bloc]]),
+                communes[ligne], zones[ligne], int(fin_bloc - debut_bloc),
+                prix_m2[debut_bloc:fin_bloc].astype(np.float32).tobytes()
+            ))
+
+        with self._verrou, self._connexion:
+            if dernier is not None:
+                self._connexion.execute("DELETE FROM agregats_jour WHERE jour >= ?", (dernier,))
+            self._connexion.executemany("""
+                INSERT OR REPLACE INTO agregats_jour (jour, commune_norm, commune, zone, nb, prix_m2)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, enregistrements)
+        return len(enregistrements)
+
+    # --- Statistiques ---
+
+    def _charger(self, jour_min):
+        with self._verrou:
+            lignes = self._connexion.execute("""
+                SELECT jour, commune_norm, commune, zone, nb, prix_m2 FROM agregats_jour
+                WHERE jour >= ?
+            """, (jour_min,)).fetchall()
+        return lignes
+
+    def analyser(self) -> dict:
+        """Statistiques par commune et par zone sur 30 et 90 jours, avec tendance"""
+        self.mettre_a_jour()
+        aujourdhui = _jour_local(self.horloge())
+        horizon = 2 * max(FENETRES)
+        lignes = self._charger(aujourdhui - horizon + 1)
+        analyse = {"date": self.horloge().strftime("%Y-%m-%d"), "communes": {}, "zones": {}}
+        if not lignes:
+            return analyse
+
+        jours, communes_norm, communes, zones, effectifs, blobs = zip(*lignes)
+        effectifs = np.asarray(effectifs, dtype=np.int64)
+        valeurs = np.frombuffer(b"".join(blobs), dtype=np.float32).astype(np.float64)
+        ages = np.repeat(aujourdhui - np.asarray(jours, dtype=np.int64), effectifs)
+
+        noms_communes, index_communes = np.unique(np.asarray(communes_norm, dtype=object).astype(str),
+                                                  return_inverse=True)
+        affichage = dict(zip(communes_norm, communes))
+        zone_commune = dict(zip(communes_norm, zones))
+        zones_texte = np.asarray([z or "" for z in zones], dtype=object).astype(str)
+        noms_zones, index_zones = np.unique(zones_texte, return_inverse=True)
+
+        for cle_sortie, noms, index in (("communes", noms_communes, index_communes),
+                                        ("zones", noms_zones, index_zones)):
+            groupes = np.repeat(index, effectifs)
+            stats = {}
+            for fenetre in FENETRES:
+                courant = ages < fenetre
+                precedent = (ages >= fenetre) & (ages < 2 * fenetre)
+                n, moyennes, q = statistiques_par_groupe(groupes[courant], valeurs[courant], len(noms))
+                _, _, q_prec = statistiques_par_groupe(groupes[precedent], valeurs[precedent], len(noms),
+                                                       quantiles=(0.5,))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    variation = (q[1] / q_prec[0] - 1) * 100
+                stats[fenetre] = (n, moyennes, q, variation)
+
+            for i, nom in enumerate(map(str, noms)):
+                if not nom:
+                    continue
+                resume = {}
+                for fenetre, (n, moyennes, q, variation) in stats.items():
+                    if n[i] == 0:
+                        continue
+                    resume[f"{fenetre}j"] = {
+                        "volume": int(n[i]),
+                        "prix_m2_moyen": round(float(moyennes[i])),
+                        "prix_m2_median": round(float(q[1][i])),
+                        "prix_m2_q1": round(float(q[0][i])),
+                        "prix_m2_q3": round(float(q[2][i])),
+                        "tendance": formater_tendance(variation[i]),
+                    }
+                if not resume:
+                    continue
+                if cle_sortie == "communes":
+                    resume["zone"] = zone_commune.get(nom) or ""
+                    analyse["communes"][affichage.get(nom) or nom] = resume
+                else:
+                    analyse["zones"][nom] = resume
+        return analyse
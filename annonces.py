@@ -0,0 +1,448 @@
+"""
+Annonces immobilières normalisées et leur stockage SQLite
+Un seul modèle pour les résultats LeBonCoin, SeLoger et Bien'ici, indexé par
+commune, code postal, prix et date de première apparition.
+"""
+
+import hashlib
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+FICHIER_ANNONCES = os.path.join(DOSSIER_ETAT, "annonces.sqlite")
+
+_RE_PRIX = re.compile(r"(\d{1,3}(?:[\s  .]\d{3})+|\d{4,9})\s*(?:€|euros?)", re.IGNORECASE)
+_RE_SURFACE = re.compile(r"(\d{1,5}(?:[,.]\d{1,2})?)\s*m(?:²|2)", re.IGNORECASE)
+_RE_CODE_POSTAL = re.compile(r"\b(24\d{3})\b")
+# Longueur conservée des descriptions (suffisante pour comparer les textes)
+LONGUEUR_DESCRIPTION = 2000
+# Annonces d'un flux de veille comparées et enregistrées par transaction
+TAILLE_LOT_VEILLE = 500
+
+
+@dataclass(slots=True)
+class Annonce:
+    """Annonce normalisée, quel que soit le portail d'origine"""
+
+    portail: str
+    cle: str  # identifiant de l'annonce sur le portail, à défaut son URL
+    url: str
+    titre: str
+    prix: int | None
+    surface: float | None
+    commune: str
+    code_postal: str
+    zone: str
+    premiere_vue: datetime
+    derniere_vue: datetime
+    description: str = ""
+    photos: tuple = ()  # URLs des photos, pour rapprocher les doublons entre portails
+
+    @property
+    def prix_m2(self):
+        if self.prix and self.surface:
+            return self.prix / self.surface
+        return None
+
+
+@lru_cache(maxsize=4096)
+def normaliser_nom(nom: str) -> str:
+    """'Saint-Mayme-de-Péreyrol' -> 'saint mayme de pereyrol'"""
+    sans_accents = unicodedata.normalize("NFKD", nom or "").encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", sans_accents.lower()).split())
+
+
+def _nombre(valeur):
+    """Convertit '185 000 €', [185000], '185000.0' ou 185000 en nombre"""
+    if isinstance(valeur, list):
+        valeur = valeur[0] if valeur else None
+    if isinstance(valeur, dict):
+        valeur = valeur.get("value", valeur.get("amount"))
+    if isinstance(valeur, (int, float)):
+        return valeur
+    if isinstance(valeur, str):
+        chiffres = re.sub(r"[^\d,.]", "", valeur).replace(",", ".")
+        if chiffres.count(".") > 1 or re.fullmatch(r"\d{1,3}\.\d{3}", chiffres):
+            chiffres = chiffres.replace(".", "")
+        try:
+            return float(chiffres)
+        except ValueError:
+            return None
+    return None
+
+
+def _attribut_leboncoin(brut, cle):
+    for attribut in brut.get("attributes") or []:
+        if isinstance(attribut, dict) and attribut.get("key") == cle:
+            return attribut.get("value")
+    return None
+
+
+def _photos(brut):
+    urls = []
+    for cle in ("images", "photos", "pictures", "images_urls"):
+        valeur = brut.get(cle)
+        if isinstance(valeur, dict):
+            valeur = valeur.get("urls") or valeur.get("urls_large") or []
+        for element in valeur or []:
+            url = element.get("url") if isinstance(element, dict) else element
+            if isinstance(url, str) and url not in urls:
+                urls.append(url)
+    return tuple(urls)
+
+
+def _texte(brut):
+    metadata = brut.get("metadata") or {}
+    morceaux = [brut.get("text"), brut.get("description"), brut.get("body"),
+                metadata.get("description") if isinstance(metadata, dict) else None]
+    return " ".join(m for m in morceaux if isinstance(m, str))
+
+
+def zone_de(code_postal, commune, zones):
+    """Nom de la première zone contenant la commune ou le code postal"""
+    if hasattr(zones, "zone_de"):
+        return zones.zone_de(code_postal, commune)  # Zones indexées (communes.py)
+    commune_norm = normaliser_nom(commune)
+    for nom, zone in (zones or {}).items():
+        if commune_norm and commune_norm in {normaliser_nom(c) for c in zone.get("communes", [])}:
+            return nom
+    for nom, zone in (zones or {}).items():
+        if code_postal and code_postal in zone.get("codes_postaux", []):
+            return nom
+    return ""
+
+
+def empreinte(annonce: Annonce) -> str:
+    """Empreinte des champs suivis d'une veille à l'autre (prix, surface, titre)"""
+    contenu = f"{annonce.prix}|{annonce.surface}|{annonce.titre}"
+    return hashlib.blake2b(contenu.encode(), digest_size=8).hexdigest()
+
+
+@dataclass(slots=True)
+class DeltaVeille:
+    """Changements constatés par une veille par rapport à la précédente"""
+
+    nouvelles: list = field(default_factory=list)
+    modifiees: list = field(default_factory=list)  # (annonce, ancien prix)
+    retirees: list = field(default_factory=list)
+    suivies: int = 0
+
+    @property
+    def vide(self):
+        return not (self.nouvelles or self.modifiees or self.retirees)
+
+
+def normaliser_annonce(brut: dict, portail: str = None, zones: dict = None, vue_le: datetime = None) -> Annonce:
+    """Construit une Annonce depuis un élément de dataset LeBonCoin, SeLoger ou Bien'ici"""
+    portail = portail or brut.get("_portail") or ""
+    vue_le = vue_le or datetime.now(TIMEZONE_FRANCE)
+    metadata = brut.get("metadata") if isinstance(brut.get("metadata"), dict) else {}
+    texte = _texte(brut)
+
+    url = brut.get("url") or brut.get("link") or metadata.get("canonicalUrl") or ""
+    titre = (brut.get("title") or brut.get("subject") or brut.get("titre")
+             or metadata.get("title") or "Sans titre").strip()
+
+    prix = _nombre(brut.get("price", brut.get("prix")))
+    if prix is None:
+        trouve = _RE_PRIX.search(texte) or _RE_PRIX.search(titre)
+        prix = _nombre(trouve.group(1)) if trouve else None
+
+    surface = _nombre(brut.get("surface", brut.get("square", _attribut_leboncoin(brut, "square"))))
+    if surface is None:
+        trouve = _RE_SURFACE.search(titre) or _RE_SURFACE.search(texte)
+        surface = _nombre(trouve.group(1)) if trouve else None
+
+    lieu = brut.get("location", brut.get("lieu"))
+    commune = code_postal = ""
+    if isinstance(lieu, dict):
+        commune = lieu.get("city") or lieu.get("city_label") or ""
+        code_postal = str(lieu.get("zipcode") or lieu.get("postalCode") or "")
+    elif isinstance(lieu, str):
+        commune = _RE_CODE_POSTAL.sub("", lieu).strip(" ,()-")
+    commune = commune or brut.get("city") or brut.get("commune") or ""
+    code_postal = code_postal or str(brut.get("zipcode") or brut.get("postalCode") or brut.get("code_postal") or "")
+    if not code_postal:
+        trouve = _RE_CODE_POSTAL.search(f"{lieu if isinstance(lieu, str) else ''} {titre} {texte}")
+        code_postal = trouve.group(1) if trouve else ""
+
+    identifiant = brut.get("list_id") or brut.get("id") or brut.get("adId") or brut.get("reference")
+    cle = str(identifiant) if identifiant else url
+
+    return Annonce(
+        portail=portail,
+        cle=cle,
+        url=url,
+        titre=titre,
+        prix=int(prix) if prix else None,
+        surface=float(surface) if surface else None,
+        commune=commune.strip(),
+        code_postal=code_postal,
+        zone=brut.get("_zone") if brut.get("_zone") in (zones or {}) else zone_de(code_postal, commune, zones),
+        premiere_vue=vue_le,
+        derniere_vue=vue_le,
+        description=(brut.get("body") or brut.get("description") or texte)[:LONGUEUR_DESCRIPTION],
+        photos=_photos(brut),
+    )
+
+
+def _horodatage(date: datetime) -> int:
+    return int(date.timestamp())
+
+
+def _date(horodatage: int) -> datetime:
+    return datetime.fromtimestamp(horodatage, TIMEZONE_FRANCE)
+
+
+class StockAnnonces:
+    """Base SQLite des annonces, mise à jour par upsert (portail, identifiant)"""
+
+    COLONNES = ("portail", "cle", "url", "titre", "prix", "surface", "commune",
+                "code_postal", "zone", "premiere_vue", "derniere_vue", "description", "photos")
+
+    def __init__(self, chemin=FICHIER_ANNONCES):
+        if chemin != ":memory:":
+            dossier = os.path.dirname(chemin)
+            if dossier:
+                os.makedirs(dossier, exist_ok=True)
+        self._verrou = threading.Lock()
+        self._connexion = sqlite3.connect(chemin, check_same_thread=False)
+        self._connexion.execute("PRAGMA journal_mode=WAL")
+        self._connexion.execute("PRAGMA synchronous=NORMAL")
+        self._creer_schema()
+
+    def _creer_schema(self):
+        with self._connexion:
+            self._connexion.executescript("""
+                CREATE TABLE IF NOT EXISTS annonces (
+                    id INTEGER PRIMARY KEY,
+                    portail TEXT NOT NULL,
+                    cle TEXT NOT NULL,
+                    url TEXT,
+                    titre TEXT,
+                    prix INTEGER,
+                    surface REAL,
+                    commune TEXT,
+                    commune_norm TEXT,
+                    code_postal TEXT,
+                    zone TEXT,
+                    premiere_vue INTEGER NOT NULL,
+                    derniere_vue INTEGER NOT NULL,
+                    UNIQUE (portail, cle)
+                );
+            """)
+            colonnes = {ligne[1] for ligne in self._connexion.execute("PRAGMA table_info(annonces)")}
+            for colonne, definition in (("empreinte", "TEXT"), ("retiree", "INTEGER"),
+                                        ("description", "TEXT DEFAULT ''"), ("photos", "TEXT DEFAULT ''")):
+                if colonne not in colonnes:
+                    self._connexion.execute(f"ALTER TABLE annonces ADD COLUMN {colonne} {definition}")
+            self._connexion.executescript("""
+                CREATE INDEX IF NOT EXISTS idx_annonces_commune ON annonces (commune_norm);
+                CREATE INDEX IF NOT EXISTS idx_annonces_code_postal ON annonces (code_postal);
+                CREATE INDEX IF NOT EXISTS idx_annonces_prix ON annonces (prix);
+                CREATE INDEX IF NOT EXISTS idx_annonces_premiere_vue ON annonces (premiere_vue);
+                CREATE INDEX IF NOT EXISTS idx_annonces_zone ON annonces (zone, premiere_vue, prix);
+                CREATE INDEX IF NOT EXISTS idx_annonces_actives ON annonces (portail, derniere_vue)
+                    WHERE retiree IS NULL;
+            """)
+
+    def _ligne(self, annonce: Annonce):
+        return (annonce.portail, annonce.cle, annonce.url, annonce.titre, annonce.prix,
+                annonce.surface, annonce.commune, normaliser_nom(annonce.commune),
+                annonce.code_postal, annonce.zone,
+                _horodatage(annonce.premiere_vue), _horodatage(annonce.derniere_vue),
+                annonce.description, "\n".join(annonce.photos),
+                empreinte(annonce))
+
+    def enregistrer(self, annonces) -> int:
+        """Insère ou met à jour les annonces ; la date de première apparition est conservée,
+        sauf pour une annonce retirée qui réapparaît (elle compte comme nouvelle)"""
+        lignes = [self._ligne(a) for a in annonces if a.cle]
+        with self._verrou, self._connexion:
+            self._upsert(lignes)
+        return len(lignes)
+
+    def _upsert(self, lignes):
+        self._connexion.executemany("""
+                INSERT INTO annonces (portail, cle, url, titre, prix, surface, commune, commune_norm,
+                                      code_postal, zone, premiere_vue, derniere_vue,
+                                      description, photos, empreinte)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (portail, cle) DO UPDATE SET
+                    url = excluded.url,
+                    titre = excluded.titre,
+                    prix = COALESCE(excluded.prix, annonces.prix),
+                    surface = COALESCE(excluded.surface, annonces.surface),
+                    commune = CASE WHEN excluded.commune != '' THEN excluded.commune ELSE annonces.commune END,
+                    commune_norm = CASE WHEN excluded.commune_norm != '' THEN excluded.commune_norm ELSE annonces.commune_norm END,
+                    code_postal = CASE WHEN excluded.code_postal != '' THEN excluded.code_postal ELSE annonces.code_postal END,
+                    zone = CASE WHEN excluded.zone != '' THEN excluded.zone ELSE annonces.zone END,
+                    premiere_vue = CASE WHEN annonces.retiree IS NOT NULL
+                                        THEN excluded.premiere_vue ELSE annonces.premiere_vue END,
+                    derniere_vue = MAX(excluded.derniere_vue, annonces.derniere_vue),
+                    description = CASE WHEN excluded.description != '' THEN excluded.description ELSE annonces.description END,
+                    photos = CASE WHEN excluded.photos != '' THEN excluded.photos ELSE annonces.photos END,
+                    empreinte = excluded.empreinte,
+                    retiree = NULL
+            """, lignes)
+
+    def appliquer_veille(self, annonces, portails_complets, debut_veille: datetime) -> DeltaVeille:
+        """Enregistre le résultat d'une veille et retourne le delta avec la précédente
+
+        Raccourci de appliquer_lots puis marquer_retirees pour une veille en un seul flux.
+        """
+        delta = DeltaVeille()
+        self.appliquer_lots(annonces, delta)
+        self.marquer_retirees(portails_complets, debut_veille, delta)
+        return delta
+
+    def appliquer_lots(self, annonces, delta: DeltaVeille, taille_lot=TAILLE_LOT_VEILLE) -> int:
+        """Enregistre un flux d'annonces par lots de `taille_lot` et complète `delta`
+
+        Le flux n'est jamais chargé en entier : seules les annonces nouvelles ou modifiées
+        sont gardées, dans le delta. Plusieurs flux (un par run) peuvent compléter le même
+        delta en parallèle. Retourne le nombre d'annonces reçues.
+        """
+        annonces = iter(annonces)
+        recues = 0
+        while True:
+            lot = list(itertools.islice(annonces, taille_lot))
+            if not lot:
+                return recues
+            recues += len(lot)
+            self._appliquer_lot(lot, delta)
+
+    def _appliquer_lot(self, annonces, delta):
+        """Compare un lot aux annonces connues (jointure sur l'index unique), puis l'enregistre"""
+        annonces = {(a.portail, a.cle): a for a in annonces if a.cle}
+        lignes = [self._ligne(a) for a in annonces.values()]
+
+        with self._verrou, self._connexion:
+            connexion = self._connexion
+            connexion.execute("CREATE TEMP TABLE IF NOT EXISTS lot (portail TEXT, cle TEXT, empreinte TEXT)")
+            connexion.execute("DELETE FROM lot")
+            connexion.executemany("INSERT INTO lot VALUES (?, ?, ?)",
+                                  [(l[0], l[1], l[-1]) for l in lignes])
+            connues = {
+                (portail, cle): (ancienne, prix, retiree)
+                for portail, cle, ancienne, prix, retiree in connexion.execute("""
+                    SELECT a.portail, a.cle, a.empreinte, a.prix, a.retiree
+                    FROM lot JOIN annonces a ON a.portail = lot.portail AND a.cle = lot.cle
+                """)
+            }
+            for cle, annonce in annonces.items():
+                if cle not in connues or connues[cle][2] is not None:
+                    delta.nouvelles.append(annonce)
+                elif connues[cle][0] != empreinte(annonce):
+                    delta.modifiees.append((annonce, connues[cle][1]))
+            delta.suivies += len(lignes)
+
+            self._upsert(lignes)
+
+    def marquer_retirees(self, portails_complets, debut_veille: datetime, delta: DeltaVeille):
+        """Fin de veille : les annonces actives des portails entièrement parcourus et non
+        revues depuis `debut_veille` sont marquées retirées et ajoutées au delta"""
+        if not portails_complets:
+            return
+        marqueurs = ", ".join("?" * len(portails_complets))
+        parametres = [*portails_complets, _horodatage(debut_veille)]
+        with self._verrou, self._connexion:
+            retirees = self._connexion.execute(f"""
+                SELECT {', '.join(self.COLONNES)} FROM annonces
+                WHERE retiree IS NULL AND portail IN ({marqueurs}) AND derniere_vue < ?
+            """, parametres).fetchall()
+            self._connexion.executemany("UPDATE annonces SET retiree = ? WHERE portail = ? AND cle = ?",
+                                        [(_horodatage(debut_veille), l[0], l[1]) for l in retirees])
+        delta.retirees.extend(self._annonce(ligne) for ligne in retirees)
+
+    def rechercher(self, zone=None, commune=None, code_postal=None, portail=None,
+                   prix_min=None, prix_max=None, depuis=None, actives=False, limite=None,
+                   communes=None, avant=None) -> list:
+        """Annonces filtrées, les plus récemment apparues d'abord
+
+        `communes` : plusieurs communes à la fois ; `avant` : apparues avant cette date.
+        Exemple : nouvelles annonces de la zone du Bugue sous 200 000 € cette semaine
+            stock.rechercher(zone="bugue", prix_max=200000, depuis=timedelta(days=7))
+        """
+        conditions, parametres = [], []
+        if zone:
+            conditions.append("zone = ?")
+            parametres.append(zone)
+        if commune:
+            conditions.append("commune_norm = ?")
+            parametres.append(normaliser_nom(commune))
+        if communes is not None:
+            normalisees = sorted({normaliser_nom(nom) for nom in communes})
+            conditions.append(f"commune_norm IN ({', '.join('?' * len(normalisees)) or 'NULL'})")
+            parametres.extend(normalisees)
+        if code_postal:
+            conditions.append("code_postal = ?")
+            parametres.append(code_postal)
+        if portail:
+            conditions.append("portail = ?")
+            parametres.append(portail)
+        if prix_min is not None:
+            conditions.append("prix >= ?")
+            parametres.append(prix_min)
+        if prix_max is not None:
+            conditions.append("prix <= ?")
+            parametres.append(prix_max)
+        if depuis is not None:
+            if isinstance(depuis, timedelta):
+                depuis = datetime.now(TIMEZONE_FRANCE) - depuis
+            conditions.append("premiere_vue >= ?")
+            parametres.append(_horodatage(depuis))
+        if avant is not None:
+            conditions.append("premiere_vue < ?")
+            parametres.append(_horodatage(avant))
+        if actives:
+            conditions.append("retiree IS NULL")
+
+        requete = f"SELECT {', '.join(self.COLONNES)} FROM annonces"
+        if conditions:
+            requete += " WHERE " + " AND ".join(conditions)
+        requete += " ORDER BY premiere_vue DESC"
+        if limite:
+            requete += " LIMIT ?"
+            parametres.append(limite)
+
+        with self._verrou:
+            lignes = self._connexion.execute(requete, parametres).fetchall()
+        return [self._annonce(ligne) for ligne in lignes]
+
+    def prix_par_jour(self, debut: datetime, fin: datetime) -> list:
+        """(commune_norm, commune, zone, prix, surface, premiere_vue) des annonces apparues entre debut et fin
+
+        Seules les annonces avec prix et surface sont retournées (calcul du prix au m²).
+        """
+        with self._verrou:
+            return self._connexion.execute("""
+                SELECT commune_norm, commune, zone, prix, surface, premiere_vue FROM annonces
+                WHERE premiere_vue >= ? AND premiere_vue < ? AND prix > 0 AND surface > 0
+            """, (_horodatage(debut), _horodatage(fin))).fetchall()
+
+    def _annonce(self, ligne) -> Annonce:
+        valeurs = dict(zip(self.COLONNES, ligne))
+        valeurs["premiere_vue"] = _date(valeurs["premiere_vue"])
+        valeurs["derniere_vue"] = _date(valeurs["derniere_vue"])
+        valeurs["description"] = valeurs["description"] or ""
+        valeurs["photos"] = tuple(url for url in (valeurs["photos"] or "").split("\n") if url)
+        return Annonce(**valeurs)
+
+    def compter(self) -> int:
+        with self._verrou:
+            return self._connexion.execute("SELECT COUNT(*) FROM annonces").fetchone()[0]
+
+    def fermer(self):
+        with self._verrou:
+            self._connexion.close()
@@ -0,0 +1,527 @@
+"""
+Banc d'essai des performances
+Lance des faux services locaux (API Git Data de GitHub, API Apify, serveur SMTP) avec
+latence et erreurs injectables, y branche l'application et mesure le journal, la
+synchronisation GitHub, une veille complète, le rapport, l'envoi d'emails et le
+tableau de bord. Chaque exécution est ajoutée à banc_essai/resultats.jsonl et
+comparée à la précédente.
+
+    python banc_essai.py --iterations 5 --annonces 200 --latence-ms 20 --taux-erreur 0.02
+"""
+
+import argparse
+import base64
+import hashlib
+import http.client
+import importlib
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DOSSIER_DEPOT = os.path.dirname(os.path.abspath(__file__))
+# Dans l'état local (ignoré par git), pas dans l'arborescence suivie du dépôt
+FICHIER_RESULTATS = os.path.join(DOSSIER_DEPOT, os.environ.get("AXI_DOSSIER_ETAT", "etat"), "banc_essai", "resultats.jsonl")
+
+COMMUNES_ESSAI = [("Vergt", "24380"), ("Le Bugue", "24260"), ("Périgueux", "24000"),
+                  ("Bergerac", "24100"), ("Salon", "24380"), ("Savignac-de-Miremont", "24260")]
+
+
+# === FAUX SERVICES ===
+
+class Perturbations:
+    """Latence (avec gigue) et taux d'erreur appliqués à chaque requête d'un faux service"""
+
+    def __init__(self, latence=0.0, taux_erreur=0.0, graine=0):
+        self.latence = latence
+        self.taux_erreur = taux_erreur
+        self._aleatoire = random.Random(graine)
+        self._verrou = threading.Lock()
+
+    def subir(self):
+        """Attend la latence simulée ; True si la requête doit échouer"""
+        with self._verrou:
+            attente = self.latence * (0.5 + self._aleatoire.random())
+            echec = self._aleatoire.random() < self.taux_erreur
+        if attente:
+            time.sleep(attente)
+        return echec
+
+
+class _GestionnaireJson(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Comme les vraies API : pas de délai de Nagle sur les connexions persistantes
+    disable_nagle_algorithm = True
+
+    def _repondre(self, statut, donnees=None, entetes=None, brut=None):
+        corps = brut if brut is not None else (json.dumps(donnees).encode() if donnees is not None else b"")
+        self.send_response(statut)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corps)))
+        for nom, valeur in (entetes or {}).items():
+            self.send_header(nom, valeur)
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def _traiter(self):
+        longueur = int(self.headers.get('Content-Length') or 0)
+        self.donnees = json.loads(self.rfile.read(longueur)) if longueur else None
+        if self.server.perturbations.subir():
+            self._repondre(503, {"message": "erreur injectée"})
+            return
+        self.server.traiter(self)
+
+    do_GET = do_POST = do_PATCH = _traiter
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Serveur(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, perturbations):
+        super().__init__(('127.0.0.1', 0), _GestionnaireJson)
+        self.perturbations = perturbations
+        self.verrou = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FauxGitHub(_Serveur):
+    """Branche unique, commits acceptés seulement en avance rapide (422 sinon)"""
+
+    def __init__(self, perturbations):
+        super().__init__(perturbations)
+        self.tete = hashlib.sha1(b"racine").hexdigest()
+        self.arbres = {self.tete: hashlib.sha1(b"arbre").hexdigest()}
+        self.parents = {}
+        self.commits = 0
+
+    def traiter(self, requete):
+        chemin = urllib.parse.urlsplit(requete.path).path
+        segments = chemin.strip("/").split("/")[3:]  # après repos/<proprietaire>/<depot>
+        with self.verrou:
+            if requete.command == 'GET' and segments[:3] == ["git", "ref", "heads"]:
+                etag = f'"{self.tete}"'
+                if requete.headers.get('If-None-Match') == etag:
+                    requete._repondre(304, entetes={'ETag': etag})
+                else:
+                    requete._repondre(200, {"object": {"sha": self.tete}}, {'ETag': etag})
+            elif requete.command == 'GET' and segments[:2] == ["git", "commits"]:
+                requete._repondre(200, {"sha": segments[2], "tree": {"sha": self.arbres.get(segments[2], "0" * 40)}})
+            elif requete.command == 'POST' and segments == ["git", "blobs"]:
+                contenu = base64.b64decode(requete.donnees["content"])
+                requete._repondre(201, {"sha": hashlib.sha1(b"blob %d\0" % len(contenu) + contenu).hexdigest()})
+            elif requete.command == 'POST' and segments == ["git", "trees"]:
+                requete._repondre(201, {"sha": hashlib.sha1(os.urandom(8)).hexdigest()})
+            elif requete.command == 'POST' and segments == ["git", "commits"]:
+                donnees = requete.donnees
+                sha = hashlib.sha1(os.urandom(8)).hexdigest()
+                self.arbres[sha] = donnees["tree"]
+                self.parents[sha] = donnees["parents"][0]
+                requete._repondre(201, {"sha": sha})
+            elif requete.command == 'PATCH' and segments[:3] == ["git", "refs", "heads"]:
+                sha = requete.donnees["sha"]
+                if self.parents.get(sha) != self.tete:
+                    requete._repondre(422, {"message": "Update is not a fast forward"})
+                else:
+                    self.tete = sha
+                    self.commits += 1
+                    requete._repondre(200, {"object": {"sha": sha}})
+            else:
+                requete._repondre(404, {"message": "Not Found"})
+
+
+class FauxApify(_Serveur):
+    """Runs immédiatement (ou après `duree_run`) réussis ; datasets au format LeBonCoin
+
+    Le stock d'annonces glisse d'un run à l'autre : quelques nouvelles, quelques
+    retraits et des baisses de prix, pour que chaque veille produise un vrai delta.
+    """
+
+    def __init__(self, perturbations, annonces=200, duree_run=0.0):
+        super().__init__(perturbations)
+        self.annonces = annonces
+        self.duree_run = duree_run
+        self.runs = {}
+        self._compteur = itertools.count(1)
+
+    def _elements(self, numero):
+        debut = numero * max(1, self.annonces // 20)
+        for identifiant in range(debut, debut + self.annonces):
+            commune, code_postal = COMMUNES_ESSAI[identifiant % len(COMMUNES_ESSAI)]
+            surface = 60 + identifiant % 140
+            prix = 1000 * (80 + (identifiant * 37) % 300)
+            if (identifiant + numero) % 11 == 0:
+                prix -= 5000
+            yield {
+                "list_id": identifiant,
+                "subject": f"Maison {surface} m² {commune} n°{identifiant}",
+                "body": f"Maison de {surface} m² à {commune}, {identifiant % 5 + 2} chambres, "
+                        f"terrain de {identifiant % 40 * 100} m², réf. {identifiant}",
+                "price": [prix],
+                "url": f"https://www.leboncoin.fr/ad/ventes_immobilieres/{identifiant}",
+                "location": {"city": commune, "zipcode": code_postal},
+                "attributes": [{"key": "square", "value": str(surface)}],
+            }
+
+    def traiter(self, requete):
+        morceaux = urllib.parse.urlsplit(requete.path)
+        chemin = morceaux.path.split("/v2", 1)[-1]
+        parametres = urllib.parse.parse_qs(morceaux.query)
+        if requete.command == 'POST' and chemin.startswith("/acts/") and chemin.endswith("/runs"):
+            with self.verrou:
+                numero = next(self._compteur)
+            run_id = f"run{numero:06d}"
+            self.runs[run_id] = (numero, time.monotonic())
+            requete._repondre(201, {"data": {"id": run_id, "status": "RUNNING"}})
+            return
+        segments = chemin.strip("/").split("/")
+        if len(segments) < 2 or segments[0] != "actor-runs" or segments[1] not in self.runs:
+            requete._repondre(404, {"error": {"message": "run inconnu"}})
+            return
+        numero, lance_le = self.runs[segments[1]]
+        if len(segments) == 2:
+            termine = time.monotonic() - lance_le >= self.duree_run
+            requete._repondre(200, {"data": {"id": segments[1], "status": "SUCCEEDED" if termine else "RUNNING",
+                                             "finishedAt": datetime.now().isoformat() if termine else None}})
+        elif segments[2:] == ["dataset", "items"]:
+            offset = int(parametres.get("offset", ["0"])[0])
+            limite = int(parametres.get("limit", ["1000"])[0])
+            elements = itertools.islice(self._elements(numero), offset, offset + limite)
+            corps = "".join(json.dumps(element, ensure_ascii=False) + "\n" for element in elements).encode()
+            requete._repondre(200, brut=corps)
+        else:
+            requete._repondre(404, {"error": {"message": "chemin inconnu"}})
+
+
+class PuitsSMTP(socketserver.ThreadingTCPServer):
+    """Serveur SMTP qui accepte (et jette) les messages ; AUTH PLAIN/LOGIN toujours acceptée"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, perturbations):
+        super().__init__(('127.0.0.1', 0), _SessionSMTP)
+        self.perturbations = perturbations
+        self.messages = 0
+        self.sessions = 0
+        self.verrou = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class _SessionSMTP(socketserver.StreamRequestHandler):
+    def _ecrire(self, ligne):
+        self.wfile.write(f"{ligne}\r\n".encode())
+
+    def handle(self):
+        with self.server.verrou:
+            self.server.sessions += 1
+        self._ecrire("220 puits-smtp")
+        while True:
+            ligne = self.rfile.readline().decode(errors="replace").strip()
+            if not ligne:
+                return
+            commande = ligne.split(" ", 1)[0].upper()
+            if commande in ("EHLO", "HELO"):
+                self._ecrire("250-puits-smtp")
+                self._ecrire("250 AUTH PLAIN LOGIN")
+            elif commande == "AUTH":
+                self._ecrire("235 ok")
+            elif commande == "DATA":
+                self._ecrire("354 fin par <CRLF>.<CRLF>")
+                while self.rfile.readline().rstrip(b"\r\n") != b".":
+                    pass
+                if self.server.perturbations.subir():
+                    self._ecrire("451 erreur injectée")
+                else:
+                    with self.server.verrou:
+                        self.server.messages += 1
+                    self._ecrire("250 ok")
+            elif commande == "QUIT":
+                self._ecrire("221 au revoir")
+                return
+            else:
+                self._ecrire("250 ok")
+
+
+# === MESURES ===
+
+def resumer(durees, total=None):
+    """Effectif, débit et quantiles (ms) d'une série de durées en secondes"""
+    durees = sorted(durees)
+    n = len(durees)
+    if not n:
+        return {"n": 0}
+    total = total if total is not None else sum(durees)
+
+    def quantile(q):
+        return round(durees[min(n - 1, int(q * n))] * 1000, 3)
+
+    return {
+        "n": n,
+        "total_s": round(total, 3),
+        "debit_par_s": round(n / total, 1) if total else None,
+        "p50_ms": quantile(0.50),
+        "p95_ms": quantile(0.95),
+        "p99_ms": quantile(0.99),
+        "max_ms": round(durees[-1] * 1000, 3),
+    }
+
+
+def mesurer_journal(application, nb_lignes, nb_threads=4):
+    """Coût d'un log_activite dans le thread appelant, puis débit jusqu'à l'écriture sur disque"""
+    durees = []
+    verrou = threading.Lock()
+
+    def ecrire(numero):
+        locales = []
+        for i in range(nb_lignes // nb_threads):
+            depart = time.perf_counter()
+            application.log_activite(f"banc d'essai {numero}/{i}", niveau="debug")
+            locales.append(time.perf_counter() - depart)
+        with verrou:
+            durees.extend(locales)
+
+    niveau = application.journal.niveau_min
+    application.journal.niveau_min = "debug"
+    depart = time.perf_counter()
+    threads = [threading.Thread(target=ecrire, args=(numero,)) for numero in range(nb_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    application.journal.vider(60)
+    total = time.perf_counter() - depart
+    application.journal.niveau_min = niveau
+    appel = resumer(durees)
+    return {"appel": appel, "ecriture": {"n": len(durees), "total_s": round(total, 3),
+                                         "debit_par_s": round(len(durees) / total, 1)}}
+
+
+def mesurer_synchro(application, faux_github, iterations):
+    """Modification des fichiers sauvegardés puis commit groupé, jusqu'à la mise à jour de la branche"""
+    durees = []
+    commits = faux_github.commits
+    for i in range(iterations):
+        for nom in application.FICHIERS_A_SAUVEGARDER:
+            application.ajouter_fichier(nom, f"banc d'essai {i}\n")
+        depart = time.perf_counter()
+        application.synchro_github.vider(60)
+        durees.append(time.perf_counter() - depart)
+    resultat = resumer(durees)
+    resultat["commits"] = faux_github.commits - commits
+    return resultat
+
+
+def mesurer_appels(fonction, iterations):
+    durees = []
+    for _ in range(iterations):
+        depart = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - depart)
+    return resumer(durees)
+
+
+def mesurer_emails(application, puits, iterations):
+    """Dépôt de messages dans la boîte d'envoi puis envoi effectif au serveur SMTP"""
+    messages = puits.messages
+    depart = time.perf_counter()
+    depots = mesurer_appels(
+        lambda: application.envoyer_email(["banc@exemple.fr"], "Banc d'essai", "<p>essai</p>"), iterations)
+    application.boite_envoi.vider(120)
+    total = time.perf_counter() - depart
+    return {"depot": depots, "envoi": {"n": puits.messages - messages, "total_s": round(total, 3),
+                                       "sessions_smtp": puits.sessions}}
+
+
+def mesurer_tableau_de_bord(application, nb_clients, nb_requetes, chemin='/'):
+    """Clients HTTP/1.1 simultanés (connexions persistantes, gzip) sur le tableau de bord"""
+    serveur = application.ServeurAxi(('127.0.0.1', 0), application.AxiAgencesHandler)
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    durees = []
+    verrou = threading.Lock()
+
+    def client():
+        connexion = http.client.HTTPConnection('127.0.0.1', serveur.server_address[1], timeout=30)
+        locales = []
+        for _ in range(nb_requetes // nb_clients):
+            depart = time.perf_counter()
+            connexion.request('GET', chemin, headers={'Accept-Encoding': 'gzip'})
+            reponse = connexion.getresponse()
+            reponse.read()
+            locales.append(time.perf_counter() - depart)
+        connexion.close()
+        with verrou:
+            durees.extend(locales)
+
+    depart = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(nb_clients)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    total = time.perf_counter() - depart
+    serveur.shutdown()
+    serveur.server_close()
+    return resumer(durees, total)
+
+
+# === RÉSULTATS ===
+
+def version_depot():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=DOSSIER_DEPOT,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or "inconnue"
+    except (OSError, subprocess.SubprocessError):
+        return "inconnue"
+
+
+def _indicateurs(mesures, prefixe=""):
+    """Aplatit les mesures en {"veille.p50_ms": ..., ...}"""
+    for nom, valeur in mesures.items():
+        if isinstance(valeur, dict):
+            yield from _indicateurs(valeur, f"{prefixe}{nom}.")
+        elif nom in ("p50_ms", "p95_ms", "debit_par_s"):
+            yield f"{prefixe}{nom}", valeur
+
+
+def comparer(precedent, courant):
+    """Variation des principaux indicateurs par rapport à l'exécution précédente"""
+    anciens = dict(_indicateurs(precedent["mesures"]))
+    lignes = [f"Comparaison avec {precedent['version']} ({precedent['date']}) :"]
+    for nom, valeur in _indicateurs(courant["mesures"]):
+        ancien = anciens.get(nom)
+        if not ancien or valeur is None:
+            continue
+        variation = (valeur / ancien - 1) * 100
+        # Un débit qui baisse ou une latence qui monte de plus de 10 % est signalé
+        regression = variation < -10 if nom.endswith("debit_par_s") else variation > 10
+        lignes.append(f"  {'⚠️ ' if regression else '   '}{nom:40} {ancien:>12} → {valeur:>12} ({variation:+.0f}%)")
+    return "\n".join(lignes)
+
+
+def enregistrer(resultat, fichier):
+    precedent = None
+    try:
+        with open(fichier, 'r', encoding='utf-8') as f:
+            for ligne in f:
+                if ligne.strip():
+                    precedent = json.loads(ligne)
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(fichier), exist_ok=True)
+    with open(fichier, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(resultat, ensure_ascii=False) + "\n")
+    return precedent
+
+
+# === LANCEMENT ===
+
+def preparer_environnement(dossier, github, apify, puits):
+    """Variables lues par main.py et ses modules à l'import : tout pointe vers les faux services"""
+    os.environ.update({
+        "AXI_DOSSIER_ETAT": os.path.join(dossier, "etat"),
+        "GITHUB_TOKEN": "jeton-banc-essai",
+        "GITHUB_API_URL": github.url,
+        "SYNCHRO_GITHUB_DELAI": "3600",  # le banc déclenche lui-même les commits (vider)
+        "APIFY_TOKEN": "jeton-banc-essai",
+        "APIFY_API_URL": f"{apify.url}/v2",
+        "APIFY_CACHE_TTL": "0",
+        "GMAIL_USER": "banc@exemple.fr",
+        "GMAIL_APP_PASSWORD": "banc-essai",
+        "SMTP_HOTE": "127.0.0.1",
+        "SMTP_PORT": str(puits.port),
+    })
+    for nom in ("DESTINATAIRES_VERGT", "DESTINATAIRES_BUGUE"):
+        os.environ.pop(nom, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5, help="veilles, commits et rapports mesurés")
+    parser.add_argument("--annonces", type=int, default=200, help="annonces par run Apify")
+    parser.add_argument("--lignes-journal", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8, help="clients HTTP simultanés")
+    parser.add_argument("--requetes", type=int, default=800, help="requêtes HTTP par page mesurée")
+    parser.add_argument("--latence-ms", type=float, default=20, help="latence moyenne des faux services")
+    parser.add_argument("--taux-erreur", type=float, default=0.0, help="proportion de requêtes en erreur")
+    parser.add_argument("--graine", type=int, default=1)
+    parser.add_argument("--sortie", default=FICHIER_RESULTATS)
+    parser.add_argument("--garder", action="store_true", help="conserver le dossier de travail")
+    args = parser.parse_args()
+
+    perturbations = {nom: Perturbations(args.latence_ms / 1000, args.taux_erreur, args.graine + i)
+                     for i, nom in enumerate(("github", "apify", "smtp"))}
+    github = FauxGitHub(perturbations["github"])
+    apify = FauxApify(perturbations["apify"], annonces=args.annonces)
+    puits = PuitsSMTP(perturbations["smtp"])
+
+    dossier = tempfile.mkdtemp(prefix="axi-banc-")
+    preparer_environnement(dossier, github, apify, puits)
+    repertoire_initial = os.getcwd()
+    os.chdir(dossier)
+    sys.path.insert(0, DOSSIER_DEPOT)
+    try:
+        application = importlib.import_module("main")
+        application.journal.echo = None
+        for nom in application.FICHIERS_A_SAUVEGARDER:
+            application.ecrire_fichier(nom, f"# {nom}\n")
+        application.synchro_github.vider(60)
+
+        mesures = {}
+        print("📝 Journal...")
+        mesures["journal"] = mesurer_journal(application, args.lignes_journal)
+        print("🔄 Synchro GitHub...")
+        mesures["synchro"] = mesurer_synchro(application, github, args.iterations)
+        print("🔍 Veille complète...")
+        mesures["veille"] = mesurer_appels(application.tache_veille, args.iterations)
+        mesures["veille"]["annonces_suivies"] = application.stock_annonces.compter()
+        print("📧 Rapport et emails...")
+        mesures["rapport"] = mesurer_appels(application.generer_rapport_quotidien, args.iterations)
+        mesures["emails"] = mesurer_emails(application, puits, args.iterations * 4)
+        print("🌐 Tableau de bord...")
+        mesures["tableau_de_bord"] = mesurer_tableau_de_bord(application, args.clients, args.requetes)
+        mesures["status"] = mesurer_tableau_de_bord(application, args.clients, args.requetes, '/status')
+        application.journal.vider(60)
+    finally:
+        os.chdir(repertoire_initial)
+        if not args.garder:
+            shutil.rmtree(dossier, ignore_errors=True)
+
+    resultat = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "version": version_depot(),
+        "python": platform.python_version(),
+        "parametres": {cle: valeur for cle, valeur in vars(args).items() if cle not in ("sortie", "garder")},
+        "mesures": mesures,
+    }
+    print(json.dumps(mesures, indent=2, ensure_ascii=False))
+    precedent = enregistrer(resultat, args.sortie)
+    if precedent:
+        print(comparer(precedent, resultat))
+    print(f"Résultats ajoutés à {args.sortie}")
+
+
+if __name__ == "__main__":
+    main()
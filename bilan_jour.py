@@ -0,0 +1,134 @@
+"""
+Bilan de la journée
+Agrégats tenus à jour au fil des événements (tâches, erreurs, veilles, opportunités,
+notation, journal) : le rapport du soir et /report/today les lisent sans relire les fichiers.
+"""
+
+import copy
+import json
+import os
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+DOSSIER_BILANS = os.path.join(DOSSIER_ETAT, "bilans")
+
+
+def _bilan_vide(date):
+    return {
+        "date": date,
+        "taches": {},
+        "erreurs": [],
+        "veilles": [],
+        "opportunites": {},
+        "notation": [],
+        "journal": [],
+    }
+
+
+class BilanJournalier:
+    """Agrégats du jour en cours (heure de Paris), enregistrés dans etat/bilans/<date>.json"""
+
+    def __init__(self, dossier=DOSSIER_BILANS, horloge=None):
+        self.dossier = dossier
+        self.horloge = horloge or (lambda: datetime.now(TIMEZONE_FRANCE))
+        self._verrou = threading.Lock()
+        self._bilan = None
+        self._modifie = False
+
+    def _jour(self):
+        """Bilan du jour courant ; au changement de jour, la veille est enregistrée et on repart de zéro"""
+        date = self.horloge().strftime("%Y-%m-%d")
+        if self._bilan is None or self._bilan["date"] != date:
+            if self._bilan is not None and self._modifie:
+                self._ecrire()
+            self._bilan = self._charger(date)
+            self._modifie = False
+        return self._bilan
+
+    # --- Événements ---
+
+    def noter_journal(self, heure, message, niveau="info"):
+        """Ligne du journal d'activité ; les messages d'erreur alimentent aussi les erreurs du jour"""
+        with self._verrou:
+            bilan = self._jour()
+            entree = {"heure": heure.strftime("%H:%M:%S"), "message": message}
+            bilan["journal"].append(entree)
+            if niveau == "erreur":
+                bilan["erreurs"].append(entree)
+            self._modifie = True
+
+    def noter_tache(self, nom, duree_s, erreur=None):
+        """Fin d'une tâche (planifiée ou lancée depuis le tableau de bord)"""
+        with self._verrou:
+            tache = self._jour()["taches"].setdefault(
+                nom, {"executions": 0, "erreurs": 0, "duree_totale_s": 0.0, "duree_max_s": 0.0})
+            tache["executions"] += 1
+            tache["erreurs"] += 1 if erreur else 0
+            tache["duree_totale_s"] = round(tache["duree_totale_s"] + duree_s, 3)
+            tache["duree_max_s"] = round(max(tache["duree_max_s"], duree_s), 3)
+            self._ecrire()
+
+    def noter_veille(self, duree_s, nouvelles, modifiees, retirees, suivies, opportunites=None):
+        """Résultat d'une veille ; `opportunites` : {zone: [lignes]}"""
+        with self._verrou:
+            bilan = self._jour()
+            bilan["veilles"].append({
+                "heure": self.horloge().strftime("%H:%M"),
+                "duree_s": round(duree_s, 1),
+                "nouvelles": nouvelles,
+                "modifiees": modifiees,
+                "retirees": retirees,
+                "suivies": suivies,
+            })
+            for zone, lignes in (opportunites or {}).items():
+                bilan["opportunites"].setdefault(zone, []).extend(lignes)
+            self._ecrire()
+
+    def noter_notation(self, notes):
+        """Biens notés du jour (dictionnaires, meilleur score d'abord) ; remplace la notation précédente"""
+        with self._verrou:
+            self._jour()["notation"] = list(notes)
+            self._ecrire()
+
+    # --- Lecture ---
+
+    def aujourdhui(self) -> dict:
+        """Copie du bilan du jour, avec les durées moyennes des tâches"""
+        with self._verrou:
+            bilan = copy.deepcopy(self._jour())
+        for tache in bilan["taches"].values():
+            tache["duree_moyenne_s"] = round(tache["duree_totale_s"] / tache["executions"], 3)
+        return bilan
+
+    def sauver(self):
+        with self._verrou:
+            if self._bilan is not None and self._modifie:
+                self._ecrire()
+
+    # --- Stockage ---
+
+    def _chemin(self, date):
+        return os.path.join(self.dossier, f"{date}.json")
+
+    def _charger(self, date):
+        try:
+            with open(self._chemin(date), 'r', encoding='utf-8') as f:
+                bilan = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return _bilan_vide(date)
+        for cle, valeur in _bilan_vide(date).items():
+            bilan.setdefault(cle, valeur)
+        return bilan
+
+    def _ecrire(self):
+        os.makedirs(self.dossier, exist_ok=True)
+        chemin = self._chemin(self._bilan["date"])
+        temporaire = chemin + ".tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(self._bilan, f, ensure_ascii=False)
+        os.replace(temporaire, chemin)
+        self._modifie = False
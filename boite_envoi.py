@@ -0,0 +1,301 @@
+"""
+Boîte d'envoi des emails
+Les messages sont déposés sur disque puis envoyés par un thread qui garde sa connexion
+SMTP authentifiée entre deux messages ; un échec est retenté plus tard, sans perte
+du message, et le résultat de chaque envoi est conservé.
+"""
+
+import json
+import os
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from zoneinfo import ZoneInfo
+
+from metriques import metriques
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+DOSSIER_BOITE_ENVOI = os.path.join(DOSSIER_ETAT, "boite_envoi")
+
+EN_ATTENTE = "en_attente"
+ENVOYE = "envoye"
+ECHEC = "echec"
+
+# Délais entre tentatives : 30 s, 1 min, 2 min... plafonnés à 1 h, abandon après 10 essais
+PAUSE_INITIALE = 30
+PAUSE_MAX = 3600
+TENTATIVES_MAX = 10
+# Connexion SMTP fermée après ce délai sans message à envoyer
+INACTIVITE_MAX = 60
+# Messages envoyés ou abandonnés conservés pour consultation
+HISTORIQUE = 200
+
+
+class BoiteEnvoi:
+    """File persistante des emails, vidée par un thread d'envoi"""
+
+    def __init__(self, utilisateur, mot_de_passe, hote="smtp.gmail.com", port=465,
+                 expediteur="Axi Agences", dossier=DOSSIER_BOITE_ENVOI, journaliser=print,
+                 pause_initiale=PAUSE_INITIALE, tentatives_max=TENTATIVES_MAX):
+        self.utilisateur = utilisateur
+        self.mot_de_passe = mot_de_passe
+        self.hote = hote
+        self.port = port
+        self.expediteur = expediteur
+        self.dossier = dossier
+        self.journaliser = journaliser
+        self.pause_initiale = pause_initiale
+        self.tentatives_max = tentatives_max
+
+        self._condition = threading.Condition()
+        self._messages = {}
+        self._thread = None
+        self._smtp = None
+        self._derniere_activite = 0
+        for message in self._charger():
+            self._messages[message["id"]] = message
+
+    # --- API publique ---
+
+    def deposer(self, destinataires, sujet, contenu_html, individuel=False):
+        """Ajoute un message à la boîte d'envoi et retourne son identifiant, sans attendre l'envoi
+
+        Avec `individuel`, chaque destinataire reçoit son propre exemplaire (il ne voit
+        pas les autres adresses) ; tous partent dans la même session SMTP.
+        """
+        destinataires = list(dict.fromkeys(d for d in destinataires if d))
+        if not destinataires:
+            raise ValueError("Aucun destinataire")
+        message = {
+            "id": uuid.uuid4().hex[:12],
+            "destinataires": destinataires,
+            "sujet": sujet,
+            "html": contenu_html,
+            "individuel": individuel,
+            "statut": EN_ATTENTE,
+            "cree_le": datetime.now(TIMEZONE_FRANCE).isoformat(),
+            "tentatives": 0,
+            "prochaine_tentative": 0,
+            "livraisons": {destinataire: None for destinataire in destinataires},
+            "erreur": None,
+            "envoye_le": None,
+        }
+        self._ecrire(message)
+        with self._condition:
+            self._messages[message["id"]] = message
+            self._demarrer()
+            self._condition.notify_all()
+        return message["id"]
+
+    def obtenir(self, identifiant):
+        with self._condition:
+            message = self._messages.get(identifiant)
+            return self._resume(message) if message else None
+
+    def lister(self):
+        with self._condition:
+            messages = sorted(self._messages.values(), key=lambda m: m["cree_le"], reverse=True)
+            return [self._resume(message) for message in messages]
+
+    def en_attente(self):
+        with self._condition:
+            return sum(1 for message in self._messages.values() if message["statut"] == EN_ATTENTE)
+
+    def demarrer(self):
+        """Lance le thread d'envoi (les messages restés en attente au redémarrage repartent)"""
+        with self._condition:
+            self._demarrer()
+
+    def vider(self, timeout=30):
+        """Attend l'envoi des messages dus (arrêt du service) ; False si le délai est dépassé"""
+        fin = time.monotonic() + timeout
+        with self._condition:
+            # Une tentative immédiate pour chaque message en attente
+            tentatives = {}
+            for message in self._messages.values():
+                if message["statut"] == EN_ATTENTE:
+                    message["prochaine_tentative"] = 0
+                    tentatives[message["id"]] = message["tentatives"]
+            self._demarrer()
+            self._condition.notify_all()
+            while any(self._messages[i]["statut"] == EN_ATTENTE and self._messages[i]["tentatives"] == n
+                      for i, n in tentatives.items() if i in self._messages):
+                reste = fin - time.monotonic()
+                if reste <= 0:
+                    return False
+                self._condition.wait(reste)
+            return True
+
+    @staticmethod
+    def _resume(message):
+        return {cle: valeur for cle, valeur in message.items() if cle != "html"}
+
+    # --- Thread d'envoi ---
+
+    def _demarrer(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._boucle, name="boite-envoi", daemon=True)
+            self._thread.start()
+
+    def _prochain(self):
+        """Attend le prochain message dû ; ferme la connexion SMTP pendant les longues attentes"""
+        with self._condition:
+            while True:
+                maintenant = time.time()
+                dus = [m for m in self._messages.values()
+                       if m["statut"] == EN_ATTENTE and m["prochaine_tentative"] <= maintenant]
+                if dus:
+                    return min(dus, key=lambda m: m["cree_le"])
+                futurs = [m["prochaine_tentative"] for m in self._messages.values() if m["statut"] == EN_ATTENTE]
+                attente = min(futurs) - maintenant if futurs else None
+                if self._smtp is not None:
+                    fermeture = self._derniere_activite + INACTIVITE_MAX - time.monotonic()
+                    if fermeture <= 0:
+                        self._fermer()
+                    else:
+                        attente = fermeture if attente is None else min(attente, fermeture)
+                self._condition.wait(attente)
+
+    def _boucle(self):
+        while True:
+            message = self._prochain()
+            self._envoyer(message)
+            with self._condition:
+                self._condition.notify_all()
+
+    def _connexion(self):
+        """Connexion SMTP authentifiée, réutilisée tant qu'elle répond"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._fermer()
+        if self.port == 465:
+            smtp = smtplib.SMTP_SSL(self.hote, self.port, timeout=30)
+        else:
+            smtp = smtplib.SMTP(self.hote, self.port, timeout=30)
+            smtp.ehlo()
+            if smtp.has_extn("starttls"):
+                smtp.starttls()
+                smtp.ehlo()
+        if self.mot_de_passe:
+            smtp.login(self.utilisateur, self.mot_de_passe)
+        self._smtp = smtp
+        return smtp
+
+    def _fermer(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def _mime(self, message, destinataires):
+        mime = MIMEMultipart('alternative')
+        mime['Subject'] = message["sujet"]
+        mime['From'] = f"{self.expediteur} <{self.utilisateur}>"
+        mime['To'] = ", ".join(destinataires)
+        mime.attach(MIMEText(message["html"], 'html'))
+        return mime.as_string()
+
+    def _envoyer(self, message):
+        restants = [d for d, statut in message["livraisons"].items() if statut != ENVOYE]
+        lots = [[d] for d in restants] if message["individuel"] else [restants]
+        erreur = None
+        depart = time.perf_counter()
+        try:
+            smtp = self._connexion()
+            for lot in lots:
+                try:
+                    refuses = smtp.sendmail(self.utilisateur, lot, self._mime(message, lot))
+                except smtplib.SMTPRecipientsRefused as e:
+                    refuses = e.recipients
+                for destinataire in lot:
+                    if destinataire in refuses:
+                        # Adresse refusée par le serveur : inutile de réessayer
+                        code, texte = refuses[destinataire]
+                        message["livraisons"][destinataire] = f"refusé : {code} {texte.decode(errors='replace')}"
+                    else:
+                        message["livraisons"][destinataire] = ENVOYE
+        except Exception as e:
+            erreur = str(e) or type(e).__name__
+            self._fermer()
+        metriques.observer("smtp_envoi", time.perf_counter() - depart, erreur)
+        self._derniere_activite = time.monotonic()
+
+        message["tentatives"] += 1
+        envoyes = [d for d, statut in message["livraisons"].items() if statut == ENVOYE]
+        refuses = [d for d in message["livraisons"] if d not in envoyes]
+        if erreur is None and not envoyes:
+            # Tous les destinataires refusés par le serveur : rien n'est parti
+            message["statut"] = ECHEC
+            message["erreur"] = "; ".join(f"{d} {message['livraisons'][d]}" for d in refuses)
+            self.journaliser(f"Erreur email: tous les destinataires refusés ({message['erreur']})")
+        elif erreur is None:
+            message["statut"] = ENVOYE
+            message["envoye_le"] = datetime.now(TIMEZONE_FRANCE).isoformat()
+            message["erreur"] = None
+            self.journaliser(f"Email envoyé à {envoyes}")
+            if refuses:
+                self.journaliser(f"Email refusé pour {refuses}")
+        elif message["tentatives"] >= self.tentatives_max:
+            message["statut"] = ECHEC
+            message["erreur"] = erreur
+            self.journaliser(f"Erreur email: abandon après {message['tentatives']} tentatives ({erreur})")
+        else:
+            pause = min(self.pause_initiale * 2 ** (message["tentatives"] - 1), PAUSE_MAX)
+            message["prochaine_tentative"] = time.time() + pause
+            message["erreur"] = erreur
+            self.journaliser(f"Erreur email: {erreur} - nouvel essai dans {pause:.0f} s")
+        with self._condition:
+            self._ecrire(message)
+            self._purger()
+
+    # --- Stockage ---
+
+    def _chemin(self, identifiant):
+        return os.path.join(self.dossier, f"{identifiant}.json")
+
+    def _ecrire(self, message):
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = self._chemin(message["id"]) + ".tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(message, f, ensure_ascii=False)
+        os.replace(temporaire, self._chemin(message["id"]))
+
+    def _charger(self):
+        try:
+            noms = os.listdir(self.dossier)
+        except FileNotFoundError:
+            return []
+        messages = []
+        for nom in noms:
+            if not nom.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.dossier, nom), 'r', encoding='utf-8') as f:
+                    messages.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return messages
+
+    def _purger(self):
+        """Ne garde que les HISTORIQUE derniers messages terminés"""
+        termines = sorted((m for m in self._messages.values() if m["statut"] != EN_ATTENTE),
+                          key=lambda m: m["cree_le"])
+        for message in termines[:max(0, len(termines) - HISTORIQUE)]:
+            del self._messages[message["id"]]
+            try:
+                os.remove(self._chemin(message["id"]))
+            except FileNotFoundError:
+                pass
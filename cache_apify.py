@@ -0,0 +1,220 @@
+"""
+Cache local des runs Apify
+Un run identique (même actor, même input) lancé il y a moins de APIFY_CACHE_TTL secondes
+est réutilisé au lieu d'en payer un nouveau ; les datasets des runs réussis sont gardés
+sur disque, dans une limite de taille (les moins récemment lus sont supprimés). Le statut
+final d'un run est gardé à part, indépendamment de la fenêtre de réutilisation.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+DOSSIER_CACHE_APIFY = os.path.join(DOSSIER_ETAT, "apify")
+
+APIFY_CACHE_TTL = float(os.environ.get("APIFY_CACHE_TTL", "900"))
+APIFY_CACHE_TAILLE_MAX = int(float(os.environ.get("APIFY_CACHE_TAILLE_MAX_MO", "200")) * 1024 * 1024)
+
+STATUT_REUSSI = "SUCCEEDED"
+# Statuts finaux mémorisés (les plus récents) : un run plus long que le TTL garde le sien
+STATUTS_MAX = 1000
+
+
+def cle_run(actor_id: str, input_data: dict) -> str:
+    """Empreinte d'un run : actor et input normalisé (ordre des clés indifférent)"""
+    normalise = json.dumps(input_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{actor_id}\n{normalise}".encode()).hexdigest()[:32]
+
+
+class CacheApify:
+    """Runs récents par empreinte d'input et datasets sur disque (LRU borné en taille)"""
+
+    def __init__(self, dossier=DOSSIER_CACHE_APIFY, ttl=APIFY_CACHE_TTL,
+                 taille_max=APIFY_CACHE_TAILLE_MAX, horloge=time.time):
+        self.dossier = dossier
+        self.ttl = ttl
+        self.taille_max = taille_max
+        self.horloge = horloge
+        self.fichier_index = os.path.join(dossier, "runs.json")
+        self.dossier_datasets = os.path.join(dossier, "datasets")
+
+        self._verrou = threading.Lock()
+        # Un verrou par empreinte de run ou par dataset : les appels identiques simultanés
+        # attendent le premier au lieu de relancer l'actor ou le téléchargement. Retiré
+        # dès que plus personne ne l'utilise
+        self._verrous = {}  # clé -> [verrou, utilisateurs]
+        # Runs réutilisables (empreinte -> run, élagués au-delà du TTL) et statuts
+        # finaux (run_id -> statut), qui survivent à la fenêtre de réutilisation
+        self._runs, self._statuts = self._charger_index()
+
+    @property
+    def actif(self):
+        return self.ttl > 0
+
+    @contextlib.contextmanager
+    def _verrou_de(self, cle):
+        with self._verrou:
+            entree = self._verrous.setdefault(cle, [threading.Lock(), 0])
+            entree[1] += 1
+        try:
+            with entree[0]:
+                yield
+        finally:
+            with self._verrou:
+                entree[1] -= 1
+                if not entree[1]:
+                    del self._verrous[cle]
+
+    # --- Runs ---
+
+    def lancer(self, actor_id, input_data, lancer):
+        """Retourne le run récent de même empreinte, sinon lancer(actor_id, input_data)
+
+        Un run encore en cours est partagé : l'appelant attend sa fin comme pour un
+        nouveau run. Un run terminé en échec n'est jamais réutilisé.
+        """
+        if not self.actif:
+            return lancer(actor_id, input_data)
+
+        cle = cle_run(actor_id, input_data)
+        with self._verrou_de(cle):
+            with self._verrou:
+                entree = self._runs.get(cle)
+                status = self._statuts.get(entree["run_id"], {}).get("status") if entree else None
+            if entree and self.horloge() - entree["lance_le"] < self.ttl \
+                    and status in (None, STATUT_REUSSI):
+                return {
+                    "status": "cache",
+                    "run_id": entree["run_id"],
+                    "actor": actor_id,
+                    "message": f"Run {entree['run_id']} réutilisé (lancé il y a "
+                               f"{self.horloge() - entree['lance_le']:.0f} s)"
+                }
+
+            resultat = lancer(actor_id, input_data)
+            if resultat.get("run_id"):
+                with self._verrou:
+                    self._runs[cle] = {"run_id": resultat["run_id"], "actor": actor_id,
+                                       "lance_le": self.horloge()}
+                self._sauver_index()
+            return resultat
+
+    def statut(self, run_id):
+        """Status terminal déjà connu d'un run (évite d'interroger Apify), sinon None"""
+        with self._verrou:
+            return self._statuts.get(run_id, {}).get("status")
+
+    def noter_statut(self, run_id, status):
+        """Enregistre le status terminal d'un run"""
+        with self._verrou:
+            if self._statuts.get(run_id, {}).get("status") == status:
+                return
+            self._statuts[run_id] = {"status": status, "note_le": self.horloge()}
+        self._sauver_index()
+
+    # --- Datasets ---
+
+    def _chemin_dataset(self, run_id):
+        return os.path.join(self.dossier_datasets, f"{run_id}.jsonl")
+
+    def dataset(self, run_id, telecharger):
+        """Éléments du dataset d'un run réussi, lus sur disque ou téléchargés une seule fois
+
+        Générateur : les éléments sont produits un à un, sans charger le dataset en
+        mémoire. `telecharger()` produit les éléments (ex. iterer_resultats_apify) ; il
+        n'est appelé que si le dataset n'est pas en cache, et chaque élément est écrit sur
+        disque au passage. Seuls les runs réussis sont mis en cache : le dataset d'un run
+        en cours peut encore grossir. Un parcours interrompu ne garde rien en cache.
+        """
+        if not self.actif:
+            yield from telecharger()
+            return
+
+        chemin = self._chemin_dataset(run_id)
+        with self._verrou_de(f"dataset:{run_id}"):
+            try:
+                f = open(chemin, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                f = None
+            if f is not None:
+                with f:
+                    # La date de modification sert d'horodatage LRU
+                    os.utime(chemin)
+                    for ligne in f:
+                        if ligne.strip():
+                            yield json.loads(ligne)
+                return
+            if self.statut(run_id) != STATUT_REUSSI:
+                yield from telecharger()
+                return
+
+            os.makedirs(self.dossier_datasets, exist_ok=True)
+            temporaire = chemin + ".tmp"
+            try:
+                with open(temporaire, 'w', encoding='utf-8') as f:
+                    for element in telecharger():
+                        f.write(json.dumps(element, ensure_ascii=False) + "\n")
+                        yield element
+            except BaseException:
+                os.remove(temporaire)
+                raise
+            os.replace(temporaire, chemin)
+        self._evincer(garder=chemin)
+
+    def _evincer(self, garder=None):
+        """Supprime les datasets les moins récemment utilisés au-delà de taille_max"""
+        try:
+            noms = os.listdir(self.dossier_datasets)
+        except FileNotFoundError:
+            return
+        fichiers = []
+        for nom in noms:
+            if not nom.endswith(".jsonl"):
+                continue
+            chemin = os.path.join(self.dossier_datasets, nom)
+            try:
+                infos = os.stat(chemin)
+            except FileNotFoundError:
+                continue
+            fichiers.append((infos.st_mtime, infos.st_size, chemin))
+
+        total = sum(taille for _, taille, _ in fichiers)
+        for _, taille, chemin in sorted(fichiers):
+            if total <= self.taille_max:
+                break
+            if chemin == garder:
+                continue
+            try:
+                os.remove(chemin)
+            except FileNotFoundError:
+                pass
+            total -= taille
+
+    # --- Index persistant ---
+
+    def _charger_index(self):
+        try:
+            with open(self.fichier_index, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}, {}
+        return index["runs"], index["statuts"]
+
+    def _sauver_index(self):
+        with self._verrou:
+            # Les runs expirés ne seront plus réutilisés : inutile de les garder
+            limite = self.horloge() - self.ttl
+            self._runs = {cle: entree for cle, entree in self._runs.items() if entree["lance_le"] >= limite}
+            if len(self._statuts) > STATUTS_MAX:
+                recents = sorted(self._statuts.items(), key=lambda element: element[1]["note_le"])[-STATUTS_MAX:]
+                self._statuts = dict(recents)
+            contenu = json.dumps({"runs": self._runs, "statuts": self._statuts})
+            os.makedirs(self.dossier, exist_ok=True)
+            temporaire = self.fichier_index + ".tmp"
+            with open(temporaire, 'w', encoding='utf-8') as f:
+                f.write(contenu)
+            os.replace(temporaire, self.fichier_index)
@@ -0,0 +1,101 @@
+"""
+Cache des pages rendues
+Une page n'est régénérée que si ses fichiers sources ont changé (mtime/taille) ou,
+le cas échéant, sa version (ex. dernier événement diffusé) ; le corps compressé et
+l'ETag sont conservés avec elle.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+
+ENCODAGES = ("gzip", "deflate")
+
+
+def choisir_encodage(accept_encoding):
+    """Retourne 'gzip', 'deflate' ou None selon l'en-tête Accept-Encoding"""
+    preferences = {}
+    for element in (accept_encoding or "").split(","):
+        morceaux = element.strip().split(";")
+        nom = morceaux[0].strip().lower()
+        q = 1.0
+        for parametre in morceaux[1:]:
+            cle, _, valeur = parametre.strip().partition("=")
+            if cle == "q":
+                try:
+                    q = float(valeur)
+                except ValueError:
+                    q = 0.0
+        preferences[nom] = q
+    candidats = [(preferences.get(e, preferences.get("*", 0.0)), e) for e in ENCODAGES]
+    q, encodage = max(candidats, key=lambda c: (c[0], c[1] == "gzip"))
+    return encodage if q > 0 else None
+
+
+def etag_correspond(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (e.strip() for e in if_none_match.split(","))
+
+
+class Rendu:
+    """Corps d'une page et ses variantes compressées"""
+
+    def __init__(self, corps: bytes):
+        self.corps_brut = corps
+        self.empreinte = hashlib.sha1(corps).hexdigest()[:20]
+        self._variantes = {}
+        self._verrou = threading.Lock()
+
+    def etag(self, encodage=None):
+        # ETag fort : chaque représentation (brute, gzip, deflate) a le sien
+        return f'"{self.empreinte}-{encodage}"' if encodage else f'"{self.empreinte}"'
+
+    def corps(self, encodage=None):
+        if not encodage:
+            return self.corps_brut
+        with self._verrou:
+            if encodage not in self._variantes:
+                if encodage == "gzip":
+                    self._variantes[encodage] = gzip.compress(self.corps_brut, mtime=0)
+                else:
+                    self._variantes[encodage] = zlib.compress(self.corps_brut)
+            return self._variantes[encodage]
+
+
+class CacheRendu:
+    """Mémorise le rendu d'une page tant que ses fichiers sources sont inchangés
+
+    `version()` : valeur incluse dans la page qui ne dépend pas des fichiers ; la page
+    est régénérée quand elle change.
+    """
+
+    def __init__(self, generer, sources, version=None):
+        self.generer = generer
+        self.sources = list(sources)
+        self.version = version
+        self._verrou = threading.Lock()
+        self._cle = None
+        self._rendu = None
+
+    def _cle_sources(self):
+        cle = [self.version() if self.version else None]
+        for chemin in self.sources:
+            try:
+                stat = os.stat(chemin)
+                cle.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                cle.append(None)
+        return tuple(cle)
+
+    def obtenir(self) -> Rendu:
+        cle = self._cle_sources()
+        with self._verrou:
+            if cle != self._cle or self._rendu is None:
+                self._rendu = Rendu(self.generer().encode('utf-8'))
+                self._cle = cle
+            return self._rendu
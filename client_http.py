@@ -0,0 +1,371 @@
+"""
+Client HTTP partagé (GitHub, Apify)
+Connexions persistantes par hôte : une seule poignée de main TCP/TLS pour une série
+d'appels. Les appels idempotents sont retentés avec une attente exponentielle et une
+gigue aléatoire ; le débit de chaque hôte passe par un seau à jetons ajusté aux en-têtes
+Retry-After et X-RateLimit-* des réponses.
+"""
+
+import email.utils
+import http.client
+import io
+import json
+import os
+import random
+import select
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+from metriques import metriques
+
+USER_AGENT = "axi-agences"
+TIMEOUT_DEFAUT = 30
+
+# Essais par appel ; attente entre deux essais tirée entre 0 et PAUSE_BASE * 2^n (plafonnée)
+HTTP_TENTATIVES_MAX = int(os.environ.get("HTTP_TENTATIVES_MAX", "4"))
+PAUSE_BASE = 0.5
+PAUSE_MAX = 30
+# Retry-After plus long : l'erreur est remontée tout de suite (l'hôte reste suspendu)
+ATTENTE_MAX = 120
+STATUTS_A_REESSAYER = {429, 500, 502, 503, 504}
+METHODES_IDEMPOTENTES = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Connexions inactives gardées par hôte, et leur durée de vie sans requête
+CONNEXIONS_LIBRES_MAX = 8
+INACTIVITE_MAX = 60
+
+# Débit par hôte : (requêtes par seconde, rafale). Les en-têtes X-RateLimit-* le réduisent
+# quand le quota restant l'exige ; un hôte absent n'est limité que par ses en-têtes.
+LIMITES_HOTES = {
+    "api.apify.com": (30, 30),            # 30 requêtes/s par ressource
+    "api.github.com": (5000 / 3600, 100),  # 5000 requêtes/h avec un token
+}
+
+INFINI = float("inf")
+
+
+class SeauJetons:
+    """Limiteur de débit : `debit` jetons par seconde, au plus `capacite` en réserve
+
+    Chaque appel réserve un jeton, quitte à rendre le solde négatif : les appelants
+    attendent chacun leur tour, dans l'ordre de réservation.
+    """
+
+    def __init__(self, debit=INFINI, capacite=INFINI, horloge=time.monotonic):
+        self.debit_nominal = debit
+        self.capacite_nominale = capacite
+        self.debit = debit
+        self.capacite = capacite
+        self.horloge = horloge
+        self._jetons = capacite
+        self._instant = horloge()
+        self._suspendu_jusqua = 0.0
+        self._verrou = threading.Lock()
+
+    def _remplir(self, maintenant):
+        if self.debit == INFINI:
+            self._jetons = self.capacite
+        else:
+            self._jetons = min(self.capacite, self._jetons + (maintenant - self._instant) * self.debit)
+        self._instant = maintenant
+
+    def reserver(self):
+        """Prend un jeton ; retourne l'attente (secondes) avant de s'en servir"""
+        with self._verrou:
+            maintenant = self.horloge()
+            self._remplir(maintenant)
+            attente = max(0.0, self._suspendu_jusqua - maintenant)
+            self._jetons -= 1
+            if self._jetons < 0:
+                attente = max(attente, -self._jetons / self.debit if self.debit else INFINI)
+            return attente
+
+    def suspendre(self, duree):
+        """Plus aucun appel avant `duree` secondes (Retry-After, quota épuisé)"""
+        with self._verrou:
+            self._suspendu_jusqua = max(self._suspendu_jusqua, self.horloge() + duree)
+
+    def ajuster(self, restant, delai):
+        """Quota annoncé par le serveur : `restant` requêtes possibles d'ici `delai` secondes"""
+        if restant <= 0:
+            self.suspendre(delai)
+            return
+        with self._verrou:
+            self._remplir(self.horloge())
+            self.debit = min(self.debit_nominal, restant / max(delai, 1))
+            self.capacite = min(self.capacite_nominale, restant)
+            self._jetons = min(self._jetons, self.capacite)
+
+
+def _entier(valeur):
+    try:
+        return int(float(valeur))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(entetes):
+    """Délai Retry-After en secondes (nombre ou date HTTP), None s'il est absent"""
+    valeur = entetes.get('Retry-After')
+    if not valeur:
+        return None
+    if valeur.strip().isdigit():
+        return float(valeur)
+    try:
+        date = email.utils.parsedate_to_datetime(valeur)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def _quota(entetes):
+    """(requêtes restantes, secondes avant réinitialisation) d'après X-RateLimit-*, ou None"""
+    restant = _entier(entetes.get('X-RateLimit-Remaining'))
+    reinitialisation = _entier(entetes.get('X-RateLimit-Reset'))
+    if restant is None or reinitialisation is None:
+        return None
+    # GitHub donne un instant Unix ; d'autres API un nombre de secondes
+    if reinitialisation > 1_000_000_000:
+        reinitialisation -= time.time()
+    return restant, max(0.0, reinitialisation)
+
+
+def _connexion_fermee(connexion):
+    """Une connexion au repos qui devient lisible a été fermée par le serveur"""
+    if connexion.sock is None:
+        return True
+    try:
+        return bool(select.select([connexion.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class Reponse:
+    """Réponse 2xx : corps lu en entier, ou flux à parcourir ligne par ligne dans un bloc with"""
+
+    def __init__(self, statut, entetes, corps=b"", flux=None, liberer=None):
+        self.statut = statut
+        self.entetes = entetes
+        self.corps = corps
+        self._flux = flux
+        self._liberer = liberer
+
+    def json(self):
+        return json.loads(self.corps.decode()) if self.corps else None
+
+    def __iter__(self):
+        return iter(self._flux)
+
+    def fermer(self):
+        """Rend la connexion au pool si le flux a été lu jusqu'au bout, la ferme sinon"""
+        if self._liberer:
+            liberer, self._liberer = self._liberer, None
+            liberer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+
+class ClientHTTP:
+    """Pool de connexions par hôte, nouvelles tentatives et limitation de débit"""
+
+    def __init__(self, limites=LIMITES_HOTES, tentatives_max=HTTP_TENTATIVES_MAX,
+                 pause_base=PAUSE_BASE, pause_max=PAUSE_MAX, timeout=TIMEOUT_DEFAUT,
+                 registre=metriques, dormir=time.sleep, aleatoire=None):
+        self.limites = dict(limites)
+        self.tentatives_max = max(1, tentatives_max)
+        self.pause_base = pause_base
+        self.pause_max = pause_max
+        self.timeout = timeout
+        self.registre = registre
+        self.dormir = dormir
+        self._aleatoire = aleatoire or random.Random()
+
+        self._verrou = threading.Lock()
+        self._libres = {}  # (schéma, hôte, port) -> [(connexion, instant de retour au pool)]
+        self._seaux = {}
+        self._stats = {}
+        self._contexte_ssl = None
+
+    # --- API publique ---
+
+    def requete(self, methode, url, donnees=None, corps=None, entetes=None, timeout=None,
+                idempotent=None) -> Reponse:
+        """Envoie la requête (JSON `donnees` ou `corps` brut) et lit la réponse en entier
+
+        Lève urllib.error.HTTPError pour tout statut hors 2xx, une fois les éventuelles
+        nouvelles tentatives épuisées. Par défaut seules les méthodes idempotentes sont
+        rejouées après une erreur réseau ou serveur ; un 429 l'est toujours.
+        """
+        return self._executer(methode, url, donnees, corps, entetes, timeout, idempotent, flux=False)
+
+    def ouvrir(self, methode, url, donnees=None, corps=None, entetes=None, timeout=None,
+               idempotent=None) -> Reponse:
+        """Comme requete(), mais le corps est lu à la demande (`with client.ouvrir(...) as r`)"""
+        return self._executer(methode, url, donnees, corps, entetes, timeout, idempotent, flux=True)
+
+    def statistiques(self) -> dict:
+        """Requêtes, erreurs, nouvelles tentatives, connexions ouvertes et latence moyenne par hôte"""
+        with self._verrou:
+            resultat = {}
+            for hote, stats in self._stats.items():
+                ligne = {cle: valeur for cle, valeur in stats.items() if cle != "duree_totale"}
+                ligne["latence_moyenne_ms"] = round(1000 * stats["duree_totale"] / stats["requetes"], 1) \
+                    if stats["requetes"] else None
+                resultat[hote] = ligne
+            return resultat
+
+    def fermer(self):
+        """Ferme les connexions au repos"""
+        with self._verrou:
+            libres, self._libres = self._libres, {}
+        for connexions in libres.values():
+            for connexion, _ in connexions:
+                connexion.close()
+
+    # --- Exécution ---
+
+    def _executer(self, methode, url, donnees, corps, entetes, timeout, idempotent, flux):
+        methode = methode.upper()
+        morceaux = urllib.parse.urlsplit(url)
+        securise = morceaux.scheme == "https"
+        hote = morceaux.hostname
+        cle = (morceaux.scheme, hote, morceaux.port or (443 if securise else 80))
+        chemin = (morceaux.path or "/") + (f"?{morceaux.query}" if morceaux.query else "")
+        entetes = {"User-Agent": USER_AGENT, **(entetes or {})}
+        if donnees is not None:
+            corps = json.dumps(donnees).encode()
+            entetes.setdefault("Content-Type", "application/json")
+        if idempotent is None:
+            idempotent = methode in METHODES_IDEMPOTENTES
+        timeout = timeout or self.timeout
+        seau = self._seau(hote)
+
+        tentative = 0
+        while True:
+            tentative += 1
+            attente = seau.reserver()
+            if attente > ATTENTE_MAX:
+                raise urllib.error.URLError(f"{hote} : limite de débit atteinte, reprise dans {attente:.0f} s")
+            if attente:
+                self.dormir(attente)
+
+            connexion = self._prendre(cle, timeout)
+            depart = time.perf_counter()
+            try:
+                connexion.request(methode, chemin, body=corps, headers=entetes)
+                reponse = connexion.getresponse()
+                en_flux = flux and 200 <= reponse.status < 300
+                contenu = b"" if en_flux else reponse.read()
+            except (OSError, http.client.HTTPException) as e:
+                connexion.close()
+                self._noter(hote, time.perf_counter() - depart, "erreur")
+                if not idempotent or tentative >= self.tentatives_max:
+                    raise
+                self._noter_reessai(hote)
+                self.dormir(self._pause(tentative))
+                continue
+            duree = time.perf_counter() - depart
+
+            quota = _quota(reponse.headers)
+            if quota:
+                seau.ajuster(*quota)
+
+            if en_flux:
+                self._noter(hote, duree, reponse.status)
+                return Reponse(reponse.status, reponse.headers, flux=reponse,
+                               liberer=lambda: self._rendre(cle, connexion, reponse))
+            self._rendre(cle, connexion, reponse)
+            self._noter(hote, duree, reponse.status)
+            if 200 <= reponse.status < 300:
+                return Reponse(reponse.status, reponse.headers, corps=contenu)
+
+            # Limite de débit : 429, ou 403 de GitHub accompagné d'un délai ou d'un quota épuisé
+            delai = _retry_after(reponse.headers)
+            if delai is None and quota and quota[0] <= 0:
+                delai = quota[1]
+            limite = reponse.status == 429 or (reponse.status == 403 and delai is not None)
+            if delai is not None and (limite or reponse.status == 503):
+                seau.suspendre(delai)
+            reessayable = limite or (idempotent and reponse.status in STATUTS_A_REESSAYER)
+            if reessayable and tentative < self.tentatives_max and (delai or 0) <= ATTENTE_MAX:
+                self._noter_reessai(hote)
+                if delai is None:
+                    self.dormir(self._pause(tentative))
+                continue  # sinon le seau suspendu fait attendre jusqu'à la fin du délai
+            raise urllib.error.HTTPError(url, reponse.status, reponse.reason, reponse.headers,
+                                         io.BytesIO(contenu))
+
+    def _pause(self, tentative):
+        """Attente exponentielle avec gigue complète (les clients ne se resynchronisent pas)"""
+        return self._aleatoire.uniform(0, min(self.pause_max, self.pause_base * 2 ** (tentative - 1)))
+
+    # --- Pool de connexions ---
+
+    def _prendre(self, cle, timeout):
+        with self._verrou:
+            libres = self._libres.get(cle)
+            while libres:
+                connexion, instant = libres.pop()
+                if time.monotonic() - instant < INACTIVITE_MAX and not _connexion_fermee(connexion):
+                    connexion.timeout = timeout
+                    connexion.sock.settimeout(timeout)
+                    return connexion
+                connexion.close()
+            self._stats_hote(cle[1])["connexions"] += 1
+            if cle[0] != "https":
+                return http.client.HTTPConnection(cle[1], cle[2], timeout=timeout)
+            if self._contexte_ssl is None:
+                self._contexte_ssl = ssl.create_default_context()
+            return http.client.HTTPSConnection(cle[1], cle[2], timeout=timeout, context=self._contexte_ssl)
+
+    def _rendre(self, cle, connexion, reponse):
+        """Remet au pool une connexion dont la réponse a été lue en entier"""
+        if reponse.will_close or not reponse.isclosed():
+            connexion.close()
+            return
+        with self._verrou:
+            libres = self._libres.setdefault(cle, [])
+            if len(libres) < CONNEXIONS_LIBRES_MAX:
+                libres.append((connexion, time.monotonic()))
+                return
+        connexion.close()
+
+    def _seau(self, hote):
+        with self._verrou:
+            seau = self._seaux.get(hote)
+            if seau is None:
+                seau = self._seaux[hote] = SeauJetons(*self.limites.get(hote, (INFINI, INFINI)))
+            return seau
+
+    # --- Statistiques ---
+
+    def _stats_hote(self, hote):
+        stats = self._stats.get(hote)
+        if stats is None:
+            stats = self._stats[hote] = {"requetes": 0, "erreurs": 0, "reessais": 0, "connexions": 0,
+                                         "duree_totale": 0.0}
+        return stats
+
+    def _noter(self, hote, duree, statut):
+        with self._verrou:
+            stats = self._stats_hote(hote)
+            stats["requetes"] += 1
+            stats["duree_totale"] += duree
+            if statut == "erreur" or statut >= 500 or statut == 429:
+                stats["erreurs"] += 1
+        self.registre.observer_sortant(hote, duree, statut)
+
+    def _noter_reessai(self, hote):
+        with self._verrou:
+            self._stats_hote(hote)["reessais"] += 1
+
+
+# Client partagé par les modules de l'application
+client_http = ClientHTTP()
@@ -0,0 +1,264 @@
+"""
+Référentiel des communes de Dordogne
+Table des communes (INSEE, variantes de nom, codes postaux, centroïde), recherche par
+nom normalisé et index spatial en grille pour les zones « N km autour de X ».
+La table se régénère depuis l'extrait officiel (API Géo / découpage administratif) :
+
+    python communes.py communes_24.json
+"""
+
+import csv
+import json
+import math
+import os
+import sys
+from dataclasses import dataclass, field
+
+from annonces import normaliser_nom
+
+FICHIER_COMMUNES = os.environ.get(
+    "AXI_FICHIER_COMMUNES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "communes_dordogne.csv")
+)
+
+# Taille d'une cellule de la grille spatiale, en degrés (~11 km en latitude)
+PAS_GRILLE = 0.1
+RAYON_TERRE_KM = 6371.0
+
+_ABREVIATIONS = {"st": "saint", "ste": "sainte"}
+
+
+def cle_nom(nom: str) -> str:
+    """Clé de recherche d'un nom de commune : 'St-Cirq' et 'Saint Cirq' donnent 'saint cirq'"""
+    mots = normaliser_nom(nom).split()
+    return " ".join(_ABREVIATIONS.get(mot, mot) for mot in mots)
+
+
+def slug(nom: str) -> str:
+    """'Saint-Mayme-de-Péreyrol' -> 'saint-mayme-de-pereyrol' (URLs des portails)"""
+    return normaliser_nom(nom).replace(" ", "-")
+
+
+def distance_km(lat1, lon1, lat2, lon2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(a))
+
+
+@dataclass(slots=True)
+class Commune:
+    insee: str
+    nom: str
+    codes_postaux: tuple
+    latitude: float
+    longitude: float
+    variantes: tuple = field(default_factory=tuple)
+
+
+class Zones(dict):
+    """Zones d'agence par nom, avec un index commune -> zone pour classer les annonces"""
+
+    def __init__(self, zones=(), referentiel=None):
+        super().__init__(zones)
+        self.referentiel = referentiel
+        self._par_commune = {}
+        self._par_code_postal = {}
+        for nom_zone, zone in self.items():
+            for commune in zone["communes"]:
+                self._par_commune.setdefault(cle_nom(commune), nom_zone)
+                # Ancien nom (commune déléguée) : aussi rangé sous le nom actuel de la commune
+                trouvee = referentiel.rechercher(commune) if referentiel else None
+                if trouvee is not None:
+                    self._par_commune.setdefault(cle_nom(trouvee.nom), nom_zone)
+        if referentiel is None:
+            for nom_zone, zone in self.items():
+                for code_postal in zone["codes_postaux"]:
+                    self._par_code_postal.setdefault(code_postal, nom_zone)
+            return
+        # Un code postal ne désigne une zone que si toutes ses communes sont dans le rayon
+        # de cette zone : un code partagé avec des communes hors zone ne classe rien
+        dans_rayon = {}
+        for nom_zone, zone in self.items():
+            centre = referentiel.rechercher(zone["centre"])
+            for commune in referentiel.dans_rayon(centre.latitude, centre.longitude, zone["rayon_km"]):
+                dans_rayon.setdefault(commune.insee, nom_zone)
+        zones_par_code = {}
+        for commune in referentiel.communes:
+            nom_zone = dans_rayon.get(commune.insee)
+            for code_postal in commune.codes_postaux:
+                zones_par_code.setdefault(code_postal, set()).add(nom_zone)
+        for code_postal, zones in zones_par_code.items():
+            if len(zones) == 1 and None not in zones:
+                self._par_code_postal[code_postal] = zones.pop()
+
+    def zone_de(self, code_postal, commune) -> str:
+        """Zone d'une annonce : par commune (nom ou variante), à défaut par code postal
+
+        Une commune connue du référentiel mais hors zone n'est pas rattrapée par son code
+        postal ; le code ne sert que si la commune est absente ou inconnue.
+        """
+        if commune:
+            nom_zone = self._par_commune.get(cle_nom(commune))
+            if nom_zone:
+                return nom_zone
+            trouvee = self.referentiel.rechercher(commune) if self.referentiel else None
+            nom_zone = self._par_commune.get(cle_nom(trouvee.nom)) if trouvee else None
+            if nom_zone:
+                return nom_zone
+            if trouvee is not None:
+                return ""
+        return self._par_code_postal.get(code_postal, "")
+
+
+class ReferentielCommunes:
+    """Communes indexées par nom normalisé, code postal et position"""
+
+    def __init__(self, communes):
+        self.communes = list(communes)
+        self._par_nom = {}
+        self._par_code_postal = {}
+        self._grille = {}
+        for commune in self.communes:
+            for nom in (commune.nom, *commune.variantes):
+                self._par_nom.setdefault(cle_nom(nom), commune)
+            for code_postal in commune.codes_postaux:
+                self._par_code_postal.setdefault(code_postal, []).append(commune)
+            self._grille.setdefault(self._cellule(commune.latitude, commune.longitude), []).append(commune)
+
+    @classmethod
+    def charger(cls, chemin=FICHIER_COMMUNES):
+        """Lit la table des communes (CSV séparé par ';')"""
+        communes = []
+        with open(chemin, 'r', encoding='utf-8', newline='') as f:
+            for ligne in csv.DictReader(f, delimiter=';'):
+                communes.append(Commune(
+                    insee=ligne["insee"],
+                    nom=ligne["nom"],
+                    codes_postaux=tuple(c for c in ligne["codes_postaux"].split("|") if c),
+                    latitude=float(ligne["latitude"]),
+                    longitude=float(ligne["longitude"]),
+                    variantes=tuple(v for v in ligne["variantes"].split("|") if v),
+                ))
+        return cls(communes)
+
+    @staticmethod
+    def _cellule(latitude, longitude):
+        return (math.floor(latitude / PAS_GRILLE), math.floor(longitude / PAS_GRILLE))
+
+    def rechercher(self, nom):
+        return self._par_nom.get(cle_nom(nom))
+
+    def par_code_postal(self, code_postal) -> list:
+        return list(self._par_code_postal.get(code_postal, []))
+
+    def dans_rayon(self, latitude, longitude, rayon_km) -> list:
+        """Communes dont le centroïde est à moins de rayon_km, de la plus proche à la plus lointaine"""
+        pas_lat = math.ceil(rayon_km / (111.2 * PAS_GRILLE))
+        pas_lon = math.ceil(rayon_km / (111.2 * math.cos(math.radians(latitude)) * PAS_GRILLE))
+        ligne, colonne = self._cellule(latitude, longitude)
+        trouvees = []
+        for i in range(ligne - pas_lat, ligne + pas_lat + 1):
+            for j in range(colonne - pas_lon, colonne + pas_lon + 1):
+                for commune in self._grille.get((i, j), ()):
+                    distance = distance_km(latitude, longitude, commune.latitude, commune.longitude)
+                    if distance <= rayon_km:
+                        trouvees.append((distance, commune))
+        trouvees.sort(key=lambda element: element[0])
+        return [commune for _, commune in trouvees]
+
+    def plus_proche(self, latitude, longitude, rayon_max_km=30):
+        communes = self.dans_rayon(latitude, longitude, rayon_max_km)
+        return communes[0] if communes else None
+
+    def zone_autour(self, centre, rayon_km, communes=None, codes_postaux=None) -> dict:
+        """Zone d'agence « rayon_km autour de centre », au format de ZONE_VERGT / ZONE_BUGUE
+
+        `communes` : communes imposées, placées en tête (les portails limités à quelques
+        communes cherchent dans celles-ci) ; celles du rayon s'y ajoutent pour classer les
+        annonces. `codes_postaux` : périmètre de recherche imposé ; à défaut, les codes des
+        communes de la zone.
+        """
+        commune_centre = self.rechercher(centre)
+        if commune_centre is None:
+            raise ValueError(f"Commune inconnue : {centre}")
+        noms = list(communes or [])
+        connues = {cle_nom(nom) for nom in noms}
+        for commune in self.dans_rayon(commune_centre.latitude, commune_centre.longitude, rayon_km):
+            if cle_nom(commune.nom) not in connues:
+                noms.append(commune.nom)
+                connues.add(cle_nom(commune.nom))
+        if codes_postaux is None:
+            codes_postaux = []
+            for nom in noms:
+                commune = self.rechercher(nom)
+                for code_postal in commune.codes_postaux if commune else ():
+                    if code_postal not in codes_postaux:
+                        codes_postaux.append(code_postal)
+        return {
+            "centre": commune_centre.nom,
+            "code_postal_principal": commune_centre.codes_postaux[0] if commune_centre.codes_postaux else "",
+            "rayon_km": rayon_km,
+            "communes": noms,
+            "codes_postaux": list(codes_postaux),
+        }
+
+    def zones(self, configuration: dict) -> Zones:
+        """Construit les zones à partir de {nom: {"centre", "rayon_km"[, "communes", "codes_postaux"]}}"""
+        return Zones(
+            {nom: self.zone_autour(zone["centre"], zone["rayon_km"], zone.get("communes"), zone.get("codes_postaux"))
+             for nom, zone in configuration.items()},
+            referentiel=self
+        )
+
+
+def convertir_extrait(source, destination=FICHIER_COMMUNES, departement="24"):
+    """Écrit la table des communes depuis l'extrait officiel au format de l'API Géo
+
+    `source` : JSON de geo.api.gouv.fr/departements/24/communes (voir le README)
+    ou communes.json du paquet de découpage administratif. Les communes déléguées et
+    associées deviennent des variantes de leur commune nouvelle (chefLieu) ; les variantes
+    déjà présentes dans `destination` sont conservées. Retourne le nombre de communes écrites.
+    """
+    with open(source, 'r', encoding='utf-8') as f:
+        extrait = json.load(f)
+    variantes = {}
+    try:
+        for commune in ReferentielCommunes.charger(destination).communes:
+            variantes[commune.insee] = list(commune.variantes)
+    except FileNotFoundError:
+        pass
+    for commune in extrait:
+        if commune.get("type") in ("commune-deleguee", "commune-associee") and commune.get("chefLieu"):
+            noms = variantes.setdefault(commune["chefLieu"], [])
+            if commune["nom"] not in noms:
+                noms.append(commune["nom"])
+
+    lignes = []
+    for commune in extrait:
+        code = commune.get("code", "")
+        if not code.startswith(departement) or commune.get("type", "commune-actuelle") != "commune-actuelle":
+            continue
+        centre = commune.get("centre") or {}
+        if "coordinates" not in centre:
+            continue
+        longitude, latitude = centre["coordinates"]
+        noms = [nom for nom in variantes.get(code, ()) if cle_nom(nom) != cle_nom(commune["nom"])]
+        lignes.append([code, commune["nom"], "|".join(noms),
+                       "|".join(commune.get("codesPostaux", [])), f"{latitude:.4f}", f"{longitude:.4f}"])
+    lignes.sort(key=lambda ligne: ligne[0])
+
+    temporaire = destination + ".tmp"
+    with open(temporaire, 'w', encoding='utf-8', newline='') as f:
+        ecrivain = csv.writer(f, delimiter=';', lineterminator='\n')
+        ecrivain.writerow(["insee", "nom", "variantes", "codes_postaux", "latitude", "longitude"])
+        ecrivain.writerows(lignes)
+    os.replace(temporaire, destination)
+    return len(lignes)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage : python communes.py <extrait API Géo (JSON)>")
+    print(f"{convertir_extrait(sys.argv[1])} communes écrites dans {FICHIER_COMMUNES}")
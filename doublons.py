@@ -0,0 +1,159 @@
+"""
+Détection des doublons entre portails et agences
+Un même bien publié sur LeBonCoin, SeLoger et Bien'ici (ou par plusieurs agences) est
+regroupé en un bien canonique : MinHash/LSH sur le titre et la description, limité aux
+annonces d'une même commune au prix et à la surface compatibles, plus les photos communes
+dans la même commune (hors photos génériques partagées par de nombreuses annonces).
+"""
+
+import hashlib
+import zlib
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from annonces import normaliser_nom
+
+NB_PERMUTATIONS = 64
+# 16 bandes de 4 lignes : deux textes de similarité Jaccard ~0.5 ont une chance sur deux
+# de partager une bande ; la vérification élimine ensuite les faux candidats
+NB_BANDES = 16
+SEUIL_SIMILARITE = 0.6
+ECART_PRIX_MAX = 0.10
+ECART_SURFACE_MAX = 0.10
+TAILLE_SHINGLE = 3
+# Une photo vue dans plus d'annonces (logo d'agence, visuel générique) ne prouve rien
+PHOTO_ANNONCES_MAX = 3
+
+_PREMIER = np.uint64((1 << 61) - 1)
+_generateur = np.random.default_rng(24260)
+_COEF_A = _generateur.integers(1, 1 << 32, NB_PERMUTATIONS, dtype=np.uint64)
+_COEF_B = _generateur.integers(0, 1 << 32, NB_PERMUTATIONS, dtype=np.uint64)
+
+
+@dataclass(slots=True)
+class BienCanonique:
+    """Un bien réel et les annonces qui le décrivent"""
+
+    annonce: object  # annonce de référence : la première apparue
+    annonces: list = field(default_factory=list)
+
+    @property
+    def liens(self) -> dict:
+        """URLs des annonces par portail"""
+        liens = {}
+        for annonce in self.annonces:
+            if annonce.url and annonce.url not in liens.get(annonce.portail, []):
+                liens.setdefault(annonce.portail, []).append(annonce.url)
+        return liens
+
+    @property
+    def premiere_vue(self):
+        return self.annonce.premiere_vue
+
+
+def signature_minhash(texte: str) -> np.ndarray:
+    """Signature MinHash des shingles de mots du texte normalisé"""
+    mots = normaliser_nom(texte).split()
+    if len(mots) < TAILLE_SHINGLE:
+        shingles = {" ".join(mots)} if mots else set()
+    else:
+        shingles = {" ".join(mots[i:i + TAILLE_SHINGLE]) for i in range(len(mots) - TAILLE_SHINGLE + 1)}
+    if not shingles:
+        return None
+    empreintes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # h(x) = (a.x + b) mod p pour chaque permutation, puis minimum sur les shingles
+    hachages = (_COEF_A[:, None] * empreintes[None, :] + _COEF_B[:, None]) % _PREMIER
+    return hachages.min(axis=1)
+
+
+def empreinte_photo(url: str) -> str:
+    """Empreinte d'une photo : URL sans paramètres (taille, format) ni schéma"""
+    morceaux = urlsplit(url)
+    return hashlib.sha1(f"{morceaux.netloc}{morceaux.path}".lower().encode()).hexdigest()[:16]
+
+
+def _compatibles(a, b):
+    if a.prix and b.prix and abs(a.prix - b.prix) > ECART_PRIX_MAX * max(a.prix, b.prix):
+        return False
+    if a.surface and b.surface and abs(a.surface - b.surface) > ECART_SURFACE_MAX * max(a.surface, b.surface):
+        return False
+    return True
+
+
+def _bloc(annonce):
+    """Clé de blocage : on ne compare que des annonces d'une même commune (à défaut, code postal)"""
+    return normaliser_nom(annonce.commune) or annonce.code_postal or "?"
+
+
+class _Partition:
+    """Union-find des indices d'annonces"""
+
+    def __init__(self, taille):
+        self.parents = list(range(taille))
+
+    def racine(self, i):
+        while self.parents[i] != i:
+            self.parents[i] = self.parents[self.parents[i]]
+            i = self.parents[i]
+        return i
+
+    def unir(self, i, j):
+        ri, rj = self.racine(i), self.racine(j)
+        if ri != rj:
+            self.parents[max(ri, rj)] = min(ri, rj)
+
+
+def regrouper_doublons(annonces) -> list:
+    """Regroupe les annonces décrivant le même bien ; retourne un BienCanonique par bien"""
+    annonces = list(annonces)
+    partition = _Partition(len(annonces))
+    signatures = [signature_minhash(f"{a.titre} {a.description}") for a in annonces]
+
+    # Candidats : même bande LSH dans le même bloc, ou une photo commune dans le même bloc
+    photos = [{empreinte_photo(url) for url in annonce.photos} for annonce in annonces]
+    usages_photo = {}
+    for empreintes in photos:
+        for empreinte in empreintes:
+            usages_photo[empreinte] = usages_photo.get(empreinte, 0) + 1
+    seaux = {}
+    lignes_par_bande = NB_PERMUTATIONS // NB_BANDES
+    for i, (annonce, signature) in enumerate(zip(annonces, signatures)):
+        bloc = _bloc(annonce)
+        if signature is not None:
+            for bande in range(NB_BANDES):
+                morceau = signature[bande * lignes_par_bande:(bande + 1) * lignes_par_bande].tobytes()
+                seaux.setdefault((bloc, bande, morceau), []).append(i)
+        for empreinte in photos[i]:
+            if usages_photo[empreinte] <= PHOTO_ANNONCES_MAX:
+                seaux.setdefault((bloc, "photo", empreinte), []).append(i)
+
+    deja_compares = set()
+    for cle, indices in seaux.items():
+        if len(indices) < 2:
+            continue
+        par_photo = cle[1] == "photo"
+        for position, i in enumerate(indices):
+            for j in indices[position + 1:]:
+                if partition.racine(i) == partition.racine(j) or (i, j) in deja_compares:
+                    continue
+                deja_compares.add((i, j))
+                a, b = annonces[i], annonces[j]
+                if not _compatibles(a, b):
+                    continue
+                if par_photo:
+                    partition.unir(i, j)
+                    continue
+                similarite = float(np.mean(signatures[i] == signatures[j]))
+                if similarite >= SEUIL_SIMILARITE:
+                    partition.unir(i, j)
+
+    groupes = {}
+    for i, annonce in enumerate(annonces):
+        groupes.setdefault(partition.racine(i), []).append(annonce)
+    biens = []
+    for membres in groupes.values():
+        membres.sort(key=lambda annonce: annonce.premiere_vue)
+        biens.append(BienCanonique(annonce=membres[0], annonces=membres))
+    return biens
@@ -0,0 +1,230 @@
+"""
+Flux d'événements du tableau de bord (Server-Sent Events)
+Les événements (journal, veille, travaux) sont gardés dans un tampon circulaire en
+mémoire ; un seul thread les pousse à tous les navigateurs connectés à l'aide d'un
+sélecteur, sans thread par client. Un client qui se reconnecte avec Last-Event-ID
+reçoit ce qu'il a manqué.
+"""
+
+import collections
+import json
+import os
+import selectors
+import socket
+import threading
+import time
+
+# Événements gardés pour les reprises (Last-Event-ID)
+TAILLE_TAMPON = 1000
+# Commentaire envoyé périodiquement : garde la connexion ouverte à travers les proxys
+# et révèle les clients partis sans fermer proprement
+INTERVALLE_BATTEMENT = 15
+# Client qui ne lit plus : déconnecté au-delà de ce volume en attente (il se reconnectera)
+EN_ATTENTE_MAX = 1 << 20
+CLIENTS_MAX = int(os.environ.get("AXI_CLIENTS_EVENEMENTS_MAX", "200"))
+# Délai de reconnexion suggéré aux navigateurs (millisecondes)
+DELAI_RECONNEXION = 3000
+
+# Envoyé quand les événements manqués ne sont plus dans le tampon (ou après un
+# redémarrage) : le tableau de bord se recharge en entier
+REINITIALISATION = "reinitialisation"
+
+
+class Evenement:
+    __slots__ = ("id", "type", "donnees", "trame")
+
+    def __init__(self, identifiant, type, donnees):
+        self.id = identifiant
+        self.type = type
+        self.donnees = donnees
+        # Encodé une seule fois, quel que soit le nombre de clients
+        self.trame = (f"id: {identifiant}\nevent: {type}\n"
+                      f"data: {json.dumps(donnees, ensure_ascii=False, default=str)}\n\n").encode()
+
+
+class TamponEvenements:
+    """Derniers événements publiés, numérotés « <époque>-<numéro> »
+
+    L'époque change à chaque démarrage : un identifiant d'avant un redémarrage n'est
+    jamais confondu avec un événement de la nouvelle série.
+    """
+
+    def __init__(self, taille=TAILLE_TAMPON, epoque=None):
+        self.epoque = epoque or format(int(time.time() * 1000), "x")
+        self._evenements = collections.deque(maxlen=taille)
+        self._numero = 0
+
+    def publier(self, type, donnees) -> Evenement:
+        self._numero += 1
+        evenement = Evenement(f"{self.epoque}-{self._numero}", type, donnees)
+        self._evenements.append(evenement)
+        return evenement
+
+    def dernier_id(self):
+        return f"{self.epoque}-{self._numero}"
+
+    def depuis(self, dernier_id):
+        """Événements postérieurs à `dernier_id` ; le booléen est faux s'il en manque"""
+        epoque, _, numero = (dernier_id or "").partition("-")
+        if epoque != self.epoque or not numero.isdigit():
+            return [], False
+        numero = int(numero)
+        if numero >= self._numero:
+            return [], True
+        premier = self._numero - len(self._evenements) + 1
+        if numero + 1 < premier:
+            return list(self._evenements), False
+        return list(self._evenements)[numero + 1 - premier:], True
+
+
+class Diffuseur:
+    """Connexions SSE ouvertes, alimentées par un thread unique (sélecteur non bloquant)"""
+
+    def __init__(self, tampon=None, clients_max=CLIENTS_MAX, battement=INTERVALLE_BATTEMENT):
+        self.tampon = tampon or TamponEvenements()
+        self.clients_max = clients_max
+        self.battement = battement
+
+        # Protège le tampon et les données en attente de chaque client : un événement
+        # est ajouté à tous les clients dans l'ordre de publication
+        self._verrou = threading.Lock()
+        self._clients = {}  # socket -> bytearray restant à envoyer
+        self._nouveaux = []
+        self._a_vider = set()
+        self._thread = None
+        self._reveil_lecture, self._reveil_ecriture = socket.socketpair()
+        self._reveil_lecture.setblocking(False)
+        self._reveil_ecriture.setblocking(False)
+        self._selecteur = selectors.DefaultSelector()
+        self._selecteur.register(self._reveil_lecture, selectors.EVENT_READ)
+
+    # --- API publique ---
+
+    def publier(self, type, donnees) -> Evenement:
+        """Ajoute un événement au tampon et le pousse aux clients connectés"""
+        with self._verrou:
+            evenement = self.tampon.publier(type, donnees)
+            if not self._clients:
+                return evenement
+            for socket_client, en_attente in self._clients.items():
+                en_attente += evenement.trame
+                self._a_vider.add(socket_client)
+        self._reveiller()
+        return evenement
+
+    def dernier_id(self):
+        with self._verrou:
+            return self.tampon.dernier_id()
+
+    def disponible(self):
+        return len(self._clients) < self.clients_max
+
+    def nombre_clients(self):
+        return len(self._clients)
+
+    def accepter(self, socket_client, dernier_id=None):
+        """Prend en charge une connexion dont les en-têtes HTTP ont déjà été envoyés
+
+        Avec `dernier_id`, les événements manqués sont renvoyés d'abord ; s'ils ne sont
+        plus tous dans le tampon, le client reçoit un événement de réinitialisation.
+        """
+        socket_client.setblocking(False)
+        debut = bytearray(f"retry: {DELAI_RECONNEXION}\n\n".encode())
+        with self._verrou:
+            if dernier_id:
+                manques, complet = self.tampon.depuis(dernier_id)
+                if not complet:
+                    debut += Evenement(self.tampon.dernier_id(), REINITIALISATION, {}).trame
+                else:
+                    for evenement in manques:
+                        debut += evenement.trame
+            self._clients[socket_client] = debut
+            self._nouveaux.append(socket_client)
+            self._a_vider.add(socket_client)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, name="evenements", daemon=True)
+                self._thread.start()
+        self._reveiller()
+
+    # --- Thread de diffusion ---
+
+    def _reveiller(self):
+        try:
+            self._reveil_ecriture.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # Un réveil est déjà en attente
+
+    def _boucle(self):
+        prochain_battement = time.monotonic() + self.battement
+        while True:
+            attente = max(0.0, prochain_battement - time.monotonic())
+            prets = set()
+            for cle, masque in self._selecteur.select(attente):
+                if cle.fileobj is self._reveil_lecture:
+                    try:
+                        while self._reveil_lecture.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                if masque & selectors.EVENT_READ and not self._lire(cle.fileobj):
+                    continue
+                if masque & selectors.EVENT_WRITE:
+                    prets.add(cle.fileobj)
+
+            with self._verrou:
+                for socket_client in self._nouveaux:
+                    self._selecteur.register(socket_client, selectors.EVENT_READ)
+                self._nouveaux.clear()
+                if time.monotonic() >= prochain_battement:
+                    for socket_client, en_attente in self._clients.items():
+                        en_attente += b": \n\n"
+                        self._a_vider.add(socket_client)
+                    prochain_battement = time.monotonic() + self.battement
+                prets |= self._a_vider
+                self._a_vider.clear()
+                for socket_client in prets:
+                    self._envoyer(socket_client)
+
+    def _lire(self, socket_client):
+        """Un client n'envoie rien après sa requête : une lecture vide signale son départ"""
+        try:
+            if socket_client.recv(4096):
+                return True
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        with self._verrou:
+            self._fermer(socket_client)
+        return False
+
+    def _envoyer(self, socket_client):
+        """Envoie ce qui peut l'être sans bloquer ; le reste attend que la socket soit prête"""
+        en_attente = self._clients.get(socket_client)
+        if en_attente is None:
+            return
+        try:
+            envoye = socket_client.send(en_attente) if en_attente else 0
+        except BlockingIOError:
+            envoye = 0
+        except OSError:
+            self._fermer(socket_client)
+            return
+        del en_attente[:envoye]
+        if len(en_attente) > EN_ATTENTE_MAX:
+            self._fermer(socket_client)
+            return
+        masque = selectors.EVENT_READ | (selectors.EVENT_WRITE if en_attente else 0)
+        if self._selecteur.get_key(socket_client).events != masque:
+            self._selecteur.modify(socket_client, masque)
+
+    def _fermer(self, socket_client):
+        if self._clients.pop(socket_client, None) is None:
+            return
+        self._a_vider.discard(socket_client)
+        try:
+            self._selecteur.unregister(socket_client)
+        except (KeyError, ValueError):
+            pass
+        socket_client.close()
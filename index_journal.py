@@ -0,0 +1,323 @@
+"""
+Index du journal structuré (journal_activite.jsonl)
+Fichiers annexes tenus à jour au fil des écritures : position, horodatage et niveau
+de chaque ligne, et index inversé des tâches et des mots des avertissements et erreurs.
+Une recherche sur un an de journal ne lit que les lignes qu'elle retourne.
+"""
+
+import array
+import bisect
+import json
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from journalisation import AVERTISSEMENT, NIVEAUX
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+DOSSIER_INDEX = os.path.join(DOSSIER_ETAT, "index_journal")
+
+# Taille de page par défaut et maximale
+LIMITE_DEFAUT = 100
+LIMITE_MAX = 1000
+# Lignes examinées au plus par requête quand aucun index ne s'applique : au-delà, la
+# page est retournée incomplète avec un curseur pour continuer
+EXAMEN_MAX = 20000
+
+# Lecture du journal par blocs lors de l'indexation
+TAILLE_BLOC = 8 * 1024 * 1024
+
+# Les mots des messages ne sont indexés qu'à partir de ce niveau
+NIVEAU_MOTS = NIVEAUX[AVERTISSEMENT]
+
+
+def mots(texte):
+    """Mots d'au moins 3 caractères, en minuscules et sans accents"""
+    decompose = unicodedata.normalize("NFKD", texte.lower())
+    sans_accents = "".join(c for c in decompose if not unicodedata.combining(c))
+    return set(re.findall(r"\w{3,}", sans_accents))
+
+
+def lire_date(valeur):
+    """Date ou date-heure ISO (heure de Paris si le fuseau est absent) en timestamp"""
+    date = datetime.fromisoformat(valeur)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=TIMEZONE_FRANCE)
+    return date.timestamp()
+
+
+class IndexJournal:
+    """Index annexe d'un journal JSONL en ajout seul, rattrapé à partir du dernier octet indexé"""
+
+    def __init__(self, chemin_journal, dossier=DOSSIER_INDEX):
+        self.chemin_journal = chemin_journal
+        self.dossier = dossier
+        prefixe = os.path.join(dossier, os.path.basename(chemin_journal))
+        self._chemins = {
+            "positions": prefixe + ".positions",
+            "horodatages": prefixe + ".horodatages",
+            "niveaux": prefixe + ".niveaux",
+            "cles": prefixe + ".cles",
+        }
+        self._verrou = threading.Lock()
+        self._charge = False
+        self._vider_memoire()
+
+    def _vider_memoire(self):
+        self._positions = array.array("Q")   # début de chaque ligne
+        self._horodatages = array.array("d")
+        self._niveaux = array.array("B")
+        self._cles = {}                      # "t:<tâche>", "n:<niveau>", "m:<mot>" -> numéros de ligne
+        self._fin = 0                        # premier octet non indexé
+        self._inode = None                   # fichier décrit par l'index
+
+    # --- Construction ---
+
+    def rattraper(self):
+        """Indexe les lignes ajoutées au journal depuis le dernier appel ; retourne leur nombre"""
+        with self._verrou:
+            return self._rattraper()
+
+    def _rattraper(self):
+        if not self._charge:
+            self._charger()
+        try:
+            stat = os.stat(self.chemin_journal)
+            taille, inode = stat.st_size, stat.st_ino
+        except FileNotFoundError:
+            taille, inode = 0, None
+        if taille < self._fin or self._inode not in (None, inode):
+            # Journal remplacé ou tronqué : l'index repart de zéro
+            self._reinitialiser()
+        self._inode = inode
+        if taille == self._fin:
+            return 0
+
+        indexees = 0
+        with open(self.chemin_journal, 'rb') as f:
+            f.seek(self._fin)
+            while self._fin < taille:
+                donnees = f.read(min(TAILLE_BLOC, taille - self._fin))
+                # Une ligne en cours d'écriture (sans fin de ligne) sera indexée au prochain passage
+                coupure = donnees.rfind(b"\n") + 1
+                if not coupure:
+                    # Ligne plus longue qu'un bloc : complétée jusqu'à sa fin
+                    donnees += f.readline()
+                    if not donnees.endswith(b"\n"):
+                        break
+                    coupure = len(donnees)
+                donnees = donnees[:coupure]
+                f.seek(self._fin + len(donnees))
+                indexees += self._indexer(donnees)
+        return indexees
+
+    def _indexer(self, donnees):
+        """Indexe un bloc de lignes complètes commençant à self._fin, puis l'enregistre"""
+        debut_lot = len(self._positions)
+        positions = array.array("Q")
+        horodatages = array.array("d")
+        niveaux = array.array("B")
+        cles = []
+        position = self._fin
+        for ligne in donnees.splitlines(keepends=True):
+            try:
+                enregistrement = json.loads(ligne)
+                horodatage = lire_date(enregistrement["ts"])
+            except (ValueError, KeyError, TypeError):
+                position += len(ligne)
+                continue  # ligne illisible : ignorée, sans bloquer la suite
+            numero = debut_lot + len(positions)
+            niveau = NIVEAUX.get(enregistrement.get("niveau"), 0)
+            positions.append(position)
+            horodatages.append(horodatage)
+            niveaux.append(niveau)
+            if enregistrement.get("tache"):
+                cles.append((f"t:{enregistrement['tache']}", numero))
+            if niveau >= NIVEAU_MOTS:
+                cles.append((f"n:{enregistrement['niveau']}", numero))
+                cles.extend((f"m:{mot}", numero) for mot in mots(enregistrement.get("message", "")))
+            position += len(ligne)
+
+        # Clés d'abord : après une interruption, les lignes sont réindexées et les
+        # numéros déjà présents dans les listes sont ignorés
+        os.makedirs(self.dossier, exist_ok=True)
+        if cles:
+            with open(self._chemins["cles"], 'a', encoding='utf-8') as f:
+                f.write("".join(f"{cle}\t{numero}\n" for cle, numero in cles))
+        for nom, valeurs in (("niveaux", niveaux), ("horodatages", horodatages), ("positions", positions)):
+            with open(self._chemins[nom], 'ab') as f:
+                valeurs.tofile(f)
+
+        self._positions.extend(positions)
+        self._horodatages.extend(horodatages)
+        self._niveaux.extend(niveaux)
+        for cle, numero in cles:
+            self._ajouter_cle(cle, numero)
+        self._fin = position
+        return len(positions)
+
+    def _ajouter_cle(self, cle, numero):
+        liste = self._cles.get(cle)
+        if liste is None:
+            liste = self._cles[cle] = array.array("I")
+        if not liste or liste[-1] < numero:
+            liste.append(numero)
+
+    def _reinitialiser(self):
+        for chemin in self._chemins.values():
+            try:
+                os.remove(chemin)
+            except FileNotFoundError:
+                pass
+        self._vider_memoire()
+
+    def _charger(self):
+        """Relit l'index enregistré ; les fichiers de longueurs différentes sont ramenés au plus court"""
+        self._charge = True
+        tableaux = {"positions": self._positions, "horodatages": self._horodatages, "niveaux": self._niveaux}
+        for nom, valeurs in tableaux.items():
+            try:
+                with open(self._chemins[nom], 'rb') as f:
+                    contenu = f.read()
+            except FileNotFoundError:
+                contenu = b""
+            valeurs.frombytes(contenu[:len(contenu) - len(contenu) % valeurs.itemsize])
+        nombre = min(len(valeurs) for valeurs in tableaux.values())
+        if not nombre:
+            self._reinitialiser()
+            return
+        for nom, valeurs in tableaux.items():
+            # Écriture interrompue : les fichiers sont ramenés à la même longueur
+            if os.path.getsize(self._chemins[nom]) != nombre * valeurs.itemsize:
+                del valeurs[nombre:]
+                os.truncate(self._chemins[nom], nombre * valeurs.itemsize)
+
+        # Fin de la dernière ligne indexée ; elle doit toujours correspondre au journal
+        try:
+            with open(self.chemin_journal, 'rb') as f:
+                f.seek(self._positions[-1])
+                ligne = f.readline()
+            valide = ligne.endswith(b"\n") and lire_date(json.loads(ligne)["ts"]) == self._horodatages[-1]
+        except (OSError, ValueError, KeyError, TypeError):
+            valide = False
+        if not valide:
+            self._reinitialiser()
+            return
+        self._fin = self._positions[-1] + len(ligne)
+
+        try:
+            with open(self._chemins["cles"], 'r', encoding='utf-8') as f:
+                for ligne_cle in f:
+                    cle, _, numero = ligne_cle.rstrip("\n").rpartition("\t")
+                    if cle and numero.isdigit() and int(numero) < nombre:
+                        self._ajouter_cle(cle, int(numero))
+        except FileNotFoundError:
+            pass
+
+    # --- Recherche ---
+
+    def rechercher(self, depuis=None, jusqua=None, tache=None, niveau=None, texte=None,
+                   limite=LIMITE_DEFAUT, curseur=None) -> dict:
+        """Lignes du journal, des plus récentes aux plus anciennes
+
+        `depuis` / `jusqua` : timestamps (bornes incluses) ; `niveau` : niveau minimal ;
+        `texte` : mots présents dans le message (casse et accents ignorés) ; `curseur` :
+        valeur "suivant" de la page précédente. Retourne {"entrees": [...], "suivant": ...},
+        "suivant" valant None quand il n'y a plus rien.
+        """
+        if niveau is not None and niveau not in NIVEAUX:
+            raise ValueError(f"Niveau inconnu : {niveau}")
+        limite = max(1, min(int(limite), LIMITE_MAX))
+        mots_recherches = mots(texte) if texte else set()
+        if texte and not mots_recherches:
+            raise ValueError("Le texte recherché doit contenir un mot d'au moins 3 caractères")
+        seuil = NIVEAUX[niveau] if niveau else 0
+
+        with self._verrou:
+            self._rattraper()
+            # Fichier ouvert sous le verrou : les positions valent pour ce fichier-là, même
+            # s'il est remplacé pendant la lecture
+            fichier = self._ouvrir()
+            if fichier is None:
+                return {"entrees": [], "suivant": None}
+            # Les horodatages croissent avec les lignes (à quelques millisecondes près entre threads)
+            debut = bisect.bisect_left(self._horodatages, depuis - 1) if depuis is not None else 0
+            fin = bisect.bisect_right(self._horodatages, jusqua + 1) if jusqua is not None else len(self._positions)
+            if curseur is not None:
+                fin = min(fin, int(curseur))
+
+            listes = []
+            if tache:
+                listes.append(self._cles.get(f"t:{tache}", ()))
+            if seuil >= NIVEAU_MOTS:
+                # Seules ces lignes ont leurs mots indexés
+                listes.append(sorted(numero for nom, code in NIVEAUX.items() if code >= seuil
+                                     for numero in self._cles.get(f"n:{nom}", ())))
+                listes.extend(self._cles.get(f"m:{mot}", ()) for mot in mots_recherches)
+            candidats = self._candidats(listes, debut, fin)
+            niveaux = self._niveaux
+            positions = self._positions
+
+        entrees = []
+        suivant = None
+        with fichier as f:
+            for examines, numero in enumerate(candidats):
+                if len(entrees) == limite or examines == EXAMEN_MAX:
+                    suivant = str(numero + 1)
+                    break
+                if niveaux[numero] < seuil:
+                    continue
+                f.seek(positions[numero])
+                try:
+                    enregistrement = json.loads(f.readline())
+                    horodatage = lire_date(enregistrement["ts"])
+                except (ValueError, KeyError, TypeError):
+                    # Ligne qui ne correspond plus à l'index : la suite reprendra après réindexation
+                    suivant = str(numero + 1)
+                    break
+                if (depuis is not None and horodatage < depuis) or (jusqua is not None and horodatage > jusqua):
+                    continue
+                if tache and enregistrement.get("tache") != tache:
+                    continue
+                if mots_recherches and not mots_recherches <= mots(enregistrement.get("message", "")):
+                    continue
+                entrees.append(enregistrement)
+        return {"entrees": entrees, "suivant": suivant}
+
+    def _ouvrir(self):
+        """Journal indexé, ouvert ; réindexé d'abord s'il vient d'être remplacé"""
+        for essai in range(2):
+            try:
+                fichier = open(self.chemin_journal, 'rb')
+            except FileNotFoundError:
+                return None
+            if essai or os.fstat(fichier.fileno()).st_ino == self._inode:
+                return fichier
+            fichier.close()
+            self._rattraper()
+
+    @staticmethod
+    def _candidats(listes, debut, fin):
+        """Numéros de ligne de [debut, fin), du plus grand au plus petit, présents dans toutes les listes"""
+        if not listes:
+            return range(fin - 1, debut - 1, -1)
+        listes = sorted(listes, key=len)
+        plus_courte = listes[0]
+        bas = bisect.bisect_left(plus_courte, debut)
+        haut = bisect.bisect_left(plus_courte, fin)
+
+        def present(liste, numero):
+            i = bisect.bisect_left(liste, numero)
+            return i < len(liste) and liste[i] == numero
+
+        return (plus_courte[i] for i in range(haut - 1, bas - 1, -1)
+                if all(present(liste, plus_courte[i]) for liste in listes[1:]))
+
+    def statistiques(self) -> dict:
+        with self._verrou:
+            return {"lignes": len(self._positions), "cles": len(self._cles), "octets_indexes": self._fin}
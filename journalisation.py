@@ -0,0 +1,168 @@
+"""
+Journal d'activité en arrière-plan
+Les appels ne font que déposer un enregistrement dans une file ; un thread les écrit
+par lots dans le journal lisible (journal_activite.txt) et dans sa version structurée
+(journal_activite.jsonl : niveau, tâche, durée, champs libres).
+"""
+
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DEBUG = "debug"
+INFO = "info"
+AVERTISSEMENT = "avertissement"
+ERREUR = "erreur"
+NIVEAUX = {DEBUG: 10, INFO: 20, AVERTISSEMENT: 30, ERREUR: 40}
+
+# Attente maximale avant d'écrire un lot (les enregistrements arrivés entre-temps sont groupés)
+INTERVALLE_ECRITURE = 0.2
+
+
+class Enregistrement:
+    __slots__ = ("horodatage", "niveau", "message", "tache", "duree", "champs", "thread")
+
+    def __init__(self, horodatage, niveau, message, tache, duree, champs, thread):
+        self.horodatage = horodatage
+        self.niveau = niveau
+        self.message = message
+        self.tache = tache
+        self.duree = duree
+        self.champs = champs
+        self.thread = thread
+
+    @property
+    def date(self):
+        return datetime.fromtimestamp(self.horodatage, TIMEZONE_FRANCE)
+
+    def ligne(self):
+        """Ligne du journal lisible, sans retour à la ligne"""
+        return f"[{self.date.strftime('%Y-%m-%d %H:%M:%S')}] {self.message}"
+
+    def en_dict(self):
+        donnees = {
+            "ts": self.date.isoformat(timespec="milliseconds"),
+            "niveau": self.niveau,
+            "message": self.message,
+        }
+        if self.tache:
+            donnees["tache"] = self.tache
+        if self.duree is not None:
+            donnees["duree_s"] = round(self.duree, 3)
+        if self.champs:
+            donnees["champs"] = self.champs
+        donnees["thread"] = self.thread
+        return donnees
+
+
+class Journal:
+    """File d'enregistrements vidée par lots dans le journal texte et le journal JSONL"""
+
+    def __init__(self, chemin_texte, chemin_jsonl=None, niveau_min=INFO, apres_ecriture=None,
+                 echo=print, intervalle=INTERVALLE_ECRITURE, avant_ecriture=None):
+        self.chemin_texte = chemin_texte
+        self.chemin_jsonl = chemin_jsonl
+        self.niveau_min = niveau_min
+        # Appelé par le thread d'écriture avec chaque lot écrit (bilan, synchro GitHub...)
+        self.apres_ecriture = apres_ecriture
+        # Appelé par le thread d'écriture avant chaque lot (rotation du journal texte)
+        self.avant_ecriture = avant_ecriture
+        self.echo = echo
+        self.intervalle = intervalle
+
+        self._file = queue.SimpleQueue()
+        self._condition = threading.Condition()
+        self._deposes = 0
+        self._ecrits = 0
+        self._thread = None
+        self._verrou_demarrage = threading.Lock()
+
+    @property
+    def niveau_min(self):
+        return self._niveau_min
+
+    @niveau_min.setter
+    def niveau_min(self, niveau):
+        if niveau not in NIVEAUX:
+            raise ValueError(f"Niveau inconnu : {niveau}")
+        self._niveau_min = niveau
+        self._seuil = NIVEAUX[niveau]
+
+    def actif_pour(self, niveau):
+        return NIVEAUX[niveau] >= self._seuil
+
+    # --- API publique ---
+
+    def ecrire(self, message, niveau=INFO, tache=None, duree=None, **champs):
+        """Dépose un enregistrement ; ne fait aucune entrée/sortie dans le thread appelant"""
+        if NIVEAUX[niveau] < self._seuil:
+            return
+        if self._thread is None:
+            self._demarrer()
+        with self._condition:
+            self._deposes += 1
+        self._file.put(Enregistrement(time.time(), niveau, message, tache, duree, champs,
+                                      threading.current_thread().name))
+
+    def vider(self, timeout=5):
+        """Attend l'écriture de tout ce qui a été déposé ; False si le délai est dépassé"""
+        fin = time.monotonic() + timeout
+        with self._condition:
+            cible = self._deposes
+            while self._ecrits < cible:
+                reste = fin - time.monotonic()
+                if reste <= 0:
+                    return False
+                self._condition.wait(reste)
+            return True
+
+    # --- Thread d'écriture ---
+
+    def _demarrer(self):
+        with self._verrou_demarrage:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, name="journal", daemon=True)
+                self._thread.start()
+
+    def _lot(self):
+        """Premier enregistrement disponible, puis tout ce qui arrive pendant `intervalle`"""
+        lot = [self._file.get()]
+        fin = time.monotonic() + self.intervalle
+        while True:
+            reste = fin - time.monotonic()
+            try:
+                lot.append(self._file.get(timeout=reste) if reste > 0 else self._file.get_nowait())
+            except queue.Empty:
+                return lot
+
+    def _boucle(self):
+        while True:
+            lot = self._lot()
+            try:
+                self._ecrire_lot(lot)
+            except Exception as e:
+                print(f"Erreur écriture journal: {e}")
+            finally:
+                with self._condition:
+                    self._ecrits += len(lot)
+                    self._condition.notify_all()
+
+    def _ecrire_lot(self, lot):
+        if self.avant_ecriture:
+            self.avant_ecriture(lot)
+        lignes = [enregistrement.ligne() + "\n" for enregistrement in lot]
+        # Un seul write par lot : les lignes de threads différents ne se mélangent jamais
+        with open(self.chemin_texte, 'a', encoding='utf-8') as f:
+            f.write("".join(lignes))
+        if self.chemin_jsonl:
+            with open(self.chemin_jsonl, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(e.en_dict(), ensure_ascii=False, default=str) + "\n" for e in lot))
+        if self.echo:
+            self.echo("".join(lignes).rstrip("\n"))
+        if self.apres_ecriture:
+            self.apres_ecriture(lot)
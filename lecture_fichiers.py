@@ -0,0 +1,145 @@
+"""
+Lecture de la fin des fichiers texte (journal, veille)
+Lecture depuis la fin du fichier, sans décoder tout son contenu
+"""
+
+import os
+import threading
+
+TAILLE_BLOC = 8192
+# Nombre maximal de débuts de ligne mémorisés par fichier
+LIGNES_INDEXEES = 2000
+# Octets relus avant la partie ajoutée pour vérifier que le fichier n'a pas été réécrit
+TAILLE_SIGNATURE = 32
+
+
+def _debut_caractere(donnees: bytes) -> int:
+    """Position du premier octet qui n'est pas la suite d'un caractère UTF-8"""
+    position = 0
+    while position < len(donnees) and position < 4 and (donnees[position] & 0xC0) == 0x80:
+        position += 1
+    return position
+
+
+class IndexFin:
+    """Positions des dernières lignes de chaque fichier, complétées au fil des ajouts"""
+
+    def __init__(self, lignes_max=LIGNES_INDEXEES):
+        self.lignes_max = lignes_max
+        self._verrou = threading.Lock()
+        # chemin -> (inode, taille indexée, signature, positions des débuts de ligne)
+        self._index = {}
+
+    @staticmethod
+    def _signature(f, taille):
+        f.seek(max(0, taille - TAILLE_SIGNATURE))
+        return f.read(min(taille, TAILLE_SIGNATURE))
+
+    def _indexer(self, f, debut, fin, positions):
+        """Ajoute les débuts de ligne trouvés entre debut et fin"""
+        f.seek(debut)
+        position = debut
+        while position < fin:
+            bloc = f.read(min(TAILLE_BLOC, fin - position))
+            if not bloc:
+                break
+            i = bloc.find(b"\n")
+            while i != -1:
+                if position + i + 1 < fin:
+                    positions.append(position + i + 1)
+                i = bloc.find(b"\n", i + 1)
+            position += len(bloc)
+        if len(positions) > self.lignes_max:
+            del positions[:len(positions) - self.lignes_max]
+
+    def _reconstruire(self, f, taille):
+        """Remonte depuis la fin jusqu'à trouver lignes_max débuts de ligne"""
+        positions = []
+        fin = taille
+        while fin > 0 and len(positions) <= self.lignes_max:
+            debut = max(0, fin - TAILLE_BLOC)
+            f.seek(debut)
+            bloc = f.read(fin - debut)
+            trouvees = []
+            i = bloc.find(b"\n")
+            while i != -1:
+                if debut + i + 1 < taille:
+                    trouvees.append(debut + i + 1)
+                i = bloc.find(b"\n", i + 1)
+            positions[:0] = trouvees
+            fin = debut
+        if fin == 0:
+            positions.insert(0, 0)
+        if len(positions) > self.lignes_max:
+            del positions[:len(positions) - self.lignes_max]
+        return positions
+
+    def debut_lignes(self, chemin, f, nb_lignes):
+        """Position du début des nb_lignes dernières lignes du fichier ouvert f"""
+        stat = os.fstat(f.fileno())
+        with self._verrou:
+            entree = self._index.get(chemin)
+            if (entree and entree[0] == stat.st_ino and entree[1] <= stat.st_size
+                    and self._signature(f, entree[1]) == entree[2]):
+                _, taille_indexee, _, positions = entree
+                if taille_indexee < stat.st_size:
+                    # Fichier en ajout seul : on n'indexe que la partie nouvelle
+                    if taille_indexee and (not positions or positions[-1] != taille_indexee):
+                        f.seek(taille_indexee - 1)
+                        if f.read(1) == b"\n":
+                            positions.append(taille_indexee)
+                    self._indexer(f, taille_indexee, stat.st_size, positions)
+            else:
+                positions = self._reconstruire(f, stat.st_size)
+            signature = self._signature(f, stat.st_size)
+            self._index[chemin] = (stat.st_ino, stat.st_size, signature, positions)
+
+            if nb_lignes <= len(positions):
+                return positions[-nb_lignes]
+            if positions and positions[0] == 0:
+                return 0
+        # Plus de lignes demandées que l'index n'en garde : lecture directe
+        return self._reconstruire_jusqua(f, stat.st_size, nb_lignes)
+
+    def _reconstruire_jusqua(self, f, taille, nb_lignes):
+        index = IndexFin(nb_lignes)
+        positions = index._reconstruire(f, taille)
+        return positions[-nb_lignes] if len(positions) >= nb_lignes else 0
+
+    def oublier(self, chemin=None):
+        with self._verrou:
+            if chemin is None:
+                self._index.clear()
+            else:
+                self._index.pop(chemin, None)
+
+
+index_fin = IndexFin()
+
+
+def lire_fin(chemin, octets=None, lignes=None):
+    """Retourne la fin d'un fichier : les `lignes` dernières lignes ou les `octets` derniers octets
+
+    Si les deux limites sont données, la plus courte l'emporte et le texte commence
+    sur une ligne entière (la ligne coupée par la limite en octets est écartée). Le
+    texte retourné commence toujours sur un caractère UTF-8 complet.
+    """
+    try:
+        with open(chemin, 'rb') as f:
+            taille = os.fstat(f.fileno()).st_size
+            debut = 0
+            if lignes is not None:
+                debut = index_fin.debut_lignes(chemin, f, lignes) if lignes > 0 else taille
+            coupee = False
+            if octets is not None and taille - octets > debut:
+                debut = taille - octets
+                coupee = lignes is not None
+            # On relit l'octet précédent pour savoir si debut tombe sur un début de ligne
+            f.seek(debut - 1 if coupee else debut)
+            donnees = f.read(taille - debut + coupee)
+    except FileNotFoundError:
+        return ""
+    if coupee:
+        fin_ligne = donnees.find(b"\n")
+        return donnees[fin_ligne + 1:].decode('utf-8', errors='replace') if fin_ligne != -1 else ""
+    return donnees[_debut_caractere(donnees):].decode('utf-8', errors='replace')
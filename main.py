@@ -1,23 +1,37 @@
-import anthropic
+import atexit
 import os
-import urllib.request
-import urllib.parse
 import json
 import re
-import smtplib
-import base64
 import threading
 import time
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import urllib.parse
+from html import escape
+from string import Template
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from annonces import DeltaVeille, StockAnnonces, normaliser_annonce
+from bilan_jour import BilanJournalier
+from boite_envoi import BoiteEnvoi
+from cache_rendu import CacheRendu, choisir_encodage, etag_correspond
+from client_http import client_http
+from evenements import Diffuseur
+from index_journal import LIMITE_DEFAUT, IndexJournal, lire_date
+from journalisation import AVERTISSEMENT, DEBUG, ERREUR, INFO, Journal
+from metriques import mesurer, metriques
+from notation import ClientAnthropic, ClientLocal, NotationOpportunites, medianes_communes
+from synchro_github import SynchroGitHub
+from planificateur import Planificateur
+from rotation import FichierSegmente
+from scraper_immo import ZONES, generer_rapport_biens, lancer_veille_complete
+from travaux import FileTravaux, travail_courant
 
 # === CONFIGURATION ===
 TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", "")
 GITHUB_REPO = "laetony-cmd/axi-agences"
+GITHUB_BRANCHE = os.environ.get("GITHUB_BRANCHE", "main")
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
 GMAIL_USER = os.environ.get("GMAIL_USER", "")
 GMAIL_APP_PASSWORD = os.environ.get("GMAIL_APP_PASSWORD", "")
@@ -29,6 +43,13 @@ DESTINATAIRES_RAPPORT = [
     "laetony@gmail.com",  # Ludo
 ]
 
+# Destinataires propres à chaque agence, en plus des destinataires communs
+# (DESTINATAIRES_VERGT="a@exemple.fr,b@exemple.fr")
+DESTINATAIRES_AGENCES = {
+    agence: [a.strip() for a in os.environ.get(f"DESTINATAIRES_{agence.upper()}", "").split(",") if a.strip()]
+    for agence in ZONES
+}
+
 # Fichiers à sauvegarder sur GitHub
 FICHIERS_A_SAUVEGARDER = [
     "rapport_quotidien.txt",
@@ -43,19 +64,61 @@ FICHIERS_A_SAUVEGARDER = [
 def heure_france():
     return datetime.now(TIMEZONE_FRANCE)
 
-def log_activite(message):
-    """Log une activité dans le journal"""
-    timestamp = heure_france().strftime("%Y-%m-%d %H:%M:%S")
-    ligne = f"[{timestamp}] {message}\n"
-    ajouter_fichier("journal_activite.txt", ligne)
-    print(ligne.strip())
+# Agrégats du jour (tâches, erreurs, veilles, opportunités) pour le rapport du soir
+bilan_jour = BilanJournalier()
+
+# Événements poussés en direct au tableau de bord (/events) : journal, veille, travaux
+diffuseur = Diffuseur()
+
+def _apres_ecriture_journal(enregistrements):
+    """Lot écrit par le thread du journal : index, bilan du jour, tableau de bord et une seule sauvegarde GitHub"""
+    index_journal.rattraper()
+    for enregistrement in enregistrements:
+        if enregistrement.niveau == DEBUG:
+            continue
+        bilan_jour.noter_journal(enregistrement.date, enregistrement.message, enregistrement.niveau)
+    diffuseur.publier("journal", {"lignes": [enregistrement.ligne() for enregistrement in enregistrements]})
+    sauvegarder_sur_github("journal_activite.txt")
+
+def _sauvegarder_segments(fichiers):
+    for nom_fichier in fichiers:
+        sauvegarder_sur_github(nom_fichier)
+
+# Journal et veille : scellés chaque jour (ou au-delà d'une taille) en segments gzip
+# dans archives/ ; seul le fichier actif est renvoyé à GitHub à chaque écriture
+fichiers_segmentes = {
+    nom: FichierSegmente(nom, apres_scellement=_sauvegarder_segments)
+    for nom in ("journal_activite.txt", "veille_concurrence.txt")
+}
+
+# Journal écrit par lots en arrière-plan : texte lisible et JSONL structuré. Le JSONL
+# (local, non sauvegardé sur GitHub) n'est jamais scellé : /journal cherche dans tout
+# l'historique grâce à son index
+journal = Journal(
+    "journal_activite.txt", "journal_activite.jsonl",
+    niveau_min=os.environ.get("AXI_NIVEAU_JOURNAL", INFO),
+    avant_ecriture=lambda lot: fichiers_segmentes["journal_activite.txt"].preparer(),
+    apres_ecriture=_apres_ecriture_journal
+)
 
-def lire_fichier(chemin):
-    try:
-        with open(chemin, 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return ""
+# Index annexe du journal structuré (/journal), rattrapé après chaque lot écrit
+index_journal = IndexJournal("journal_activite.jsonl")
+
+def log_activite(message, niveau=None, tache=None, duree=None, **champs):
+    """Log une activité dans le journal (niveau déduit du message si absent)"""
+    if niveau is None:
+        niveau = ERREUR if "erreur" in message.lower() else INFO
+    if tache is None:
+        travail = travail_courant()
+        tache = travail.nom if travail else None
+    journal.ecrire(message, niveau, tache=tache, duree=duree, **champs)
+
+def tracer_appel_lent(operation, duree, erreur):
+    """Appels plus lents que AXI_SEUIL_APPEL_LENT, tracés dans le journal structuré"""
+    log_activite(f"🐢 Appel lent : {operation} en {duree:.2f} s" + (f" ({erreur})" if erreur else ""),
+                 niveau=AVERTISSEMENT, operation=operation, duree=duree)
+
+metriques.tracer = tracer_appel_lent
 
 def ecrire_fichier(chemin, contenu):
     with open(chemin, 'w', encoding='utf-8') as f:
@@ -65,6 +128,8 @@ def ecrire_fichier(chemin, contenu):
         sauvegarder_sur_github(nom_fichier)
 
 def ajouter_fichier(chemin, contenu):
+    if chemin in fichiers_segmentes:
+        fichiers_segmentes[chemin].preparer()
     with open(chemin, 'a', encoding='utf-8') as f:
         f.write(contenu)
     nom_fichier = os.path.basename(chemin)
@@ -73,117 +138,252 @@ def ajouter_fichier(chemin, contenu):
 
 # === GITHUB ===
 
+# Les écritures marquent les fichiers ; un thread les pousse par commits groupés
+synchro_github = SynchroGitHub(
+    GITHUB_TOKEN, GITHUB_REPO, GITHUB_BRANCHE,
+    journaliser=lambda message: log_activite(message)
+)
+
+@mesurer("sauvegarder_sur_github")
 def sauvegarder_sur_github(nom_fichier):
+    """Planifie la sauvegarde d'un fichier (commit groupé en arrière-plan)"""
     if not GITHUB_TOKEN:
         return False
-    try:
-        contenu = lire_fichier(nom_fichier)
-        if not contenu:
-            return False
-        
-        content_b64 = base64.b64encode(contenu.encode('utf-8')).decode('utf-8')
-        url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{nom_fichier}"
-        
-        # Récupérer SHA existant
-        req_get = urllib.request.Request(url)
-        req_get.add_header('Authorization', f'token {GITHUB_TOKEN}')
-        sha = None
-        try:
-            with urllib.request.urlopen(req_get, timeout=10) as response:
-                data = json.loads(response.read().decode())
-                sha = data.get('sha')
-        except:
-            pass
-        
-        # Push
-        push_data = {
-            "message": f"🔄 {nom_fichier} - {heure_france().strftime('%Y-%m-%d %H:%M')}",
-            "content": content_b64
-        }
-        if sha:
-            push_data["sha"] = sha
-        
-        req_put = urllib.request.Request(url, data=json.dumps(push_data).encode(), method='PUT')
-        req_put.add_header('Authorization', f'token {GITHUB_TOKEN}')
-        req_put.add_header('Content-Type', 'application/json')
-        
-        with urllib.request.urlopen(req_put, timeout=10) as response:
-            return response.status == 200 or response.status == 201
-    except Exception as e:
-        log_activite(f"Erreur GitHub: {e}")
-        return False
+    synchro_github.marquer(nom_fichier)
+    return True
 
 # === EMAIL ===
 
-def envoyer_email(destinataires, sujet, contenu_html):
-    """Envoie un email à plusieurs destinataires"""
+# Les emails passent par une boîte d'envoi sur disque : un thread les envoie sur une
+# connexion SMTP gardée ouverte et retente plus tard en cas d'échec
+boite_envoi = BoiteEnvoi(
+    GMAIL_USER, GMAIL_APP_PASSWORD,
+    hote=os.environ.get("SMTP_HOTE", "smtp.gmail.com"),
+    port=int(os.environ.get("SMTP_PORT", 465)),
+    journaliser=lambda message: log_activite(message)
+)
+
+@mesurer("envoyer_email", echec=lambda identifiant: identifiant is None)
+def envoyer_email(destinataires, sujet, contenu_html, individuel=False):
+    """Dépose un email dans la boîte d'envoi ; retourne son identifiant (suivi sur /emails)"""
     if not GMAIL_USER or not GMAIL_APP_PASSWORD:
         log_activite("Email non configuré")
-        return False
+        return None
     
-    try:
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = sujet
-        msg['From'] = f"Axi Agences <{GMAIL_USER}>"
-        msg['To'] = ", ".join(destinataires)
-        
-        msg.attach(MIMEText(contenu_html, 'html'))
-        
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(GMAIL_USER, GMAIL_APP_PASSWORD)
-            server.sendmail(GMAIL_USER, destinataires, msg.as_string())
-        
-        log_activite(f"Email envoyé à {destinataires}")
-        return True
-    except Exception as e:
-        log_activite(f"Erreur email: {e}")
-        return False
+    identifiant = boite_envoi.deposer(destinataires, sujet, contenu_html, individuel=individuel)
+    log_activite(f"Email « {sujet} » en file pour {len(destinataires)} destinataire(s)")
+    return identifiant
 
 # === TÂCHES AUTOMATIQUES ===
 
-def tache_veille_leboncoin():
-    """Scrape LeBonCoin pour trouver des particuliers qui vendent"""
-    log_activite("🔍 Veille LeBonCoin - Recherche de mandats potentiels")
+# Annonces collectées par la veille (SQLite indexé) et agrégats de marché
+stock_annonces = StockAnnonces()
+
+# Les modules à base de NumPy (analyse, doublons) ne sont importés qu'à leur premier
+# usage : leur chargement ne retarde pas l'ouverture du port au démarrage
+_moteur_analyse = None
+_verrou_moteur_analyse = threading.Lock()
+
+def moteur_analyse():
+    global _moteur_analyse
+    with _verrou_moteur_analyse:
+        if _moteur_analyse is None:
+            from analyse_marche import MoteurAnalyse
+            _moteur_analyse = MoteurAnalyse(stock_annonces)
+        return _moteur_analyse
+
+# Notation des biens nouveaux : un lot de requêtes par jour, notes gardées par empreinte
+# d'annonce ; sans clé d'API, des règles locales tiennent lieu de modèle
+notation_opportunites = NotationOpportunites(
+    ClientAnthropic(ANTHROPIC_API_KEY) if ANTHROPIC_API_KEY else ClientLocal(),
+    journaliser=lambda message: log_activite(message)
+)
+
+# Score à partir duquel un bien noté figure dans les opportunités
+SCORE_OPPORTUNITE_MIN = 40
+
+def tache_veille():
+    """Veille LeBonCoin, SeLoger et Bien'ici : seules les nouveautés sont rapportées"""
+    log_activite("🔍 Veille des portails - Recherche de mandats potentiels")
     
-    # Communes à surveiller
-    communes = ["vergt", "le-bugue", "perigueux", "bergerac", "sarlat"]
-    opportunites = []
+    if not APIFY_TOKEN:
+        log_activite("Veille : APIFY_TOKEN non configuré")
+        return None
     
-    for commune in communes:
-        try:
-            # Recherche maisons à vendre par particuliers
-            url = f"https://www.leboncoin.fr/recherche?category=9&locations={commune}&owner_type=private"
-            req = urllib.request.Request(url)
-            req.add_header('User-Agent', 'Mozilla/5.0')
-            
-            # Note: LeBonCoin bloque le scraping direct, on simule pour l'exemple
-            # En production, utiliser une API ou un service de scraping
-            opportunites.append(f"[{commune.upper()}] Recherche effectuée")
-            
-        except Exception as e:
-            log_activite(f"Erreur veille {commune}: {e}")
+    debut_veille = heure_france()
+    delta = DeltaVeille()
+    
+    def enregistrer_run(biens):
+        # Le dataset de chaque run va au stock par lots, sans liste de toute la veille
+        return stock_annonces.appliquer_lots(
+            (normaliser_annonce(bien, zones=ZONES, vue_le=debut_veille) for bien in biens if "error" not in bien),
+            delta
+        )
+    
+    resultats = lancer_veille_complete(traiter=enregistrer_run)
+    
+    # Un portail dont un run a échoué n'est pas parcouru en entier :
+    # ses annonces absentes ne sont pas considérées comme retirées
+    portails = {run["portail"] for runs in resultats["zones"].values() for run in runs.values()}
+    portails_complets = set(portails)
+    for zone, runs in resultats["zones"].items():
+        for run in runs.values():
+            if run.get("error") or run.get("status") != "SUCCEEDED":
+                portails_complets.discard(run["portail"])
+                log_activite(f"Erreur veille {run['portail']}/{zone}: {run.get('error', run.get('status'))}")
     
-    # Sauvegarder les résultats
-    timestamp = heure_france().strftime("%Y-%m-%d %H:%M")
-    rapport = f"\n=== VEILLE {timestamp} ===\n"
-    rapport += "\n".join(opportunites) + "\n"
+    stock_annonces.marquer_retirees(portails_complets, debut_veille, delta)
+    log_activite(
+        f"🔍 Veille terminée en {resultats['duree_s']:.0f} s : {len(delta.nouvelles)} nouvelles, "
+        f"{len(delta.modifiees)} modifiées, {len(delta.retirees)} retirées "
+        f"({delta.suivies} annonces sur {len(portails)} portails)"
+    )
+    
+    # Seul le delta est écrit : la veille ne répète plus les annonces déjà connues
+    rapport = f"\n=== VEILLE {resultats['timestamp']} ===\n"
+    rapport += formater_delta(delta) if not delta.vide else f"Aucun changement ({delta.suivies} annonces suivies)\n"
     ajouter_fichier("veille_concurrence.txt", rapport)
+    diffuseur.publier("veille", {"texte": rapport})
+    
+    par_zone = opportunites_par_zone(delta, biens_nouveaux(delta, debut_veille))
+    if par_zone:
+        ajouter_fichier("opportunites.txt",
+                        f"\n=== {resultats['timestamp']} ===\n{formater_opportunites(par_zone)}")
+    bilan_jour.noter_veille(resultats["duree_s"], len(delta.nouvelles), len(delta.modifiees),
+                            len(delta.retirees), delta.suivies, par_zone)
     
-    return opportunites
+    return delta
+
+def _lien(annonce):
+    return f" | {annonce.url}" if annonce.url else ""
+
+def formater_delta(delta):
+    """Texte des changements d'une veille : nouvelles annonces, prix modifiés, retraits"""
+    lignes = []
+    if delta.nouvelles:
+        lignes.append(f"🆕 {len(delta.nouvelles)} nouvelle(s) annonce(s)")
+        lignes.append(generer_rapport_biens(delta.nouvelles))
+    if delta.modifiees:
+        lignes.append(f"✏️ {len(delta.modifiees)} annonce(s) modifiée(s)")
+        for annonce, ancien_prix in delta.modifiees:
+            lignes.append(f"   {annonce.titre} ({annonce.commune or annonce.code_postal}) : "
+                          f"{ancien_prix or '?'} → {annonce.prix or '?'} €{_lien(annonce)}")
+    if delta.retirees:
+        lignes.append(f"❌ {len(delta.retirees)} annonce(s) retirée(s)")
+        for annonce in delta.retirees:
+            lignes.append(f"   {annonce.titre} ({annonce.commune or annonce.code_postal}){_lien(annonce)}")
+    return "\n".join(lignes) + "\n"
+
+def biens_nouveaux(delta, debut_veille):
+    """Biens réellement nouveaux : un bien déjà publié sur un autre portail
+    (ou par une autre agence) n'est pas une opportunité"""
+    if not delta.nouvelles:
+        return []
+    return biens_apparus_depuis(debut_veille, {annonce.commune for annonce in delta.nouvelles})
+
+def biens_apparus_depuis(debut, communes):
+    """Biens canoniques (doublons regroupés) apparus depuis `debut` dans ces communes"""
+    from doublons import regrouper_doublons
+    debut = debut.replace(microsecond=0)  # le stock conserve les dates à la seconde
+    nouvelles = stock_annonces.rechercher(communes=communes, depuis=debut, actives=True)
+    if not nouvelles:
+        return []
+    # Les annonces plus anciennes des mêmes communes restent comparées : un bien déjà
+    # publié ailleurs n'est pas nouveau
+    anciennes = stock_annonces.rechercher(communes=communes, avant=debut, actives=True)
+    return [bien for bien in regrouper_doublons(nouvelles + anciennes) if bien.premiere_vue >= debut]
+
+def opportunites_par_zone(delta, biens=None):
+    """Nouveaux biens (une ligne par bien, liens de chaque portail) et baisses de prix, par zone"""
+    par_zone = {}
+    if biens is None:
+        from doublons import BienCanonique
+        biens = [BienCanonique(annonce=annonce, annonces=[annonce]) for annonce in delta.nouvelles]
+    for bien in biens:
+        annonce = bien.annonce
+        liens = " | ".join(f"{portail}: {' '.join(urls)}" for portail, urls in sorted(bien.liens.items()))
+        par_zone.setdefault(annonce.zone or "hors zone", []).append(
+            f"🆕 {annonce.titre} - {annonce.prix or '?'} € - {annonce.commune or annonce.code_postal}"
+            + (f" | {liens}" if liens else ""))
+    for annonce, ancien_prix in delta.modifiees:
+        if annonce.prix and ancien_prix and annonce.prix < ancien_prix:
+            par_zone.setdefault(annonce.zone or "hors zone", []).append(
+                f"📉 {annonce.titre} - {ancien_prix} → {annonce.prix} € - "
+                f"{annonce.commune or annonce.code_postal}{_lien(annonce)}")
+    return par_zone
+
+def formater_opportunites(par_zone):
+    return "".join(
+        f"[{zone.upper()}]\n" + "\n".join(lignes) + "\n" for zone, lignes in sorted(par_zone.items())
+    )
+
+def tache_notation_opportunites():
+    """Note les biens apparus dans la journée (particulier, vente motivée, prix sous la médiane)"""
+    log_activite("⭐ Notation des opportunités")
+    
+    debut = heure_france().replace(hour=0, minute=0, second=0, microsecond=0)
+    nouvelles = stock_annonces.rechercher(depuis=debut, actives=True)
+    if not nouvelles:
+        log_activite("⭐ Notation : aucune annonce nouvelle aujourd'hui")
+        return []
+    
+    # Un bien publié sur plusieurs portails n'est noté qu'une fois
+    biens = biens_apparus_depuis(debut, {annonce.commune for annonce in nouvelles})
+    medianes = medianes_communes(moteur_analyse().analyser())
+    notes = notation_opportunites.noter([bien.annonce for bien in biens], medianes)
+    retenues = [note for note in notes if note.score >= SCORE_OPPORTUNITE_MIN]
+    
+    bilan_jour.noter_notation(note.en_dict() for note in retenues)
+    if retenues:
+        ajouter_fichier("opportunites.txt", f"\n=== NOTATION {heure_france().strftime('%Y-%m-%d %H:%M')} ===\n"
+                        + "\n".join(formater_note(note.en_dict()) for note in retenues) + "\n")
+    log_activite(f"⭐ Notation : {len(notes)}/{len(biens)} biens notés, "
+                 f"{len(retenues)} opportunité(s) (score ≥ {SCORE_OPPORTUNITE_MIN})")
+    
+    return notes
+
+def formater_note(note):
+    criteres = [libelle for cle, libelle in (("particulier", "particulier"), ("vente_motivee", "vente motivée"),
+                                             ("sous_evaluee", "sous la médiane")) if note[cle]]
+    ecart = f" ({note['ecart_mediane']:+.0%} / médiane)" if note["ecart_mediane"] is not None else ""
+    return (f"⭐ {note['score']} {note['titre']} - {note['prix'] or '?'} € - {note['commune']}{ecart}"
+            f" [{', '.join(criteres) or 'aucun critère'}]" + (f" | {note['url']}" if note["url"] else ""))
 
 def tache_analyse_marche():
     """Analyse les prix du marché immobilier local"""
     log_activite("📊 Analyse du marché immobilier")
     
-    # Données simulées (à remplacer par vraies sources)
-    analyse = {
-        "vergt": {"prix_m2_moyen": 1850, "tendance": "+2%"},
-        "le_bugue": {"prix_m2_moyen": 2100, "tendance": "+1%"},
-        "perigueux": {"prix_m2_moyen": 1650, "tendance": "stable"},
-    }
+    analyse = moteur_analyse().analyser()
+    log_activite(f"📊 Analyse : {len(analyse['communes'])} communes, {len(analyse['zones'])} zones")
     
     return analyse
 
+def formater_analyse_html(analyse, communes_max=15):
+    """Tableau des prix au m² (30 jours) par zone puis pour les communes les plus actives"""
+    if not analyse or not (analyse["zones"] or analyse["communes"]):
+        return "<p>Pas encore assez d'annonces pour analyser le marché</p>"
+    
+    communes = sorted(
+        analyse["communes"].items(),
+        key=lambda element: element[1].get("30j", {}).get("volume", 0), reverse=True
+    )[:communes_max]
+    lignes = []
+    for nom, stats in [(f"Zone {zone}", stats) for zone, stats in sorted(analyse["zones"].items())] + communes:
+        mois = stats.get("30j")
+        trimestre = stats.get("90j", {})
+        if not mois:
+            continue
+        lignes.append(
+            f"<tr><td>{escape(nom)}</td><td>{mois['volume']}</td><td>{mois['prix_m2_median']} €</td>"
+            f"<td>{mois['prix_m2_q1']} – {mois['prix_m2_q3']} €</td>"
+            f"<td>{escape(str(mois['tendance']))}</td>"
+            f"<td>{escape(str(trimestre.get('tendance', 'n/d')))}</td></tr>"
+        )
+    return (
+        "<table><tr><th></th><th>Annonces 30j</th><th>Médiane €/m²</th><th>Q1 – Q3</th>"
+        "<th>Tendance 30j</th><th>Tendance 90j</th></tr>" + "".join(lignes) + "</table>"
+    )
+
 def tache_verification_annonces():
     """Vérifie que les annonces des agences sont bien en ligne"""
     log_activite("✅ Vérification des annonces en ligne")
@@ -197,57 +397,52 @@ def tache_verification_annonces():
     
     return resultats
 
-def generer_rapport_quotidien():
-    """Génère le rapport quotidien complet"""
-    log_activite("📝 Génération du rapport quotidien")
-    
-    date = heure_france().strftime("%d/%m/%Y")
-    
-    # Collecter les données
-    veille = lire_fichier("veille_concurrence.txt")[-2000:]  # Derniers 2000 chars
-    opportunites = lire_fichier("opportunites.txt")[-1000:]
-    journal = lire_fichier("journal_activite.txt")[-3000:]
-    
-    # Construire le rapport HTML
-    html = f"""
+# Gabarit du rapport, compilé une fois ; les sections sont construites depuis le bilan du jour
+GABARIT_RAPPORT = Template("""
     <html>
     <head>
         <style>
-            body {{ font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }}
-            h1 {{ color: #e94560; border-bottom: 2px solid #e94560; padding-bottom: 10px; }}
-            h2 {{ color: #16213e; margin-top: 30px; }}
-            .section {{ background: #f5f5f5; padding: 15px; border-radius: 8px; margin: 15px 0; }}
-            .ok {{ color: green; }}
-            .warning {{ color: orange; }}
-            .urgent {{ color: red; font-weight: bold; }}
-            pre {{ background: #1a1a2e; color: #eee; padding: 15px; border-radius: 5px; overflow-x: auto; }}
+            body { font-family: Arial, sans-serif; max-width: 800px; margin: 0 auto; padding: 20px; }
+            h1 { color: #e94560; border-bottom: 2px solid #e94560; padding-bottom: 10px; }
+            h2 { color: #16213e; margin-top: 30px; }
+            .section { background: #f5f5f5; padding: 15px; border-radius: 8px; margin: 15px 0; }
+            .ok { color: green; }
+            .warning { color: orange; }
+            .urgent { color: red; font-weight: bold; }
+            pre { background: #1a1a2e; color: #eee; padding: 15px; border-radius: 5px; overflow-x: auto; }
+            table { border-collapse: collapse; width: 100%; }
+            th, td { padding: 4px 8px; border-bottom: 1px solid #ddd; text-align: right; }
+            td:first-child { text-align: left; }
         </style>
     </head>
     <body>
         <h1>🏠 Rapport Quotidien - Ici Dordogne</h1>
-        <p><strong>Date :</strong> {date}</p>
+        <p><strong>Date :</strong> $date</p>
         <p><strong>Généré par :</strong> Axi Agences (AXIS Station)</p>
         
         <h2>📊 Résumé de la journée</h2>
         <div class="section">
-            <p>Tâches automatiques exécutées : ✅</p>
-            <p>Veille concurrentielle : ✅</p>
-            <p>Vérification annonces : ✅</p>
+            $resume
         </div>
         
         <h2>🔍 Opportunités détectées</h2>
         <div class="section">
-            <pre>{opportunites if opportunites else "Aucune nouvelle opportunité aujourd'hui"}</pre>
+            $opportunites
+        </div>
+        
+        <h2>📊 Marché (prix au m²)</h2>
+        <div class="section">
+            $marche
         </div>
         
         <h2>📈 Veille Concurrentielle</h2>
         <div class="section">
-            <pre>{veille if veille else "Pas de données de veille"}</pre>
+            $veille
         </div>
         
         <h2>📋 Journal d'activité</h2>
         <div class="section">
-            <pre>{journal if journal else "Pas d'activité enregistrée"}</pre>
+            <pre>$journal</pre>
         </div>
         
         <hr>
@@ -257,150 +452,442 @@ def generer_rapport_quotidien():
         </p>
     </body>
     </html>
-    """
+""")
+
+def _resume_html(bilan):
+    if not bilan["taches"]:
+        return "<p>Aucune tâche exécutée aujourd'hui</p>"
+    lignes = []
+    for nom, tache in sorted(bilan["taches"].items()):
+        classe = "urgent" if tache["erreurs"] else "ok"
+        lignes.append(
+            f"<tr><td>{escape(nom)}</td><td>{tache['executions']}</td>"
+            f"<td class=\"{classe}\">{tache['erreurs']}</td>"
+            f"<td>{tache['duree_moyenne_s']:.1f} s</td><td>{tache['duree_max_s']:.1f} s</td></tr>"
+        )
+    erreurs = len(bilan["erreurs"])
+    return (
+        "<table><tr><th>Tâche</th><th>Exécutions</th><th>Erreurs</th><th>Durée moy.</th><th>Durée max</th></tr>"
+        + "".join(lignes) + "</table>"
+        + (f"<p class=\"warning\">{erreurs} erreur(s) dans le journal</p>" if erreurs else "<p class=\"ok\">Aucune erreur ✅</p>")
+    )
+
+def _veille_html(bilan):
+    if not bilan["veilles"]:
+        return "<p>Pas de données de veille</p>"
+    lignes = "".join(
+        f"<tr><td>{v['heure']}</td><td>{v['nouvelles']}</td><td>{v['modifiees']}</td>"
+        f"<td>{v['retirees']}</td><td>{v['suivies']}</td><td>{v['duree_s']:.0f} s</td></tr>"
+        for v in bilan["veilles"]
+    )
+    return ("<table><tr><th>Veille</th><th>Nouvelles</th><th>Modifiées</th><th>Retirées</th>"
+            "<th>Suivies</th><th>Durée</th></tr>" + lignes + "</table>")
+
+def generer_rapport_quotidien(analyse=None):
+    """Génère le rapport quotidien à partir du bilan de la journée"""
+    log_activite("📝 Génération du rapport quotidien")
+    
+    date = heure_france().strftime("%d/%m/%Y")
+    if analyse is None:
+        analyse = moteur_analyse().analyser()
+    bilan = bilan_jour.aujourdhui()
+    
+    opportunites = formater_opportunites(bilan["opportunites"])
+    if bilan["notation"]:
+        opportunites = ("[MEILLEURES NOTES]\n" + "\n".join(formater_note(note) for note in bilan["notation"][:15])
+                        + "\n" + opportunites)
+    journal = "\n".join(f"[{entree['heure']}] {entree['message']}" for entree in bilan["journal"])
     
-    # Sauvegarder le rapport
+    html = GABARIT_RAPPORT.substitute(
+        date=date,
+        resume=_resume_html(bilan),
+        opportunites=f"<pre>{escape(opportunites)}</pre>" if opportunites
+                     else "<p>Aucune nouvelle opportunité aujourd'hui</p>",
+        marche=formater_analyse_html(analyse),
+        veille=_veille_html(bilan),
+        journal=escape(journal) if journal else "Pas d'activité enregistrée",
+    )
+    
+    # Sauvegarder le rapport : la journée complète
     ecrire_fichier("rapport_quotidien.txt", f"=== RAPPORT {date} ===\n{journal}\n")
     
     return html
 
-def envoyer_rapport_quotidien():
+def envoyer_rapport_quotidien(analyse=None):
     """Envoie le rapport quotidien par email"""
     log_activite("📧 Envoi du rapport quotidien")
     
-    html = generer_rapport_quotidien()
+    html = generer_rapport_quotidien(analyse)
     date = heure_france().strftime("%d/%m/%Y")
     sujet = f"🏠 Rapport Ici Dordogne - {date}"
     
-    if DESTINATAIRES_RAPPORT:
-        envoyer_email(DESTINATAIRES_RAPPORT, sujet, html)
+    destinataires = list(DESTINATAIRES_RAPPORT)
+    for adresses in DESTINATAIRES_AGENCES.values():
+        destinataires.extend(a for a in adresses if a not in destinataires)
+    
+    if destinataires:
+        # Un exemplaire par destinataire, tous envoyés dans la même session SMTP
+        envoyer_email(destinataires, sujet, html, individuel=True)
     else:
         log_activite("Aucun destinataire configuré pour le rapport")
 
 # === SCHEDULER ===
 
+# Les tâches (planifiées ou lancées depuis le web) tournent sur ce groupe d'ouvriers
+file_travaux = FileTravaux(
+    nb_ouvriers=int(os.environ.get("TRAVAUX_OUVRIERS", 3)),
+    journaliser=lambda message: log_activite(message),
+    observateur=lambda travail: noter_fin_travail(travail)
+)
+
+def noter_fin_travail(travail):
+    bilan_jour.noter_tache(travail.nom, travail.duree, travail.erreur)
+    metriques.observer_travail(travail.nom, travail.duree, travail.etat)
+    diffuseur.publier("travail", travail.en_dict())
+    log_activite(f"Travail {travail.nom} : {travail.etat}", niveau=DEBUG, tache=travail.nom,
+                 duree=travail.duree, id=travail.id, soumissions=travail.soumissions)
+
+def tache_rapport_du_soir():
+    """Analyse du marché puis envoi du rapport quotidien"""
+    analyse = tache_analyse_marche()
+    envoyer_rapport_quotidien(analyse)
+
+# Registre des tâches automatiques (horaires cron, heure de Paris)
+TACHES_PLANIFIEES = [
+    # Veille et vérification toutes les 2 heures (8h, 10h, 12h, 14h, 16h), en parallèle
+    {"nom": "veille", "cron": "0 8-16/2 * * *", "fonction": tache_veille,
+     "timeout": 1800, "gigue": 60, "rattrapage": 3600},
+    {"nom": "verification", "cron": "0 8-16/2 * * *", "fonction": tache_verification_annonces,
+     "timeout": 900, "gigue": 60, "rattrapage": 3600},
+    # Notation des biens du jour après la dernière veille, terminée avant le rapport
+    {"nom": "notation", "cron": "0 17 * * *", "fonction": tache_notation_opportunites,
+     "timeout": 3600, "rattrapage": 3600},
+    # Rapport quotidien à 18h, rattrapé si le service redémarre dans la soirée
+    {"nom": "rapport", "cron": "0 18 * * *", "fonction": tache_rapport_du_soir,
+     "timeout": 900, "rattrapage": 5 * 3600},
+]
+
+# Dernières exécutions sauvegardées sur GitHub : un conteneur neuf ne relance pas
+# une tâche déjà faite, et rattrape celles manquées pendant l'arrêt
+planificateur = Planificateur(
+    TACHES_PLANIFIEES, file_travaux,
+    journaliser=lambda message: log_activite(message),
+    apres_enregistrement=sauvegarder_sur_github
+)
+
 def scheduler_taches():
     """Planifie et exécute les tâches automatiques"""
     log_activite("🚀 Scheduler démarré")
-    
-    derniere_veille = None
-    dernier_rapport = None
-    
-    while True:
-        try:
-            maintenant = heure_france()
-            heure = maintenant.hour
-            minute = maintenant.minute
-            
-            # Veille toutes les 2 heures (8h, 10h, 12h, 14h, 16h)
-            if heure in [8, 10, 12, 14, 16] and minute < 5:
-                if derniere_veille != heure:
-                    tache_veille_leboncoin()
-                    tache_verification_annonces()
-                    derniere_veille = heure
-            
-            # Rapport quotidien à 18h
-            if heure == 18 and minute < 5:
-                if dernier_rapport != maintenant.date():
-                    tache_analyse_marche()
-                    envoyer_rapport_quotidien()
-                    dernier_rapport = maintenant.date()
-            
-            # Pause de 60 secondes
-            time.sleep(60)
-            
-        except Exception as e:
-            log_activite(f"Erreur scheduler: {e}")
-            time.sleep(60)
+    planificateur.executer()
 
 # === SERVEUR WEB ===
 
+# Actions du tableau de bord, exécutées hors de la requête HTTP
+ACTIONS_WEB = {
+    '/veille': ("veille", tache_veille),
+    '/rapport': ("rapport", envoyer_rapport_quotidien),
+    '/notation': ("notation", tache_notation_opportunites),
+}
+
+def generer_tableau_de_bord():
+    """Construit la page d'accueil à partir du journal et de la veille"""
+    # Identifiant lu avant les fichiers : le flux reprend au plus tôt à leur état (au pire
+    # une ligne en double, jamais une ligne perdue)
+    dernier_evenement = diffuseur.dernier_id()
+    journal = fichiers_segmentes["journal_activite.txt"].lire_fin(80)
+    veille = fichiers_segmentes["veille_concurrence.txt"].lire_fin(60)
+    
+    html = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>Axi Agences - Ici Dordogne</title>
+        <style>
+            body {{ font-family: Georgia, serif; background: #1a1a2e; color: #eee; padding: 20px; }}
+            h1 {{ color: #e94560; }}
+            .section {{ background: #16213e; padding: 20px; border-radius: 10px; margin: 20px 0; }}
+            pre {{ background: #0f3460; padding: 15px; border-radius: 5px; overflow-x: auto; white-space: pre-wrap; }}
+            .status {{ color: #4ade80; }}
+            button {{ background: #e94560; color: white; border: none; padding: 10px 20px; border-radius: 5px; cursor: pointer; margin: 5px; }}
+            button:hover {{ background: #c73e54; }}
+            #travail {{ color: #4ade80; }}
+        </style>
+        <script>
+            let suivi = null;
+            function afficher(t) {{
+                document.getElementById('travail').textContent = t.nom + ' : ' + t.etat
+                    + (t.duree_s !== null ? ' (' + t.duree_s + ' s)' : '');
+            }}
+            function lancer(chemin) {{
+                fetch(chemin).then(r => r.json()).then(t => {{ suivi = t.id; afficher(t); }});
+            }}
+            // Ajoute du texte à un bloc en ne gardant que ses dernières lignes
+            function ajouter(id, texte, lignes) {{
+                const bloc = document.getElementById(id);
+                const contenu = 'vide' in bloc.dataset ? texte : bloc.textContent + '\\n' + texte;
+                delete bloc.dataset.vide;
+                bloc.textContent = contenu.split('\\n').slice(-lignes).join('\\n');
+            }}
+            const flux = new EventSource('/events?depuis={dernier_evenement}');
+            flux.addEventListener('journal', e => ajouter('journal', JSON.parse(e.data).lignes.join('\\n'), 80));
+            flux.addEventListener('veille', e => ajouter('veille', JSON.parse(e.data).texte.trim(), 60));
+            flux.addEventListener('travail', e => {{
+                const t = JSON.parse(e.data);
+                if (t.id === suivi) afficher(t);
+            }});
+            flux.addEventListener('reinitialisation', () => location.reload());
+        </script>
+    </head>
+    <body>
+        <h1>🏠 Axi Agences - Ici Dordogne</h1>
+        <p class="status">● En ligne sur AXIS Station</p>
+        
+        <div class="section">
+            <h2>📋 Actions</h2>
+            <button onclick="lancer('/veille')">🔍 Lancer Veille</button>
+            <button onclick="lancer('/rapport')">📧 Envoyer Rapport</button>
+            <button onclick="lancer('/notation')">⭐ Noter les opportunités</button>
+            <button onclick="location.href='/status'">📊 Status</button>
+            <p id="travail"></p>
+        </div>
+        
+        <div class="section">
+            <h2>📋 Journal d'activité</h2>
+            <pre id="journal"{"" if journal else " data-vide"}>{escape(journal.rstrip()) if journal else "Aucune activité"}</pre>
+        </div>
+        
+        <div class="section">
+            <h2>🔍 Dernière veille</h2>
+            <pre id="veille"{"" if veille else " data-vide"}>{escape(veille.rstrip()) if veille else "Pas encore de veille"}</pre>
+        </div>
+        
+        <p style="color: #888; margin-top: 40px;">Je ne lâche pas — Symbine</p>
+    </body>
+    </html>
+    """
+    return html
+
+# La page n'est régénérée que si le journal, la veille ou le dernier événement ont changé :
+# l'identifiant de reprise du flux (/events?depuis=) n'est jamais celui d'une page périmée
+cache_tableau_de_bord = CacheRendu(
+    generer_tableau_de_bord,
+    ["journal_activite.txt", "veille_concurrence.txt"],
+    version=diffuseur.dernier_id
+)
+
+# Chemins suivis dans les métriques HTTP (les identifiants sont regroupés)
+CHEMINS_METRIQUES = {'/', '/events', '/journal', '/jobs', '/status', '/health', '/ready', '/metrics', '/report/today', '/emails', *ACTIONS_WEB}
+
+def chemin_metrique(chemin):
+    chemin = chemin.split('?', 1)[0]
+    if chemin in CHEMINS_METRIQUES:
+        return chemin
+    for prefixe in ('/jobs/', '/emails/'):
+        if chemin.startswith(prefixe):
+            return prefixe + '{id}'
+    return 'autre'
+
 class AxiAgencesHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 : connexions persistantes, chaque réponse porte un Content-Length
+    protocol_version = "HTTP/1.1"
+    # En-têtes et corps partent en deux écritures : sans TCP_NODELAY, Nagle et l'ACK
+    # retardé du client ajoutent ~40 ms à chaque réponse sur une connexion persistante
+    disable_nagle_algorithm = True
+    
     def do_GET(self):
+        depart = time.perf_counter()
+        self._statut = None
+        try:
+            self._traiter_get()
+        finally:
+            metriques.observer_http(chemin_metrique(self.path), time.perf_counter() - depart,
+                                    self._statut or 500)
+    
+    def send_response(self, code, message=None):
+        self._statut = code
+        super().send_response(code, message)
+    
+    def _traiter_get(self):
         if self.path == '/':
+            rendu = cache_tableau_de_bord.obtenir()
+            encodage = choisir_encodage(self.headers.get('Accept-Encoding'))
+            etag = rendu.etag(encodage)
+            if etag_correspond(self.headers.get('If-None-Match'), etag):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                return
+            
+            corps = rendu.corps(encodage)
             self.send_response(200)
             self.send_header('Content-type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(corps)))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            if encodage:
+                self.send_header('Content-Encoding', encodage)
             self.end_headers()
+            self.wfile.write(corps)
             
-            journal = lire_fichier("journal_activite.txt")[-5000:]
-            veille = lire_fichier("veille_concurrence.txt")[-3000:]
+        elif self.path.split('?', 1)[0] == '/events':
+            self._ouvrir_flux()
             
-            html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <title>Axi Agences - Ici Dordogne</title>
-                <style>
-                    body {{ font-family: Georgia, serif; background: #1a1a2e; color: #eee; padding: 20px; }}
-                    h1 {{ color: #e94560; }}
-                    .section {{ background: #16213e; padding: 20px; border-radius: 10px; margin: 20px 0; }}
-                    pre {{ background: #0f3460; padding: 15px; border-radius: 5px; overflow-x: auto; white-space: pre-wrap; }}
-                    .status {{ color: #4ade80; }}
-                    button {{ background: #e94560; color: white; border: none; padding: 10px 20px; border-radius: 5px; cursor: pointer; margin: 5px; }}
-                    button:hover {{ background: #c73e54; }}
-                </style>
-            </head>
-            <body>
-                <h1>🏠 Axi Agences - Ici Dordogne</h1>
-                <p class="status">● En ligne sur AXIS Station</p>
-                
-                <div class="section">
-                    <h2>📋 Actions</h2>
-                    <button onclick="location.href='/veille'">🔍 Lancer Veille</button>
-                    <button onclick="location.href='/rapport'">📧 Envoyer Rapport</button>
-                    <button onclick="location.href='/status'">📊 Status</button>
-                </div>
-                
-                <div class="section">
-                    <h2>📋 Journal d'activité</h2>
-                    <pre>{journal if journal else "Aucune activité"}</pre>
-                </div>
-                
-                <div class="section">
-                    <h2>🔍 Dernière veille</h2>
-                    <pre>{veille if veille else "Pas encore de veille"}</pre>
-                </div>
-                
-                <p style="color: #888; margin-top: 40px;">Je ne lâche pas — Symbine</p>
-            </body>
-            </html>
-            """
-            self.wfile.write(html.encode())
+        elif self.path.split('?', 1)[0] == '/journal':
+            self._rechercher_journal()
             
-        elif self.path == '/veille':
-            tache_veille_leboncoin()
-            self.send_response(302)
-            self.send_header('Location', '/')
-            self.end_headers()
+        elif self.path in ACTIONS_WEB:
+            nom, tache = ACTIONS_WEB[self.path]
+            travail = file_travaux.soumettre(nom, tache)
+            self._envoyer_json(travail.en_dict(), 202, {'Location': f"/jobs/{travail.id}"})
             
-        elif self.path == '/rapport':
-            envoyer_rapport_quotidien()
-            self.send_response(302)
-            self.send_header('Location', '/')
-            self.end_headers()
+        elif self.path == '/jobs':
+            self._envoyer_json([travail.en_dict() for travail in file_travaux.lister()])
             
-        elif self.path == '/status':
+        elif self.path.startswith('/jobs/'):
+            travail = file_travaux.obtenir(self.path[len('/jobs/'):])
+            if travail:
+                self._envoyer_json(travail.en_dict())
+            else:
+                self._envoyer_json({"erreur": "travail inconnu"}, 404)
+            
+        elif self.path == '/health':
+            self._envoyer_json({"status": "alive"})
+            
+        elif self.path == '/ready':
+            self._envoyer_json({"pret": pret.is_set()}, 200 if pret.is_set() else 503)
+            
+        elif self.path == '/metrics':
+            corps = metriques.exposer().encode()
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(corps)))
             self.end_headers()
+            self.wfile.write(corps)
+            
+        elif self.path == '/report/today':
+            self._envoyer_json(bilan_jour.aujourdhui())
+            
+        elif self.path == '/emails':
+            self._envoyer_json(boite_envoi.lister())
+            
+        elif self.path.startswith('/emails/'):
+            message = boite_envoi.obtenir(self.path[len('/emails/'):])
+            if message:
+                self._envoyer_json(message)
+            else:
+                self._envoyer_json({"erreur": "email inconnu"}, 404)
+            
+        elif self.path == '/status':
             status = {
                 "status": "running",
                 "heure": heure_france().isoformat(),
-                "github_repo": GITHUB_REPO
+                "github_repo": GITHUB_REPO,
+                "travaux_actifs": [t.nom for t in file_travaux.lister() if t.actif],
+                "emails_en_attente": boite_envoi.en_attente(),
+                "clients_evenements": diffuseur.nombre_clients(),
+                "operations": metriques.resume(),
+                "hotes": client_http.statistiques(),
+                "notation": notation_opportunites.statistiques()
             }
-            self.wfile.write(json.dumps(status).encode())
+            self._envoyer_json(status)
         else:
             self.send_response(404)
+            self.send_header('Content-Length', '0')
             self.end_headers()
     
+    def _ouvrir_flux(self):
+        """Flux SSE : en-têtes envoyés ici, puis la connexion est confiée au diffuseur
+        et le thread de la requête est libéré"""
+        if not diffuseur.disponible():
+            self._envoyer_json({"erreur": "trop de clients"}, 503, {'Retry-After': '30'})
+            return
+        parametres = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        # Reconnexion automatique du navigateur : Last-Event-ID ; première connexion : ?depuis=
+        dernier_id = self.headers.get('Last-Event-ID') or parametres.get('depuis', [None])[0]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.end_headers()
+        self.close_connection = True
+        self.server.detacher(self.connection)
+        diffuseur.accepter(self.connection, dernier_id)
+    
+    def _rechercher_journal(self):
+        """/journal?since=&until=&task=&level=&q=&limit=&cursor= : lignes du journal, les plus récentes d'abord"""
+        parametres = {cle: valeurs[-1] for cle, valeurs in
+                      urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).items()}
+        try:
+            resultat = index_journal.rechercher(
+                depuis=lire_date(parametres["since"]) if "since" in parametres else None,
+                jusqua=lire_date(parametres["until"]) if "until" in parametres else None,
+                tache=parametres.get("task"),
+                niveau=parametres.get("level"),
+                texte=parametres.get("q"),
+                limite=int(parametres.get("limit", LIMITE_DEFAUT)),
+                curseur=int(parametres["cursor"]) if "cursor" in parametres else None,
+            )
+        except ValueError as e:
+            self._envoyer_json({"erreur": str(e)}, 400)
+            return
+        self._envoyer_json(resultat)
+    
+    def _envoyer_json(self, donnees, statut=200, entetes=None):
+        corps = json.dumps(donnees).encode()
+        self.send_response(statut)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(corps)))
+        for nom, valeur in (entetes or {}).items():
+            self.send_header(nom, valeur)
+        self.end_headers()
+        self.wfile.write(corps)
+    
     def log_message(self, format, *args):
         pass  # Désactiver les logs HTTP
 
+class ServeurAxi(ThreadingHTTPServer):
+    """Serveur HTTP (un thread par requête) dont les flux /events survivent à leur requête"""
+    
+    # File d'attente des connexions : les navigateurs se reconnectent tous ensemble après un redémarrage
+    request_queue_size = 128
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._detachees = set()
+    
+    def detacher(self, connexion):
+        """La connexion n'est ni fermée ni coupée à la fin de sa requête"""
+        self._detachees.add(connexion)
+    
+    def shutdown_request(self, request):
+        if request in self._detachees:
+            self._detachees.discard(request)
+            return
+        super().shutdown_request(request)
+
 # === MAIN ===
 
-def main():
-    port = int(os.environ.get("PORT", 8080))
+# Levé quand l'initialisation de fond est finie (/ready) ; /health répond dès l'ouverture du port
+pret = threading.Event()
+
+# Conteneur neuf : récupère depuis GitHub les fichiers de suivi absents avant de les recréer
+RESTAURER_DEPUIS_GITHUB = os.environ.get("AXI_RESTAURER_GITHUB", "0").lower() in ("1", "oui", "true")
+
+def demarrage(port, debut):
+    """Initialisation en arrière-plan, une fois le port ouvert"""
+    if RESTAURER_DEPUIS_GITHUB and GITHUB_TOKEN:
+        try:
+            restaures = synchro_github.restaurer(FICHIERS_A_SAUVEGARDER + [planificateur.fichier_etat])
+            for fichier in fichiers_segmentes.values():
+                restaures += fichier.restaurer(synchro_github.restaurer)
+            if restaures:
+                log_activite(f"📥 Restauré depuis GitHub : {', '.join(restaures)}")
+        except Exception as e:
+            log_activite(f"Erreur restauration GitHub: {e}")
     
     # Créer les fichiers de base si inexistants
     for f in FICHIERS_A_SAUVEGARDER:
@@ -410,12 +897,34 @@ def main():
     log_activite("🏠 Axi Agences démarré sur AXIS Station")
     log_activite(f"📡 Serveur web sur port {port}")
     
+    # Reprendre les emails restés dans la boîte d'envoi
+    boite_envoi.demarrer()
+    file_travaux.demarrer()
+    
     # Lancer le scheduler en arrière-plan
     scheduler_thread = threading.Thread(target=scheduler_taches, daemon=True)
     scheduler_thread.start()
     
-    # Lancer le serveur web
-    server = HTTPServer(('0.0.0.0', port), AxiAgencesHandler)
+    pret.set()
+    log_activite(f"✅ Prêt en {time.monotonic() - debut:.2f} s")
+    
+    # Préchargement de NumPy et des agrégats de marché, hors du chemin critique
+    moteur_analyse()
+
+def main():
+    debut = time.monotonic()
+    port = int(os.environ.get("PORT", 8080))
+    
+    # Pousser les dernières modifications avant l'arrêt du processus
+    # (atexit exécute dans l'ordre inverse : emails, journal, bilan du jour, puis synchro)
+    atexit.register(synchro_github.vider)
+    atexit.register(bilan_jour.sauver)
+    atexit.register(journal.vider)
+    atexit.register(boite_envoi.vider)
+    
+    # Le port est ouvert d'abord : les sondes de vie répondent pendant l'initialisation
+    server = ServeurAxi(('0.0.0.0', port), AxiAgencesHandler)
+    threading.Thread(target=demarrage, args=(port, debut), name="demarrage", daemon=True).start()
     print(f"Axi Agences prêt sur http://localhost:{port}")
     server.serve_forever()
 
@@ -0,0 +1,191 @@
+"""
+Métriques de fonctionnement
+Compteurs et histogrammes de latence (opérations externes, travaux, requêtes HTTP
+reçues et émises par hôte),
+exposés au format texte Prometheus ; les appels plus lents qu'un seuil sont signalés.
+"""
+
+import bisect
+import functools
+import os
+import threading
+import time
+
+# Bornes des histogrammes, en secondes : de la requête HTTP au run Apify
+SEUILS_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Appels plus longs que ce seuil (secondes) transmis au traceur ; 0 : désactivé
+SEUIL_APPEL_LENT = float(os.environ.get("AXI_SEUIL_APPEL_LENT", "0"))
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _etiquettes(noms, valeurs, supplement=""):
+    paires = [f'{nom}="{_echapper(valeur)}"' for nom, valeur in zip(noms, valeurs)]
+    if supplement:
+        paires.append(supplement)
+    return "{" + ",".join(paires) + "}" if paires else ""
+
+
+def _nombre(valeur):
+    if valeur == float("inf"):
+        return "+Inf"
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+class Compteur:
+    def __init__(self, nom, aide, etiquettes=()):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self._verrou = threading.Lock()
+        self._valeurs = {}
+
+    def incrementer(self, *valeurs, pas=1):
+        with self._verrou:
+            self._valeurs[valeurs] = self._valeurs.get(valeurs, 0) + pas
+
+    def valeurs(self):
+        with self._verrou:
+            return dict(self._valeurs)
+
+    def exposer(self):
+        lignes = [f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} counter"]
+        for valeurs, total in sorted(self.valeurs().items()):
+            lignes.append(f"{self.nom}{_etiquettes(self.etiquettes, valeurs)} {_nombre(total)}")
+        return lignes
+
+
+class Histogramme:
+    def __init__(self, nom, aide, etiquettes=(), seuils=SEUILS_DUREE):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self.seuils = tuple(sorted(seuils))
+        self._verrou = threading.Lock()
+        self._series = {}  # valeurs d'étiquettes -> [effectifs par seuil (+Inf en dernier), somme]
+
+    def observer(self, valeur, *valeurs):
+        index = bisect.bisect_left(self.seuils, valeur)
+        with self._verrou:
+            serie = self._series.get(valeurs)
+            if serie is None:
+                serie = self._series[valeurs] = [[0] * (len(self.seuils) + 1), 0.0]
+            serie[0][index] += 1
+            serie[1] += valeur
+
+    def exposer(self):
+        lignes = [f"# HELP {self.nom} {self.aide}", f"# TYPE {self.nom} histogram"]
+        with self._verrou:
+            series = {valeurs: (list(effectifs), somme) for valeurs, (effectifs, somme) in self._series.items()}
+        for valeurs, (effectifs, somme) in sorted(series.items()):
+            cumul = 0
+            for seuil, effectif in zip(self.seuils + (float("inf"),), effectifs):
+                cumul += effectif
+                le = 'le="' + _nombre(seuil) + '"'
+                lignes.append(f"{self.nom}_bucket{_etiquettes(self.etiquettes, valeurs, le)} {cumul}")
+            lignes.append(f"{self.nom}_sum{_etiquettes(self.etiquettes, valeurs)} {_nombre(somme)}")
+            lignes.append(f"{self.nom}_count{_etiquettes(self.etiquettes, valeurs)} {cumul}")
+        return lignes
+
+
+class Registre:
+    """Métriques de l'application et traceur des appels lents"""
+
+    def __init__(self, seuil_lent=SEUIL_APPEL_LENT, tracer=None):
+        self.seuil_lent = seuil_lent
+        # Appelé avec (operation, duree, erreur) pour chaque appel plus lent que seuil_lent
+        self.tracer = tracer
+        self.operations = Histogramme(
+            "axi_operation_duree_secondes", "Durée des appels externes (GitHub, SMTP, Apify)", ("operation",))
+        self.operations_total = Compteur(
+            "axi_operations_total", "Appels externes par résultat", ("operation", "resultat"))
+        self.travaux = Histogramme(
+            "axi_travail_duree_secondes", "Durée des travaux (planificateur et tableau de bord)", ("tache",))
+        self.travaux_total = Compteur(
+            "axi_travaux_total", "Travaux terminés par état", ("tache", "etat"))
+        self.http = Histogramme(
+            "axi_http_duree_secondes", "Durée de traitement des requêtes HTTP", ("chemin",))
+        self.http_total = Compteur(
+            "axi_http_requetes_total", "Requêtes HTTP par statut", ("chemin", "statut"))
+        self.sortant = Histogramme(
+            "axi_http_sortant_duree_secondes", "Durée des requêtes HTTP émises, par hôte", ("hote",))
+        self.sortant_total = Compteur(
+            "axi_http_sortant_requetes_total", "Requêtes HTTP émises par hôte et statut", ("hote", "statut"))
+        self._familles = (self.operations, self.operations_total, self.travaux, self.travaux_total,
+                          self.http, self.http_total, self.sortant, self.sortant_total)
+
+    def observer(self, operation, duree, erreur=None):
+        """Enregistre un appel externe terminé"""
+        self.operations.observer(duree, operation)
+        self.operations_total.incrementer(operation, "erreur" if erreur else "ok")
+        self._tracer(operation, duree, erreur)
+
+    def observer_travail(self, tache, duree, etat):
+        self.travaux.observer(duree, tache)
+        self.travaux_total.incrementer(tache, etat)
+        self._tracer(f"travail {tache}", duree, None)
+
+    def observer_http(self, chemin, duree, statut):
+        self.http.observer(duree, chemin)
+        self.http_total.incrementer(chemin, str(statut))
+        self._tracer(f"http {chemin}", duree, None)
+
+    def observer_sortant(self, hote, duree, statut):
+        """Requête émise (une par tentative) ; `statut` : code HTTP ou "erreur" (réseau)"""
+        self.sortant.observer(duree, hote)
+        self.sortant_total.incrementer(hote, str(statut))
+
+    def _tracer(self, operation, duree, erreur):
+        if self.tracer and self.seuil_lent and duree >= self.seuil_lent:
+            try:
+                self.tracer(operation, duree, erreur)
+            except Exception:
+                pass
+
+    def mesurer(self, operation, echec=None):
+        """Décorateur : durée et résultat de chaque appel
+
+        Une exception compte comme une erreur (et est propagée) ; `echec(resultat)` permet
+        de reconnaître les fonctions qui signalent leurs erreurs dans leur valeur de retour.
+        """
+        def decorateur(fonction):
+            @functools.wraps(fonction)
+            def mesuree(*args, **kwargs):
+                depart = time.perf_counter()
+                try:
+                    resultat = fonction(*args, **kwargs)
+                except Exception as e:
+                    self.observer(operation, time.perf_counter() - depart, str(e) or type(e).__name__)
+                    raise
+                erreur = echec(resultat) if echec else None
+                self.observer(operation, time.perf_counter() - depart, erreur)
+                return resultat
+            return mesuree
+        return decorateur
+
+    def resume(self) -> dict:
+        """Appels, erreurs et taux d'erreur par opération (pour /status)"""
+        resume = {}
+        for (operation, resultat), total in self.operations_total.valeurs().items():
+            ligne = resume.setdefault(operation, {"appels": 0, "erreurs": 0})
+            ligne["appels"] += total
+            if resultat == "erreur":
+                ligne["erreurs"] += total
+        for ligne in resume.values():
+            ligne["taux_erreur"] = round(ligne["erreurs"] / ligne["appels"], 4)
+        return resume
+
+    def exposer(self) -> str:
+        """Toutes les métriques au format texte Prometheus (version 0.0.4)"""
+        lignes = []
+        for famille in self._familles:
+            lignes.extend(famille.exposer())
+        return "\n".join(lignes) + "\n"
+
+
+# Registre partagé par les modules de l'application
+metriques = Registre()
+mesurer = metriques.mesurer
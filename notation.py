@@ -0,0 +1,379 @@
+"""
+Notation des opportunités
+Chaque bien nouveau est classé (vendeur particulier, vente motivée) par un modèle de
+langage, en un seul lot de requêtes pour toute la journée (API Message Batches, à moitié
+prix). Les réponses sont gardées sur disque par empreinte du texte envoyé :
+une annonce inchangée n'est jamais renotée. L'écart à la médiane de la commune est
+calculé localement, à jour à chaque notation.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from annonces import normaliser_nom
+from metriques import mesurer
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+DOSSIER_NOTATION = os.path.join(DOSSIER_ETAT, "notation")
+
+MODELE_NOTATION = os.environ.get("AXI_MODELE_NOTATION", "claude-haiku-4-5")
+TOKENS_MAX = 300
+# Attente maximale d'un lot ; au-delà, il est repris à la notation suivante
+ATTENTE_LOT_MAX = float(os.environ.get("AXI_NOTATION_ATTENTE_MAX", "3000"))
+INTERVALLE_SONDAGE = 30
+
+# Prix au m² sous la médiane de la commune à partir duquel un bien est sous-évalué
+SEUIL_SOUS_EVALUATION = 0.15
+# Annonces nécessaires pour qu'une médiane de commune soit prise en compte
+VOLUME_MEDIANE_MIN = 5
+
+# À changer avec les consignes : les notes enregistrées avant ne sont plus réutilisées
+VERSION_CONSIGNES = "1"
+
+CONSIGNES = """Tu assistes une agence immobilière de Dordogne qui cherche des mandats.
+Pour chaque annonce immobilière reçue (portail, titre, description), réponds uniquement
+par un objet JSON, sans texte autour :
+
+{"particulier": true|false, "vente_motivee": true|false, "indices": ["..."], "confiance": 0.0-1.0}
+
+- "particulier" : l'annonce est publiée par le propriétaire lui-même et non par une agence,
+  un mandataire, un notaire ou un promoteur. Indices : « particulier », « sans frais
+  d'agence », « je vends », « nous vendons », coordonnées personnelles. Indices contraires :
+  honoraires, référence de mandat, nom d'agence ou de réseau, DPE présenté avec mentions
+  légales d'agence, « notre agence », « nos conseillers ».
+- "vente_motivee" : le vendeur a une raison de vendre vite ou de négocier. Indices :
+  mutation, départ, succession, divorce, séparation, urgent, à saisir, prix négociable ou
+  en baisse, libre rapidement, travaux à prévoir assumés, vente en l'état.
+- "indices" : au plus 4 citations courtes de l'annonce qui justifient la réponse.
+- "confiance" : ta certitude globale, de 0 (aucun indice) à 1 (indices explicites).
+
+En l'absence d'indice, réponds false avec une confiance basse. Ne devine ni le prix du
+marché ni la valeur du bien : l'agence compare elle-même le prix aux ventes de la commune."""
+
+
+def message_annonce(annonce) -> str:
+    """Texte envoyé pour une annonce : seuls les champs qui décident de sa note"""
+    return f"Portail : {annonce.portail}\nTitre : {annonce.titre}\nDescription : {annonce.description}"
+
+
+def cle_annonce(annonce, modele) -> str:
+    """Empreinte du texte envoyé, des consignes et du modèle (identifiant de requête du lot)"""
+    contenu = f"{VERSION_CONSIGNES}\n{modele}\n{message_annonce(annonce)}"
+    return hashlib.sha256(contenu.encode()).hexdigest()[:32]
+
+
+def lire_reponse(texte):
+    """Note brute extraite de la réponse du modèle, ou None si elle est inexploitable"""
+    debut, fin = texte.find("{"), texte.rfind("}")
+    if debut < 0 or fin < debut:
+        return None
+    try:
+        donnees = json.loads(texte[debut:fin + 1])
+    except ValueError:
+        return None
+    if not isinstance(donnees, dict) or not isinstance(donnees.get("particulier"), bool) \
+            or not isinstance(donnees.get("vente_motivee"), bool):
+        return None
+    try:
+        confiance = min(1.0, max(0.0, float(donnees.get("confiance", 0.5))))
+    except (TypeError, ValueError):
+        confiance = 0.5
+    indices = [str(indice)[:200] for indice in donnees.get("indices") or [] if indice][:4]
+    return {"particulier": donnees["particulier"], "vente_motivee": donnees["vente_motivee"],
+            "indices": indices, "confiance": confiance}
+
+
+def medianes_communes(analyse, volume_min=VOLUME_MEDIANE_MIN) -> dict:
+    """Prix au m² médian par commune normalisée, sur 90 jours (30 à défaut)"""
+    medianes = {}
+    for commune, stats in (analyse or {}).get("communes", {}).items():
+        for fenetre in ("90j", "30j"):
+            if stats.get(fenetre, {}).get("volume", 0) >= volume_min:
+                medianes[normaliser_nom(commune)] = stats[fenetre]["prix_m2_median"]
+                break
+    return medianes
+
+
+@dataclass(slots=True)
+class Note:
+    """Classement d'une annonce et écart de son prix au m² à la médiane de sa commune"""
+
+    annonce: object
+    particulier: bool
+    vente_motivee: bool
+    indices: list = field(default_factory=list)
+    confiance: float = 0.5
+    ecart_mediane: float | None = None  # -0.2 : 20 % sous la médiane
+
+    @property
+    def sous_evaluee(self):
+        return self.ecart_mediane is not None and self.ecart_mediane <= -SEUIL_SOUS_EVALUATION
+
+    @property
+    def score(self) -> int:
+        """Sur 100 : particulier 40, vente motivée 30, jusqu'à 30 selon l'écart à la médiane"""
+        points = 40 if self.particulier else 0
+        points += 30 if self.vente_motivee else 0
+        if self.ecart_mediane is not None and self.ecart_mediane < 0:
+            points += min(30, round(-self.ecart_mediane * 200))
+        return points
+
+    def en_dict(self):
+        annonce = self.annonce
+        return {
+            "score": self.score,
+            "titre": annonce.titre,
+            "commune": annonce.commune or annonce.code_postal,
+            "zone": annonce.zone,
+            "prix": annonce.prix,
+            "url": annonce.url,
+            "particulier": self.particulier,
+            "vente_motivee": self.vente_motivee,
+            "sous_evaluee": self.sous_evaluee,
+            "ecart_mediane": round(self.ecart_mediane, 3) if self.ecart_mediane is not None else None,
+            "indices": self.indices,
+        }
+
+
+# === CLIENTS ===
+# Un client soumet un lot {clé: message} et en rend les réponses {clé: texte} une fois
+# le lot terminé (None tant qu'il est en cours)
+
+class ClientAnthropic:
+    """API Message Batches d'Anthropic : un lot par notation, mêmes consignes pour chaque requête"""
+
+    def __init__(self, cle_api, modele=MODELE_NOTATION, tokens_max=TOKENS_MAX):
+        self.cle_api = cle_api
+        self.modele = modele
+        self.tokens_max = tokens_max
+        self._client = None
+
+    @property
+    def identifiant(self):
+        return self.modele
+
+    def _api(self):
+        if self._client is None:
+            # Chargé au premier lot : le SDK ne retarde pas le démarrage du service
+            import anthropic
+            self._client = anthropic.Anthropic(api_key=self.cle_api)
+        return self._client
+
+    @mesurer("notation_soumettre_lot")
+    def soumettre(self, consignes, demandes) -> str:
+        # Pas de cache_control : les consignes (~350 tokens) sont sous la taille minimale
+        # d'un préfixe mis en cache, le marqueur ne ferait rien
+        systeme = [{"type": "text", "text": consignes}]
+        lot = self._api().messages.batches.create(requests=[
+            {"custom_id": cle, "params": {
+                "model": self.modele,
+                "max_tokens": self.tokens_max,
+                "system": systeme,
+                "messages": [{"role": "user", "content": message}],
+            }}
+            for cle, message in demandes.items()
+        ])
+        return lot.id
+
+    def recuperer(self, id_lot):
+        api = self._api()
+        if api.messages.batches.retrieve(id_lot).processing_status != "ended":
+            return None
+        reponses = {}
+        for resultat in api.messages.batches.results(id_lot):
+            # Requêtes en erreur ou expirées : absentes, soumises à nouveau la fois suivante
+            if resultat.result.type == "succeeded":
+                reponses[resultat.custom_id] = "".join(
+                    bloc.text for bloc in resultat.result.message.content if bloc.type == "text")
+        return reponses
+
+
+_RE_PARTICULIER = re.compile(
+    r"\b(particulier|sans (?:frais d'|)agence|pas d'agence|(?:aucun|pas de) frais d'agence|"
+    r"je vends|nous vendons|propriétaire vend)", re.IGNORECASE)
+_RE_PROFESSIONNEL = re.compile(r"\b(honoraires|mandat|notre agence|nos conseillers|réf\.?\s*:)", re.IGNORECASE)
+_RE_MOTIVEE = re.compile(
+    r"\b(urgent|à saisir|mutation|succession|divorce|séparation|cause (?:de |)départ|"
+    r"vente rapide|libre rapidement|prix (?:négociable|à débattre|en baisse)|vente en l'état)",
+    re.IGNORECASE)
+
+
+class ClientLocal:
+    """Doublure sans réseau : mots-clés sur le texte de l'annonce, réponses immédiates
+
+    Sert sans clé d'API et dans le banc d'essai ; ses notes sont gardées sous leur propre
+    identifiant et ne remplacent jamais celles du modèle.
+    """
+
+    identifiant = "regles-locales"
+
+    def __init__(self):
+        self._lots = {}
+        self._numero = 0
+
+    def soumettre(self, consignes, demandes) -> str:
+        self._numero += 1
+        id_lot = f"local-{self._numero}"
+        self._lots[id_lot] = {cle: self._repondre(message) for cle, message in demandes.items()}
+        return id_lot
+
+    def recuperer(self, id_lot):
+        # Lot inconnu (d'avant un redémarrage) : terminé sans réponse
+        return self._lots.pop(id_lot, {})
+
+    @staticmethod
+    def _repondre(message):
+        particulier = _RE_PARTICULIER.findall(message)
+        professionnel = _RE_PROFESSIONNEL.findall(message)
+        motivee = _RE_MOTIVEE.findall(message)
+        indices = (particulier + motivee)[:4]
+        return json.dumps({
+            "particulier": bool(particulier) and not professionnel,
+            "vente_motivee": bool(motivee),
+            "indices": indices,
+            "confiance": 0.6 if indices else 0.2,
+        }, ensure_ascii=False)
+
+
+# === NOTATION ===
+
+class NotationOpportunites:
+    """Notes par empreinte d'annonce (etat/notation/notes.jsonl) et lot en cours (repris au redémarrage)"""
+
+    def __init__(self, client, dossier=DOSSIER_NOTATION, attente_max=ATTENTE_LOT_MAX,
+                 intervalle=INTERVALLE_SONDAGE, journaliser=print, sommeil=time.sleep, horloge=time.monotonic):
+        self.client = client
+        self.dossier = dossier
+        self.fichier_notes = os.path.join(dossier, "notes.jsonl")
+        self.fichier_lot = os.path.join(dossier, "lot_en_cours.json")
+        self.attente_max = attente_max
+        self.intervalle = intervalle
+        self.journaliser = journaliser
+        self.sommeil = sommeil
+        self.horloge = horloge
+        # Une notation à la fois : deux lots simultanés noteraient les mêmes annonces.
+        # Tenu pendant l'attente du lot ; les notes en mémoire ont leur propre verrou
+        # (statistiques, /status) qui n'est jamais gardé pendant un appel réseau
+        self._notation = threading.Lock()
+        self._verrou = threading.Lock()
+        self._notes = None
+
+    def noter(self, annonces, medianes=None) -> list:
+        """Notes des annonces, du meilleur score au moins bon
+
+        Les annonces déjà notées (même texte) sont lues sur disque ; les autres partent
+        dans un seul lot. Une annonce dont le lot n'est pas terminé à temps est absente
+        du résultat et sera notée à l'appel suivant, sans nouvelle soumission.
+        """
+        medianes = medianes or {}
+        with self._notation:
+            notes = self._charger()
+            cles = {id(annonce): cle_annonce(annonce, self.client.identifiant) for annonce in annonces}
+
+            lot = self._lot_en_cours()
+            termine = lot is None or self._attendre(lot)
+            demandes = {cles[id(annonce)]: message_annonce(annonce)
+                        for annonce in annonces if cles[id(annonce)] not in notes}
+            if demandes and termine:
+                id_lot = self.client.soumettre(CONSIGNES, demandes)
+                lot = {"id": id_lot, "client": self.client.identifiant, "cles": sorted(demandes)}
+                self._enregistrer_lot(lot)
+                self.journaliser(f"⭐ Notation : lot {id_lot} soumis ({len(demandes)} annonce(s), "
+                                 f"{len(annonces) - len(demandes)} déjà notées)")
+                self._attendre(lot)
+
+            resultat = []
+            for annonce in annonces:
+                brute = notes.get(cles[id(annonce)])
+                if brute is None:
+                    continue
+                mediane = medianes.get(normaliser_nom(annonce.commune))
+                ecart = annonce.prix_m2 / mediane - 1 if annonce.prix_m2 and mediane else None
+                resultat.append(Note(annonce=annonce, ecart_mediane=ecart, **brute))
+        resultat.sort(key=lambda note: note.score, reverse=True)
+        return resultat
+
+    def _attendre(self, lot) -> bool:
+        """Attend la fin du lot et enregistre ses réponses ; faux s'il est encore en cours"""
+        if lot.get("client") != self.client.identifiant:
+            self._supprimer_lot()  # lot d'un autre client : ses annonces seront resoumises
+            return True
+        limite = self.horloge() + self.attente_max
+        reponses = self.client.recuperer(lot["id"])
+        while reponses is None:
+            if self.horloge() >= limite:
+                self.journaliser(f"⭐ Notation : lot {lot['id']} toujours en cours, repris à la prochaine notation")
+                return False
+            self.sommeil(self.intervalle)
+            reponses = self.client.recuperer(lot["id"])
+
+        nouvelles = {}
+        for cle, texte in reponses.items():
+            brute = lire_reponse(texte)
+            if brute is not None:
+                nouvelles[cle] = brute
+        self._ajouter(nouvelles)
+        self._supprimer_lot()
+        self.journaliser(f"⭐ Notation : lot {lot['id']} terminé, {len(nouvelles)}/{len(lot['cles'])} annonce(s) notée(s)")
+        return True
+
+    def statistiques(self) -> dict:
+        """Sans attendre une notation en cours"""
+        return {"notes": len(self._charger()), "lot_en_cours": self._lot_en_cours() is not None,
+                "client": self.client.identifiant}
+
+    # --- Stockage ---
+
+    def _charger(self):
+        with self._verrou:
+            return self._charger_notes()
+
+    def _charger_notes(self):
+        if self._notes is None:
+            self._notes = {}
+            try:
+                with open(self.fichier_notes, 'r', encoding='utf-8') as f:
+                    for ligne in f:
+                        try:
+                            entree = json.loads(ligne)
+                            self._notes[entree.pop("cle")] = entree
+                        except (ValueError, KeyError, AttributeError):
+                            continue  # ligne interrompue par un arrêt : la note sera redemandée
+            except FileNotFoundError:
+                pass
+        return self._notes
+
+    def _ajouter(self, nouvelles):
+        if not nouvelles:
+            return
+        os.makedirs(self.dossier, exist_ok=True)
+        with open(self.fichier_notes, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps({"cle": cle, **brute}, ensure_ascii=False) + "\n"
+                            for cle, brute in nouvelles.items()))
+        with self._verrou:
+            self._notes.update(nouvelles)
+
+    def _lot_en_cours(self):
+        try:
+            with open(self.fichier_lot, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _enregistrer_lot(self, lot):
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = self.fichier_lot + ".tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(lot, f)
+        os.replace(temporaire, self.fichier_lot)
+
+    def _supprimer_lot(self):
+        try:
+            os.remove(self.fichier_lot)
+        except FileNotFoundError:
+            pass
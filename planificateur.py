@@ -0,0 +1,227 @@
+"""
+Planificateur de tâches
+Registre déclaratif de tâches à horaires type cron (heure de Paris), réveil à la
+prochaine échéance seulement, rattrapage des exécutions manquées au redémarrage.
+"""
+
+import heapq
+import json
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+FICHIER_ETAT_PLANIFICATEUR = os.path.join(DOSSIER_ETAT, "planificateur.json")
+
+# Réveil de sécurité : on recalcule au moins toutes les heures (changement d'heure, horloge)
+ATTENTE_MAX = 3600
+
+_BORNES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def _champ_cron(expression, minimum, maximum):
+    """Valeurs autorisées d'un champ cron : *, a-b, a-b/pas, */pas, listes"""
+    valeurs = set()
+    for partie in expression.split(","):
+        plage, _, pas = partie.partition("/")
+        pas = int(pas) if pas else 1
+        if plage == "*":
+            debut, fin = minimum, maximum
+        elif "-" in plage:
+            debut, fin = (int(v) for v in plage.split("-"))
+        else:
+            debut = fin = int(plage)
+        if debut < minimum or fin > maximum or debut > fin or pas < 1:
+            raise ValueError(f"Champ cron invalide : {expression}")
+        valeurs.update(range(debut, fin + 1, pas))
+    return frozenset(valeurs)
+
+
+class Cron:
+    """Expression cron à 5 champs : minute heure jour-du-mois mois jour-de-semaine (0 = dimanche)"""
+
+    def __init__(self, expression, fuseau=TIMEZONE_FRANCE):
+        champs = expression.split()
+        if len(champs) != 5:
+            raise ValueError(f"Expression cron invalide : {expression}")
+        self.expression = expression
+        self.fuseau = fuseau
+        self.minutes, self.heures, self.jours, self.mois, self.jours_semaine = (
+            _champ_cron(champ, *bornes) for champ, bornes in zip(champs, _BORNES)
+        )
+        self._jour_libre = champs[2] == "*"
+        self._semaine_libre = champs[4] == "*"
+
+    def _jour_valide(self, date):
+        jour_semaine = (date.weekday() + 1) % 7
+        if self._jour_libre or self._semaine_libre:
+            return date.day in self.jours and jour_semaine in self.jours_semaine
+        # Comme cron : si les deux sont restreints, l'un ou l'autre suffit
+        return date.day in self.jours or jour_semaine in self.jours_semaine
+
+    def prochaine(self, apres: datetime) -> datetime:
+        """Première échéance strictement postérieure à `apres`"""
+        local = apres.astimezone(self.fuseau).replace(tzinfo=None, second=0, microsecond=0)
+        courant = local + timedelta(minutes=1)
+        limite = courant + timedelta(days=366 * 5)
+        while courant < limite:
+            if courant.month not in self.mois:
+                courant = (courant.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+                continue
+            if not self._jour_valide(courant):
+                courant = (courant + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if courant.hour not in self.heures:
+                courant = (courant + timedelta(hours=1)).replace(minute=0)
+                continue
+            if courant.minute not in self.minutes:
+                courant += timedelta(minutes=1)
+                continue
+            echeance = courant.replace(tzinfo=self.fuseau)
+            if echeance > apres:
+                return echeance
+            courant += timedelta(minutes=1)
+        raise ValueError(f"Aucune échéance pour {self.expression}")
+
+
+class Planificateur:
+    """Exécute les tâches du registre à leur échéance via une file de travaux
+
+    Chaque tâche du registre est un dict :
+        nom        identifiant (et clé de regroupement dans la file)
+        cron       horaire, ex. "0 8-16/2 * * *"
+        fonction   callable sans argument
+        timeout    secondes avant d'abandonner l'attente du travail (optionnel)
+        gigue      délai aléatoire maximal ajouté à l'échéance, en secondes (optionnel)
+        rattrapage âge maximal d'une échéance manquée rattrapée au démarrage, en secondes (optionnel)
+    """
+
+    def __init__(self, taches, file_travaux, journaliser=print,
+                 fichier_etat=FICHIER_ETAT_PLANIFICATEUR, horloge=None, apres_enregistrement=None):
+        self.taches = {tache["nom"]: dict(tache, cron=Cron(tache["cron"])) for tache in taches}
+        self.file_travaux = file_travaux
+        self.journaliser = journaliser
+        self.fichier_etat = fichier_etat
+        # Appelé avec le chemin du fichier d'état après chaque écriture (sauvegarde GitHub)
+        self.apres_enregistrement = apres_enregistrement
+        self.horloge = horloge or (lambda: datetime.now(TIMEZONE_FRANCE))
+        self._condition = threading.Condition()
+        self._tas = []
+        self._arret = False
+        self._dernieres = self._charger_etat()
+
+    # --- État persistant ---
+
+    def _charger_etat(self):
+        try:
+            with open(self.fichier_etat, 'r', encoding='utf-8') as f:
+                return {nom: datetime.fromisoformat(valeur) for nom, valeur in json.load(f).items()}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _noter_execution(self, nom, echeance):
+        with self._condition:
+            self._dernieres[nom] = echeance
+            etat = {n: d.isoformat() for n, d in self._dernieres.items()}
+        dossier = os.path.dirname(self.fichier_etat)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        temporaire = self.fichier_etat + ".tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(etat, f)
+        os.replace(temporaire, self.fichier_etat)
+        if self.apres_enregistrement:
+            self.apres_enregistrement(self.fichier_etat)
+
+    # --- Planification ---
+
+    def _programmer(self, nom, apres):
+        tache = self.taches[nom]
+        echeance = tache["cron"].prochaine(apres)
+        gigue = random.uniform(0, tache.get("gigue", 0))
+        heapq.heappush(self._tas, (echeance + timedelta(seconds=gigue), echeance, nom))
+
+    def _initialiser(self):
+        # Relu au démarrage de la boucle : il a pu être restauré depuis GitHub entre-temps
+        for nom, derniere in self._charger_etat().items():
+            if nom not in self._dernieres or derniere > self._dernieres[nom]:
+                self._dernieres[nom] = derniere
+        maintenant = self.horloge()
+        for nom, tache in self.taches.items():
+            manquee = self._derniere_manquee(nom, maintenant)
+            if manquee is not None:
+                # Échéance(s) manquée(s) pendant l'arrêt : une seule exécution de rattrapage
+                self.journaliser(f"⏰ Rattrapage de la tâche {nom} (prévue {manquee.strftime('%Y-%m-%d %H:%M')})")
+                heapq.heappush(self._tas, (maintenant, manquee, nom))
+                continue
+            self._programmer(nom, maintenant)
+
+    def _derniere_manquee(self, nom, maintenant):
+        """Plus récente échéance passée depuis la dernière exécution, si elle date de moins
+        de `rattrapage` secondes ; sinon None
+
+        Sans exécution connue (conteneur neuf sans état restauré), l'échéance la plus
+        récente de la fenêtre de rattrapage est considérée comme manquée.
+        """
+        tache = self.taches[nom]
+        rattrapage = timedelta(seconds=tache.get("rattrapage", 0))
+        if not rattrapage:
+            return None
+        # Les échéances plus anciennes que la fenêtre de rattrapage sont sautées d'emblée
+        debut = maintenant - rattrapage - timedelta(minutes=1)
+        derniere = self._dernieres.get(nom)
+        echeance = tache["cron"].prochaine(max(derniere, debut) if derniere else debut)
+        manquee = None
+        while echeance <= maintenant:
+            manquee = echeance
+            echeance = tache["cron"].prochaine(echeance)
+        if manquee is None or maintenant - manquee > rattrapage:
+            return None
+        return manquee
+
+    def lancer(self, nom, echeance=None):
+        """Soumet immédiatement une tâche du registre à la file de travaux"""
+        tache = self.taches[nom]
+        echeance = echeance or self.horloge()
+
+        def executer():
+            try:
+                return tache["fonction"]()
+            finally:
+                self._noter_execution(nom, echeance)
+
+        return self.file_travaux.soumettre(nom, executer, timeout=tache.get("timeout"))
+
+    def prochaines(self):
+        """Prochaines échéances, par ordre chronologique"""
+        with self._condition:
+            return [(nom, echeance) for _, echeance, nom in sorted(self._tas)]
+
+    def executer(self):
+        """Boucle principale : dort jusqu'à la prochaine échéance puis la soumet"""
+        with self._condition:
+            self._initialiser()
+        while True:
+            with self._condition:
+                while not self._arret:
+                    attente = (self._tas[0][0] - self.horloge()).total_seconds()
+                    if attente <= 0:
+                        break
+                    self._condition.wait(min(attente, ATTENTE_MAX))
+                if self._arret:
+                    return
+                _, echeance, nom = heapq.heappop(self._tas)
+                self._programmer(nom, max(echeance, self.horloge()))
+            try:
+                self.lancer(nom, echeance)
+            except Exception as e:
+                self.journaliser(f"Erreur scheduler: {e}")
+
+    def arreter(self):
+        with self._condition:
+            self._arret = True
+            self._condition.notify_all()
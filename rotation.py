@@ -0,0 +1,220 @@
+"""
+Rotation des fichiers de suivi en segments archivés
+Le fichier actif (journal_activite.txt, veille_concurrence.txt) garde son nom ; chaque
+jour, ou au-delà d'une taille, il est scellé en segment gzip dans archives/<nom>/ avec un
+manifeste des segments et de leurs périodes. Seul le fichier actif change d'une écriture
+à l'autre : un segment scellé n'est envoyé à GitHub qu'une fois.
+"""
+
+import functools
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from lecture_fichiers import lire_fin
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+DOSSIER_ARCHIVES = "archives"
+# Taille du fichier actif au-delà de laquelle il est scellé sans attendre la fin du jour
+ROTATION_TAILLE_MAX = int(os.environ.get("AXI_ROTATION_TAILLE_MAX_KO", "1024")) * 1024
+
+# Suffixe du fichier actif pendant son scellement (repris au redémarrage s'il est interrompu)
+SUFFIXE_ROTATION = ".rotation"
+
+
+@functools.lru_cache(maxsize=8)
+def _lire_segment(chemin):
+    """Texte d'un segment scellé (immuable : gardé en cache)"""
+    with gzip.open(chemin, 'rb') as f:
+        return f.read().decode('utf-8', errors='replace')
+
+
+class FichierSegmente:
+    """Fichier texte en ajout seul, découpé en segments gzip datés"""
+
+    def __init__(self, chemin, dossier=None, taille_max=ROTATION_TAILLE_MAX, quotidien=True,
+                 apres_scellement=None, horloge=None):
+        self.chemin = chemin
+        nom = os.path.splitext(os.path.basename(chemin))[0]
+        self.dossier = dossier or os.path.join(DOSSIER_ARCHIVES, nom)
+        self.chemin_manifeste = os.path.join(self.dossier, "manifeste.json")
+        self.taille_max = taille_max
+        self.quotidien = quotidien
+        # Appelé avec les fichiers créés ou modifiés par un scellement (segment, manifeste)
+        self.apres_scellement = apres_scellement
+        self.horloge = horloge or (lambda: datetime.now(TIMEZONE_FRANCE))
+        self._verrou = threading.Lock()
+        self._manifeste = None
+
+    # --- Écriture ---
+
+    def preparer(self):
+        """À appeler avant chaque ajout : scelle le fichier actif si sa journée est passée
+        ou s'il dépasse la taille maximale. Retourne le segment créé, ou None."""
+        with self._verrou:
+            manifeste = self._charger()
+            if os.path.exists(self.chemin + SUFFIXE_ROTATION):
+                self._reprendre()
+            maintenant = self.horloge()
+            try:
+                taille = os.path.getsize(self.chemin)
+            except FileNotFoundError:
+                taille = 0
+            if not taille or not manifeste["actif_depuis"]:
+                # Fichier neuf, ou existant avant la rotation : sa période commence maintenant
+                manifeste["actif_depuis"] = maintenant.isoformat(timespec="seconds")
+                self._enregistrer()
+                if taille < self.taille_max:
+                    return None
+            debut = datetime.fromisoformat(manifeste["actif_depuis"])
+            if taille >= self.taille_max or (self.quotidien and debut.date() != maintenant.date()):
+                # Fin de la période : dernière écriture dans le fichier, pas l'heure du scellement
+                derniere = datetime.fromtimestamp(os.path.getmtime(self.chemin), TIMEZONE_FRANCE)
+                os.replace(self.chemin, self.chemin + SUFFIXE_ROTATION)
+                return self._sceller(max(debut, min(maintenant, derniere)))
+            return None
+
+    def _sceller(self, fin):
+        """Compresse le fichier mis de côté en segment et l'ajoute au manifeste"""
+        source = self.chemin + SUFFIXE_ROTATION
+        with open(source, 'rb') as f:
+            contenu = f.read()
+        debut = datetime.fromisoformat(self._manifeste["actif_depuis"])
+        os.makedirs(self.dossier, exist_ok=True)
+        nom = f"{debut.strftime('%Y-%m-%d')}.txt.gz"
+        numero = 1
+        while os.path.exists(os.path.join(self.dossier, nom)):
+            numero += 1
+            nom = f"{debut.strftime('%Y-%m-%d')}.{numero}.txt.gz"
+        chemin_segment = os.path.join(self.dossier, nom)
+        temporaire = chemin_segment + ".tmp"
+        # mtime=0 : un même contenu donne toujours le même fichier (et le même blob GitHub)
+        with open(temporaire, 'wb') as brut, gzip.GzipFile(fileobj=brut, mode='wb', mtime=0) as f:
+            f.write(contenu)
+        os.replace(temporaire, chemin_segment)
+
+        segment = {
+            "fichier": chemin_segment,
+            "debut": debut.isoformat(timespec="seconds"),
+            "fin": fin.isoformat(timespec="seconds"),
+            "lignes": contenu.count(b"\n"),
+            "octets": len(contenu),
+            "octets_compresses": os.path.getsize(chemin_segment),
+            "sha1": hashlib.sha1(contenu).hexdigest(),
+        }
+        self._manifeste["segments"].append(segment)
+        self._manifeste["actif_depuis"] = self.horloge().isoformat(timespec="seconds")
+        self._enregistrer()
+        os.remove(source)
+        if self.apres_scellement:
+            self.apres_scellement([chemin_segment, self.chemin_manifeste])
+        return segment
+
+    def _reprendre(self):
+        """Scellement interrompu : termine-le, sauf si le segment est déjà au manifeste"""
+        source = self.chemin + SUFFIXE_ROTATION
+        with open(source, 'rb') as f:
+            empreinte = hashlib.sha1(f.read()).hexdigest()
+        segments = self._manifeste["segments"]
+        if segments and segments[-1]["sha1"] == empreinte:
+            os.remove(source)
+            return
+        fin = datetime.fromtimestamp(os.path.getmtime(source), TIMEZONE_FRANCE)
+        self._sceller(fin)
+
+    # --- Manifeste ---
+
+    def _charger(self):
+        if self._manifeste is None:
+            try:
+                with open(self.chemin_manifeste, 'r', encoding='utf-8') as f:
+                    self._manifeste = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._manifeste = {}
+            self._manifeste.setdefault("fichier", self.chemin)
+            self._manifeste.setdefault("actif_depuis", None)
+            self._manifeste.setdefault("segments", [])
+        return self._manifeste
+
+    def _enregistrer(self):
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = self.chemin_manifeste + ".tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(self._manifeste, f, ensure_ascii=False, indent=1)
+        os.replace(temporaire, self.chemin_manifeste)
+
+    def restaurer(self, recuperer) -> list:
+        """Conteneur neuf : récupère le manifeste puis les segments absents en local
+
+        `recuperer(chemins)` retourne les chemins récupérés (SynchroGitHub.restaurer).
+        Ajouts et lectures attendent la fin de la restauration : aucun ne garde ni ne
+        réécrit un manifeste vide chargé pendant le démarrage.
+        """
+        with self._verrou:
+            manifeste = self._charger()
+            restaures = []
+            if not manifeste["segments"]:
+                # Absent, ou écrit vide depuis le démarrage : celui de la sauvegarde fait foi
+                try:
+                    os.remove(self.chemin_manifeste)
+                except FileNotFoundError:
+                    pass
+                restaures = recuperer([self.chemin_manifeste])
+                if restaures:
+                    self._manifeste = None
+                    manifeste = self._charger()
+                elif manifeste["actif_depuis"]:
+                    self._enregistrer()
+            restaures += recuperer([segment["fichier"] for segment in manifeste["segments"]])
+            return restaures
+
+    def segments(self) -> list:
+        """Segments scellés, du plus ancien au plus récent"""
+        with self._verrou:
+            return [dict(segment) for segment in self._charger()["segments"]]
+
+    # --- Lecture ---
+
+    def lire(self, depuis=None, jusqua=None) -> str:
+        """Contenu des segments recouvrant la période [depuis, jusqua] (datetimes), puis du
+        fichier actif ; sans bornes, tout l'historique"""
+        morceaux = []
+        for segment in self.segments():
+            if depuis and datetime.fromisoformat(segment["fin"]) < depuis:
+                continue
+            if jusqua and datetime.fromisoformat(segment["debut"]) > jusqua:
+                continue
+            try:
+                morceaux.append(_lire_segment(segment["fichier"]))
+            except FileNotFoundError:
+                continue  # segment pas encore restauré
+        try:
+            with open(self.chemin, 'r', encoding='utf-8', errors='replace') as f:
+                morceaux.append(f.read())
+        except FileNotFoundError:
+            pass
+        return "".join(morceaux)
+
+    def lire_fin(self, lignes) -> str:
+        """Les `lignes` dernières lignes, en remontant dans les segments si le fichier actif
+        n'en contient pas assez (juste après une rotation)"""
+        texte = lire_fin(self.chemin, lignes=lignes)
+        manquantes = lignes - len(texte.splitlines())
+        if manquantes <= 0:
+            return texte
+        morceaux = [texte]
+        for segment in reversed(self.segments()):
+            try:
+                precedentes = _lire_segment(segment["fichier"]).splitlines(keepends=True)
+            except FileNotFoundError:
+                break
+            morceaux.insert(0, "".join(precedentes[-manquantes:]))
+            manquantes -= len(precedentes)
+            if manquantes <= 0:
+                break
+        return "".join(morceaux)
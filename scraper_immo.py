@@ -3,41 +3,70 @@ Scraper immobilier via Apify
 Zones : 10km autour de Vergt et Le Bugue (Dordogne)
 """
 
-import urllib.request
 import urllib.parse
+import itertools
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+from annonces import Annonce, normaliser_annonce
+from cache_apify import CacheApify
+from client_http import client_http
+from communes import ReferentielCommunes, slug
+from metriques import mesurer
+
 APIFY_TOKEN = os.environ.get("APIFY_TOKEN", "")
+# URL de l'API (serveur local pour le banc d'essai)
+APIFY_API_URL = os.environ.get("APIFY_API_URL", "https://api.apify.com/v2").rstrip("/")
 TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
 
+# Runs Apify lancés et suivis en même temps
+APIFY_PARALLELISME = int(os.environ.get("APIFY_PARALLELISME", "6"))
+# Durée maximale d'attente d'un run avant abandon (secondes)
+APIFY_DELAI_MAX_RUN = int(os.environ.get("APIFY_DELAI_MAX_RUN", "1800"))
+STATUTS_TERMINAUX = {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}
+# Nombre d'éléments demandés par page de dataset
+APIFY_TAILLE_PAGE = int(os.environ.get("APIFY_TAILLE_PAGE", "500"))
+
 # === ZONES DE RECHERCHE ===
 
-# Codes postaux et communes dans un rayon de 10km autour de Vergt
-ZONE_VERGT = {
-    "centre": "Vergt",
-    "code_postal_principal": "24380",
-    "communes": [
-        "Vergt", "Église-Neuve-de-Vergt", "Grun-Bordas", "Saint-Michel-de-Double",
-        "Salon", "Fouleix", "Breuilh", "Chalagnac", "Creyssensac-et-Pissot",
-        "Saint-Mayme-de-Péreyrol", "Lacropte", "Cendrieux", "Saint-Félix-de-Villadeix"
-    ],
-    "codes_postaux": ["24380", "24400", "24420"]
+# Zones des agences : un rayon autour d'une commune du référentiel (communes_dordogne.csv).
+# Ajouter une agence = ajouter une entrée ici. Les communes et codes postaux indiqués fixent
+# le périmètre de recherche historique (codes LeBonCoin, premières communes SeLoger) ; les
+# communes du rayon servent en plus à classer les annonces.
+ZONES_AGENCES = {
+    "vergt": {
+        "centre": "Vergt", "rayon_km": 10,
+        "communes": [
+            "Vergt", "Église-Neuve-de-Vergt", "Grun-Bordas", "Saint-Michel-de-Double",
+            "Salon", "Fouleix", "Breuilh", "Chalagnac", "Creyssensac-et-Pissot",
+            "Saint-Mayme-de-Péreyrol", "Lacropte", "Cendrieux", "Saint-Félix-de-Villadeix"
+        ],
+        "codes_postaux": ["24380", "24400", "24420"],
+    },
+    "bugue": {
+        "centre": "Le Bugue", "rayon_km": 10,
+        "communes": [
+            "Le Bugue", "Campagne", "Saint-Chamassy", "Limeuil", "Audrix",
+            "Mauzens-et-Miremont", "Les Eyzies", "Journiac", "Le Buisson-de-Cadouin",
+            "Saint-Avit-Sénieur", "Trémolat", "Paunat", "Sainte-Alvère"
+        ],
+        "codes_postaux": ["24260", "24480", "24510", "24220"],
+    },
 }
 
-# Codes postaux et communes dans un rayon de 10km autour du Bugue
-ZONE_BUGUE = {
-    "centre": "Le Bugue",
-    "code_postal_principal": "24260",
-    "communes": [
-        "Le Bugue", "Campagne", "Saint-Chamassy", "Limeuil", "Audrix",
-        "Mauzens-et-Miremont", "Les Eyzies", "Journiac", "Le Buisson-de-Cadouin",
-        "Saint-Avit-Sénieur", "Trémolat", "Paunat", "Sainte-Alvère"
-    ],
-    "codes_postaux": ["24260", "24480", "24510", "24220"]
-}
+referentiel_communes = ReferentielCommunes.charger()
+ZONES = referentiel_communes.zones(ZONES_AGENCES)
+
+# Communes et codes postaux dans un rayon de 10km autour de Vergt et du Bugue
+ZONE_VERGT = ZONES["vergt"]
+ZONE_BUGUE = ZONES["bugue"]
+
+# Périmètre des portails qui ne cherchent que par département
+DEPARTEMENT = {"nom": "dordogne", "code": "24"}
 
 # === FONCTIONS APIFY ===
 
@@ -80,8 +109,7 @@ def lancer_scraping_seloger(zone: dict) -> dict:
     
     search_urls = []
     for commune in zone["communes"][:5]:  # Limiter pour ne pas exploser les crédits
-        commune_slug = commune.lower().replace(" ", "-").replace("é", "e").replace("è", "e")
-        url = f"https://www.seloger.com/immobilier/achat/immo-{commune_slug}-24/"
+        url = f"https://www.seloger.com/immobilier/achat/immo-{slug(commune)}-24/"
         search_urls.append(url)
     
     input_data = {
@@ -93,8 +121,8 @@ def lancer_scraping_seloger(zone: dict) -> dict:
     return executer_actor_apify(actor_id, input_data)
 
 
-def lancer_scraping_bienici(zone: dict) -> dict:
-    """Lance un scraping Bien'ici via Apify"""
+def lancer_scraping_bienici(departement: dict) -> dict:
+    """Lance un scraping Bien'ici via Apify pour un département (voir DEPARTEMENT)"""
     
     if not APIFY_TOKEN:
         return {"error": "APIFY_TOKEN non configuré"}
@@ -105,7 +133,7 @@ def lancer_scraping_bienici(zone: dict) -> dict:
     # On cherche par département + filtres
     input_data = {
         "startUrls": [
-            {"url": "https://www.bienici.com/recherche/achat/dordogne-24?page=1"}
+            {"url": f"https://www.bienici.com/recherche/achat/{departement['nom']}-{departement['code']}?page=1"}
         ],
         "maxCrawlPages": 50,
         "crawlerType": "playwright"  # Nécessaire car site dynamique
@@ -114,112 +142,266 @@ def lancer_scraping_bienici(zone: dict) -> dict:
     return executer_actor_apify(actor_id, input_data)
 
 
+# Runs récents et datasets réutilisés quand la même recherche est relancée (APIFY_CACHE_TTL)
+cache_apify = CacheApify()
+
+
+@mesurer("executer_actor_apify", echec=lambda resultat: resultat.get("error"))
 def executer_actor_apify(actor_id: str, input_data: dict) -> dict:
-    """Exécute un actor Apify et retourne les résultats"""
+    """Exécute un actor Apify, ou réutilise un run identique récent, et retourne son ID"""
     
+    return cache_apify.lancer(actor_id, input_data, _lancer_actor_apify)
+
+
+@mesurer("apify_lancement_run", echec=lambda resultat: resultat.get("error"))
+def _lancer_actor_apify(actor_id: str, input_data: dict) -> dict:
     try:
         # Lancer l'actor
-        url = f"https://api.apify.com/v2/acts/{actor_id}/runs?token={APIFY_TOKEN}"
+        url = f"{APIFY_API_URL}/acts/{actor_id}/runs?token={APIFY_TOKEN}"
         
-        data = json.dumps(input_data).encode('utf-8')
-        req = urllib.request.Request(url, data=data, method='POST')
-        req.add_header('Content-Type', 'application/json')
+        # POST non rejoué après une erreur réseau : il lancerait un second run payant
+        result = client_http.requete('POST', url, donnees=input_data, timeout=30).json() or {}
+        run_id = result.get('data', {}).get('id')
         
-        with urllib.request.urlopen(req, timeout=30) as response:
-            result = json.loads(response.read().decode())
-            run_id = result.get('data', {}).get('id')
-            
-            if run_id:
-                return {
-                    "status": "started",
-                    "run_id": run_id,
-                    "actor": actor_id,
-                    "message": f"Scraping lancé, ID: {run_id}"
-                }
-            else:
-                return {"error": "Pas de run_id retourné", "response": result}
+        if run_id:
+            return {
+                "status": "started",
+                "run_id": run_id,
+                "actor": actor_id,
+                "message": f"Scraping lancé, ID: {run_id}"
+            }
+        else:
+            return {"error": "Pas de run_id retourné", "response": result}
                 
     except Exception as e:
         return {"error": str(e)}
 
 
-def recuperer_resultats_apify(run_id: str) -> list:
-    """Récupère les résultats d'un run Apify terminé"""
-    
+def _lire_reprise(fichier_reprise: str) -> int:
     try:
-        url = f"https://api.apify.com/v2/actor-runs/{run_id}/dataset/items?token={APIFY_TOKEN}"
+        with open(fichier_reprise, 'r', encoding='utf-8') as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _ecrire_reprise(fichier_reprise: str, offset: int):
+    dossier = os.path.dirname(fichier_reprise)
+    if dossier:
+        os.makedirs(dossier, exist_ok=True)
+    with open(fichier_reprise, 'w', encoding='utf-8') as f:
+        f.write(str(offset))
+
+
+def iterer_resultats_apify(run_id: str, offset: int = 0, taille_page: int = APIFY_TAILLE_PAGE,
+                           fichier_reprise: str = None):
+    """Parcourt le dataset d'un run page par page et produit les éléments un à un
+    
+    Les pages sont demandées au format JSONL et décodées ligne par ligne : la
+    mémoire utilisée ne dépend pas de la taille du dataset. Avec `fichier_reprise`,
+    l'offset atteint est enregistré après chaque page et un nouvel appel reprend
+    là où le précédent s'est arrêté. Les erreurs réseau sont propagées.
+    """
+    
+    if fichier_reprise:
+        offset = max(offset, _lire_reprise(fichier_reprise))
+    
+    while True:
+        params = urllib.parse.urlencode({
+            "token": APIFY_TOKEN,
+            "format": "jsonl",
+            "offset": offset,
+            "limit": taille_page
+        })
+        url = f"{APIFY_API_URL}/actor-runs/{run_id}/dataset/items?{params}"
         
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=60) as response:
-            return json.loads(response.read().decode())
-            
+        nb_elements = 0
+        with client_http.ouvrir('GET', url, timeout=60) as response:
+            for ligne in response:
+                ligne = ligne.strip()
+                if not ligne:
+                    continue
+                yield json.loads(ligne)
+                nb_elements += 1
+        
+        offset += nb_elements
+        if fichier_reprise:
+            _ecrire_reprise(fichier_reprise, offset)
+        if nb_elements < taille_page:
+            return
+
+
+@mesurer("recuperer_resultats_apify", echec=lambda resultat: resultat.get("error"))
+def recuperer_resultats_apify(run_id: str, traiter=None) -> dict:
+    """Passe le dataset d'un run Apify terminé, en flux, à `traiter(elements)`
+    
+    `traiter` reçoit un itérateur (lu sur disque ou page par page depuis Apify) et
+    retourne le nombre d'éléments traités ; par défaut les éléments sont seulement
+    comptés. Retourne {"nb_biens": n} ou {"error": ...}.
+    """
+    
+    traiter = traiter or (lambda elements: sum(1 for _ in elements))
+    try:
+        return {"nb_biens": traiter(cache_apify.dataset(run_id, lambda: iterer_resultats_apify(run_id)))}
     except Exception as e:
-        return [{"error": str(e)}]
+        return {"error": str(e)}
 
 
 def verifier_status_run(run_id: str) -> dict:
     """Vérifie le status d'un run Apify"""
     
+    status = cache_apify.statut(run_id)
+    if status:
+        return {"status": status, "finished": None}
+    
     try:
-        url = f"https://api.apify.com/v2/actor-runs/{run_id}?token={APIFY_TOKEN}"
+        url = f"{APIFY_API_URL}/actor-runs/{run_id}?token={APIFY_TOKEN}"
         
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as response:
-            data = json.loads(response.read().decode())
-            return {
-                "status": data.get('data', {}).get('status'),
-                "finished": data.get('data', {}).get('finishedAt')
-            }
+        data = client_http.requete('GET', url, timeout=10).json() or {}
+        status = data.get('data', {}).get('status')
+        if status in STATUTS_TERMINAUX:
+            cache_apify.noter_statut(run_id, status)
+        return {
+            "status": status,
+            "finished": data.get('data', {}).get('finishedAt')
+        }
             
     except Exception as e:
         return {"error": str(e)}
 
 
+def attendre_fin_run(run_id: str, delai_max: float = APIFY_DELAI_MAX_RUN,
+                     attente_initiale: float = 5, attente_max: float = 60) -> dict:
+    """Interroge le status d'un run avec un intervalle croissant jusqu'à sa fin"""
+    
+    fin = time.monotonic() + delai_max
+    attente = attente_initiale
+    while True:
+        status = verifier_status_run(run_id)
+        if status.get("status") in STATUTS_TERMINAUX:
+            return status
+        reste = fin - time.monotonic()
+        if reste <= 0:
+            return {"status": "ATTENTE-DEPASSEE", "error": f"Run {run_id} non terminé après {delai_max} s"}
+        time.sleep(min(attente, reste))
+        attente = min(attente * 2, attente_max)
+
+
 # === FONCTION PRINCIPALE DE VEILLE ===
 
-def lancer_veille_complete():
-    """Lance une veille complète sur les deux zones"""
+PORTAILS = {
+    "leboncoin": lancer_scraping_leboncoin,
+    "seloger": lancer_scraping_seloger,
+    "bienici": lancer_scraping_bienici,
+}
+
+# Portails dont la recherche couvre tout le département : un seul run, lancé sur DEPARTEMENT
+# et non sur une zone d'agence
+PORTAILS_DEPARTEMENT = {"bienici"}
+
+
+def _marquer(biens, zone: str, portail: str):
+    for bien in biens:
+        bien.setdefault("_portail", portail)
+        bien.setdefault("_zone", zone)
+        yield bien
+
+
+def executer_run_veille(zone: str, portail: str, traiter=None) -> dict:
+    """Lance un run, attend sa fin et passe son dataset en flux à `traiter`
+
+    `zone` : nom d'une zone d'agence, ou du département pour PORTAILS_DEPARTEMENT.
+    """
+    
+    debut = time.monotonic()
+    run = {"zone": zone, "portail": portail, "nb_biens": 0}
+    perimetre = DEPARTEMENT if portail in PORTAILS_DEPARTEMENT else ZONES[zone]
+    lancement = PORTAILS[portail](perimetre)
+    run["lancement_s"] = round(time.monotonic() - debut, 3)
+    
+    if "error" in lancement:
+        run.update(status="ERREUR", error=lancement["error"])
+    else:
+        run["run_id"] = lancement["run_id"]
+        status = attendre_fin_run(lancement["run_id"])
+        run["status"] = status.get("status")
+        run["execution_s"] = round(time.monotonic() - debut - run["lancement_s"], 3)
+        if "error" in status:
+            run["error"] = status["error"]
+        elif run["status"] == "SUCCEEDED":
+            resultat = recuperer_resultats_apify(
+                lancement["run_id"],
+                traiter and (lambda biens: traiter(_marquer(biens, zone, portail)))
+            )
+            if "error" in resultat:
+                run["error"] = resultat["error"]
+            else:
+                run["nb_biens"] = resultat["nb_biens"]
+    
+    run["duree_s"] = round(time.monotonic() - debut, 3)
+    return run
+
+
+def lancer_veille_complete(zones: list = None, portails: list = None, traiter=None) -> dict:
+    """Lance une veille complète : tous les portails sur toutes les zones, en parallèle
     
+    Le dataset de chaque run est passé en flux à `traiter(biens)` (appelé depuis les
+    threads des runs) dès la fin du run ; les résultats ne gardent que le suivi des runs.
+    """
+    
+    debut = time.monotonic()
     timestamp = datetime.now(TIMEZONE_FRANCE).strftime("%Y-%m-%d %H:%M")
+    zones = zones or list(ZONES)
+    portails = portails or list(PORTAILS)
     resultats = {
         "timestamp": timestamp,
-        "zones": {}
+        "zones": {},
+        "nb_biens": 0
     }
     
-    # Zone Vergt
-    print(f"[{timestamp}] Lancement veille zone Vergt...")
-    resultats["zones"]["vergt"] = {
-        "leboncoin": lancer_scraping_leboncoin(ZONE_VERGT)
-    }
+    runs = []
+    for portail in portails:
+        if portail in PORTAILS_DEPARTEMENT:
+            runs.append((DEPARTEMENT["nom"], portail))
+        else:
+            runs.extend((zone, portail) for zone in zones)
     
-    # Zone Le Bugue
-    print(f"[{timestamp}] Lancement veille zone Le Bugue...")
-    resultats["zones"]["bugue"] = {
-        "leboncoin": lancer_scraping_leboncoin(ZONE_BUGUE)
-    }
+    print(f"[{timestamp}] Lancement veille : {len(runs)} runs ({', '.join(portails)})...")
+    with ThreadPoolExecutor(max_workers=max(1, min(APIFY_PARALLELISME, len(runs)))) as pool:
+        futures = {pool.submit(executer_run_veille, zone, portail, traiter): (zone, portail)
+                   for zone, portail in runs}
+        for future in as_completed(futures):
+            zone, portail = futures[future]
+            try:
+                run = future.result()
+            except Exception as e:
+                run = {"zone": zone, "portail": portail, "status": "ERREUR", "error": str(e), "nb_biens": 0}
+            resultats["nb_biens"] += run["nb_biens"]
+            resultats["zones"].setdefault(zone, {})[portail] = run
     
+    resultats["duree_s"] = round(time.monotonic() - debut, 3)
     return resultats
 
 
-def generer_rapport_biens(biens: list) -> str:
-    """Génère un rapport texte des biens trouvés"""
-    
-    if not biens:
-        return "Aucun bien trouvé."
+def generer_rapport_biens(biens) -> str:
+    """Génère un rapport texte des biens trouvés (liste ou flux, ex. iterer_resultats_apify)"""
     
     rapport = []
-    for i, bien in enumerate(biens[:50], 1):  # Limiter à 50
-        titre = bien.get('title', bien.get('titre', 'Sans titre'))
-        prix = bien.get('price', bien.get('prix', 'Prix non indiqué'))
-        lieu = bien.get('location', bien.get('lieu', 'Lieu non précisé'))
-        url = bien.get('url', bien.get('link', ''))
+    for i, bien in enumerate(itertools.islice(biens, 50), 1):  # Limiter à 50
+        annonce = bien if isinstance(bien, Annonce) else normaliser_annonce(bien, zones=ZONES)
+        prix = f"{annonce.prix:,} €".replace(",", " ") if annonce.prix else "Prix non indiqué"
+        lieu = " ".join(filter(None, [annonce.code_postal, annonce.commune])) or "Lieu non précisé"
+        surface = f" | Surface: {annonce.surface:g} m²" if annonce.surface else ""
         
-        rapport.append(f"{i}. {titre}")
-        rapport.append(f"   Prix: {prix} | Lieu: {lieu}")
-        if url:
-            rapport.append(f"   {url}")
+        rapport.append(f"{i}. {annonce.titre}")
+        rapport.append(f"   Prix: {prix} | Lieu: {lieu}{surface}")
+        if annonce.url:
+            rapport.append(f"   {annonce.url}")
         rapport.append("")
     
+    if not rapport:
+        return "Aucun bien trouvé."
+    
     return "\n".join(rapport)
 
 
@@ -0,0 +1,293 @@
+"""
+Synchronisation GitHub en écriture différée
+Les fichiers modifiés sont regroupés puis poussés en un seul commit (API Git Data)
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from client_http import client_http
+from metriques import mesurer
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+# Fenêtre de regroupement : on attend ce délai sans nouvelle écriture avant de pousser
+DELAI_SYNCHRO = float(os.environ.get("SYNCHRO_GITHUB_DELAI", "30"))
+# Attente maximale depuis la première modification, même si les écritures continuent
+DELAI_SYNCHRO_MAX = float(os.environ.get("SYNCHRO_GITHUB_DELAI_MAX", str(DELAI_SYNCHRO * 5)))
+# Attente maximale entre deux tentatives après une erreur
+PAUSE_ERREUR_MAX = 900
+# Tentatives de commit quand la branche a bougé entre-temps (409/422)
+TENTATIVES_CONFLIT = 3
+
+# URL de l'API (serveur local pour le banc d'essai)
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+
+DOSSIER_ETAT = os.environ.get("AXI_DOSSIER_ETAT", "etat")
+FICHIER_ETAT_SYNCHRO = os.path.join(DOSSIER_ETAT, "synchro_github.json")
+
+
+def sha_blob(contenu: bytes) -> str:
+    """SHA d'un blob tel que Git (et donc GitHub) le calcule"""
+    return hashlib.sha1(b"blob %d\0" % len(contenu) + contenu).hexdigest()
+
+
+def _parent_commit_perime(erreur):
+    return isinstance(erreur, urllib.error.HTTPError) and erreur.code in (409, 422)
+
+
+class SynchroGitHub:
+    """File des fichiers à sauvegarder, vidée par un thread en arrière-plan"""
+
+    def __init__(self, token, depot, branche="main", delai=DELAI_SYNCHRO,
+                 delai_max=DELAI_SYNCHRO_MAX, journaliser=print,
+                 fichier_etat=FICHIER_ETAT_SYNCHRO, api=GITHUB_API_URL):
+        self.token = token
+        self.depot = depot
+        self.branche = branche
+        self.delai = delai
+        self.delai_max = max(delai_max, delai)
+        self.journaliser = journaliser
+        self.fichier_etat = fichier_etat
+        self.api = api
+
+        # SHA des blobs déjà poussés, tête de branche connue et ETag de la ref
+        self._etat = self._charger_etat()
+        self._condition = threading.Condition()
+        self._fichiers_modifies = set()
+        self._premiere_modification = None
+        self._derniere_modification = None
+        self._forcer = False
+        self._en_cours = False
+        self._thread = None
+
+    # --- API publique ---
+
+    def marquer(self, nom_fichier):
+        """Signale qu'un fichier a changé ; ne bloque jamais l'appelant"""
+        with self._condition:
+            maintenant = time.monotonic()
+            if not self._fichiers_modifies:
+                self._premiere_modification = maintenant
+            self._fichiers_modifies.add(nom_fichier)
+            self._derniere_modification = maintenant
+            self._demarrer()
+            self._condition.notify_all()
+
+    def vider(self, timeout=30):
+        """Pousse immédiatement les fichiers en attente (arrêt du service)"""
+        fin = time.monotonic() + timeout
+        with self._condition:
+            if not self._fichiers_modifies and not self._en_cours:
+                return True
+            self._forcer = True
+            self._demarrer()
+            self._condition.notify_all()
+            while self._fichiers_modifies or self._en_cours:
+                reste = fin - time.monotonic()
+                if reste <= 0:
+                    return False
+                self._condition.wait(reste)
+            return True
+
+    def en_attente(self):
+        with self._condition:
+            return sorted(self._fichiers_modifies)
+
+    # --- Thread de synchronisation ---
+
+    def _demarrer(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._boucle, name="synchro-github", daemon=True)
+            self._thread.start()
+
+    def _attendre_lot(self):
+        """Attend la fin de la fenêtre de regroupement et retire le lot à pousser"""
+        with self._condition:
+            while True:
+                if not self._fichiers_modifies:
+                    self._condition.wait()
+                    continue
+                maintenant = time.monotonic()
+                echeance = min(self._derniere_modification + self.delai,
+                               self._premiere_modification + self.delai_max)
+                if self._forcer or maintenant >= echeance:
+                    lot = sorted(self._fichiers_modifies)
+                    self._fichiers_modifies.clear()
+                    self._forcer = False
+                    self._en_cours = True
+                    return lot
+                self._condition.wait(echeance - maintenant)
+
+    def _remettre(self, lot):
+        with self._condition:
+            if not self._fichiers_modifies:
+                self._premiere_modification = time.monotonic()
+                self._derniere_modification = self._premiere_modification
+            self._fichiers_modifies.update(lot)
+
+    def _boucle(self):
+        pause = 0
+        while True:
+            if pause:
+                time.sleep(pause)
+            lot = self._attendre_lot()
+            try:
+                self.pousser(lot)
+                pause = 0
+            except Exception as e:
+                self._remettre(lot)
+                self.journaliser(f"Erreur GitHub: {e}")
+                pause = min(max(pause * 2, self.delai, 1), PAUSE_ERREUR_MAX)
+            finally:
+                with self._condition:
+                    self._en_cours = False
+                    self._condition.notify_all()
+
+    # --- Cache persistant des SHA ---
+
+    def _charger_etat(self):
+        try:
+            with open(self.fichier_etat, 'r', encoding='utf-8') as f:
+                etat = json.load(f)
+        except (FileNotFoundError, ValueError):
+            etat = {}
+        etat.setdefault("blobs", {})
+        etat.setdefault("tete", None)
+        etat.setdefault("ref", None)
+        return etat
+
+    def _sauver_etat(self):
+        if not self.fichier_etat:
+            return
+        dossier = os.path.dirname(self.fichier_etat)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        temporaire = self.fichier_etat + ".tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(self._etat, f)
+        os.replace(temporaire, self.fichier_etat)
+
+    # --- API Git Data ---
+
+    def _requete(self, methode, chemin, donnees=None, entetes=None):
+        url = f"{self.api}/repos/{self.depot}/{chemin}"
+        entetes = {'Authorization': f'token {self.token}', 'Accept': 'application/vnd.github+json',
+                   **(entetes or {})}
+        # Objets Git adressés par leur contenu, ref fixée à un SHA donné : rejouer un appel est sans risque
+        reponse = client_http.requete(methode, url, donnees=donnees, entetes=entetes, timeout=20,
+                                      idempotent=True)
+        return reponse.json(), reponse.entetes
+
+    def _appel(self, methode, chemin, donnees=None):
+        return self._requete(methode, chemin, donnees)[0]
+
+    def _lire_tete(self):
+        """Tête de la branche : cache local, sinon GET conditionnel (If-None-Match)"""
+        if self._etat["tete"]:
+            return self._etat["tete"]
+
+        ref = self._etat["ref"]
+        try:
+            entetes = {'If-None-Match': ref["etag"]} if ref else None
+            donnees, reponse = self._requete('GET', f"git/ref/heads/{self.branche}", entetes=entetes)
+            ref = {"sha": donnees["object"]["sha"], "etag": reponse.get('ETag'), "arbre": None}
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+        if not ref.get("arbre"):
+            ref["arbre"] = self._appel('GET', f"git/commits/{ref['sha']}")["tree"]["sha"]
+        self._etat["ref"] = ref
+        self._etat["tete"] = {"commit": ref["sha"], "arbre": ref["arbre"]}
+        return self._etat["tete"]
+
+    def restaurer(self, fichiers):
+        """Récupère depuis la branche les fichiers absents en local (conteneur neuf)
+
+        Les blobs sont lus par l'API Git Data (pas de limite de 1 Mo comme l'API contents)
+        et leur SHA est mémorisé : ils ne seront pas repoussés tant qu'ils n'ont pas changé.
+        Retourne les noms des fichiers restaurés.
+        """
+        manquants = [nom for nom in fichiers if not os.path.exists(nom)]
+        if not manquants:
+            return []
+        tete = self._lire_tete()
+        arbre = self._appel('GET', f"git/trees/{tete['arbre']}?recursive=1")
+        shas = {entree["path"]: entree["sha"] for entree in arbre.get("tree", []) if entree.get("type") == "blob"}
+        restaures = []
+        for nom_fichier in manquants:
+            sha = shas.get(nom_fichier)
+            if not sha:
+                continue
+            contenu = base64.b64decode(self._appel('GET', f"git/blobs/{sha}")["content"])
+            if os.path.dirname(nom_fichier):
+                os.makedirs(os.path.dirname(nom_fichier), exist_ok=True)
+            temporaire = nom_fichier + ".tmp"
+            with open(temporaire, 'wb') as f:
+                f.write(contenu)
+            os.replace(temporaire, nom_fichier)
+            self._etat["blobs"][nom_fichier] = sha
+            restaures.append(nom_fichier)
+        self._sauver_etat()
+        return restaures
+
+    @mesurer("github_pousser")
+    def pousser(self, fichiers):
+        """Crée un seul commit contenant tous les fichiers modifiés depuis le dernier envoi"""
+        entrees = []
+        blobs = {}
+        for nom_fichier in fichiers:
+            try:
+                with open(nom_fichier, 'rb') as f:
+                    contenu = f.read()
+            except FileNotFoundError:
+                continue
+            if not contenu:
+                continue
+            sha = sha_blob(contenu)
+            if self._etat["blobs"].get(nom_fichier) == sha:
+                continue  # Déjà sur GitHub : pas de commit vide
+            blobs[nom_fichier] = sha
+            try:
+                entrees.append({"path": nom_fichier, "mode": "100644", "type": "blob",
+                                "content": contenu.decode('utf-8')})
+            except UnicodeDecodeError:
+                # Fichier binaire (segment d'archive gzip) : blob créé à part, en base64
+                self._appel('POST', "git/blobs", {"content": base64.b64encode(contenu).decode(),
+                                                  "encoding": "base64"})
+                entrees.append({"path": nom_fichier, "mode": "100644", "type": "blob", "sha": sha})
+        if not entrees:
+            return None
+
+        horodatage = datetime.now(TIMEZONE_FRANCE).strftime('%Y-%m-%d %H:%M')
+        message = f"🔄 {', '.join(e['path'] for e in entrees)} - {horodatage}"
+
+        for tentative in range(TENTATIVES_CONFLIT):
+            tete = self._lire_tete()
+            try:
+                arbre = self._appel('POST', "git/trees", {"base_tree": tete["arbre"], "tree": entrees})
+                commit = self._appel('POST', "git/commits", {
+                    "message": message,
+                    "tree": arbre["sha"],
+                    "parents": [tete["commit"]]
+                })
+                self._appel('PATCH', f"git/refs/heads/{self.branche}", {"sha": commit["sha"]})
+                break
+            except Exception as e:
+                # La branche a avancé sans nous : on relit la tête et on rejoue le commit
+                self._etat["tete"] = None
+                if not _parent_commit_perime(e) or tentative == TENTATIVES_CONFLIT - 1:
+                    self._sauver_etat()
+                    raise
+
+        self._etat["tete"] = {"commit": commit["sha"], "arbre": arbre["sha"]}
+        self._etat["blobs"].update(blobs)
+        self._sauver_etat()
+        return commit["sha"]
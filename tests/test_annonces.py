@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from annonces import Annonce, DeltaVeille, StockAnnonces
+
+DEBUT = datetime(2026, 3, 2, 8, 0).astimezone()
+
+
+def _annonce(numero, prix=150000, portail="leboncoin", vue_le=DEBUT):
+    return Annonce(
+        portail=portail, cle=str(numero), url=f"https://exemple.fr/{numero}", titre=f"Maison {numero}",
+        prix=prix, surface=90.0, commune="Vergt", code_postal="24380", zone="vergt",
+        premiere_vue=vue_le, derniere_vue=vue_le,
+    )
+
+
+def test_flux_applique_par_lots():
+    stock = StockAnnonces(":memory:")
+    stock.appliquer_veille([_annonce(i) for i in range(5)], {"leboncoin"}, DEBUT)
+
+    def flux():
+        for numero in range(1, 7):
+            yield _annonce(numero, prix=140000 if numero == 2 else 150000, vue_le=DEBUT + timedelta(hours=2))
+
+    delta = DeltaVeille()
+    assert stock.appliquer_lots(flux(), delta, taille_lot=2) == 6
+    stock.marquer_retirees({"leboncoin"}, DEBUT + timedelta(hours=2), delta)
+
+    assert [annonce.cle for annonce in delta.nouvelles] == ["5", "6"]
+    assert [(annonce.cle, ancien) for annonce, ancien in delta.modifiees] == [("2", 150000)]
+    assert [annonce.cle for annonce in delta.retirees] == ["0"]
+    assert delta.suivies == 6
+
+
+def test_annonce_remise_en_ligne_redevient_nouvelle():
+    stock = StockAnnonces(":memory:")
+    stock.appliquer_veille([_annonce(1), _annonce(2)], {"leboncoin"}, DEBUT)
+    retrait = DEBUT + timedelta(days=1)
+    assert [a.cle for a in stock.appliquer_veille([_annonce(2, vue_le=retrait)], {"leboncoin"}, retrait).retirees] == ["1"]
+
+    retour = DEBUT + timedelta(days=5)
+    delta = stock.appliquer_veille([_annonce(1, vue_le=retour), _annonce(2, vue_le=retour)], {"leboncoin"}, retour)
+    assert [a.cle for a in delta.nouvelles] == ["1"]
+    assert [a.cle for a in stock.rechercher(depuis=retour, actives=True)] == ["1"]
+
+
+def test_recherche_par_communes_et_periode():
+    stock = StockAnnonces(":memory:")
+    bugue = _annonce(3, vue_le=DEBUT + timedelta(days=1))
+    bugue.commune = "Le Bugue"
+    stock.enregistrer([_annonce(1), _annonce(2, vue_le=DEBUT + timedelta(days=1)), bugue])
+
+    jour = DEBUT + timedelta(days=1)
+    assert [a.cle for a in stock.rechercher(communes={"VERGT"}, depuis=jour)] == ["2"]
+    assert [a.cle for a in stock.rechercher(communes={"Vergt", "le bugue"}, avant=jour)] == ["1"]
+    assert stock.rechercher(communes=set()) == []
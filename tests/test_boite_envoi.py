@@ -0,0 +1,112 @@
+import smtplib
+import time
+
+import boite_envoi
+from boite_envoi import ECHEC, EN_ATTENTE, ENVOYE, BoiteEnvoi
+
+
+class FauxSMTP:
+    """Serveur SMTP simulé : `refus` (adresse -> (code, texte)) et `panne` configurables"""
+    connexions = []
+    refus = {}
+    panne = None
+
+    def __init__(self, hote, port, timeout=None):
+        self.envois = []
+        FauxSMTP.connexions.append(self)
+
+    def ehlo(self):
+        pass
+
+    def has_extn(self, nom):
+        return False
+
+    def noop(self):
+        return (250, b"OK")
+
+    def sendmail(self, expediteur, destinataires, contenu):
+        if FauxSMTP.panne:
+            raise FauxSMTP.panne
+        refuses = {d: FauxSMTP.refus[d] for d in destinataires if d in FauxSMTP.refus}
+        if len(refuses) == len(destinataires):
+            raise smtplib.SMTPRecipientsRefused(refuses)
+        self.envois.append(destinataires)
+        return refuses
+
+    def quit(self):
+        pass
+
+
+def _boite(tmp_path, monkeypatch, journal=None):
+    FauxSMTP.connexions, FauxSMTP.refus, FauxSMTP.panne = [], {}, None
+    monkeypatch.setattr(boite_envoi.smtplib, "SMTP", FauxSMTP)
+    return BoiteEnvoi("axi@example.fr", "", port=25, dossier=str(tmp_path),
+                      journaliser=(journal if journal is not None else []).append)
+
+
+def _attendre(condition, timeout=5):
+    fin = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < fin
+        time.sleep(0.01)
+
+
+def test_connexion_reutilisee_entre_deux_messages(tmp_path, monkeypatch):
+    boite = _boite(tmp_path, monkeypatch)
+    premier = boite.deposer(["a@example.fr"], "Rapport", "<p>1</p>")
+    assert boite.vider(timeout=5)
+    second = boite.deposer(["b@example.fr"], "Rapport", "<p>2</p>")
+    assert boite.vider(timeout=5)
+    assert boite.obtenir(premier)["statut"] == boite.obtenir(second)["statut"] == ENVOYE
+    assert len(FauxSMTP.connexions) == 1
+    assert FauxSMTP.connexions[0].envois == [["a@example.fr"], ["b@example.fr"]]
+
+
+def test_echec_retente_plus_tard_et_message_conserve(tmp_path, monkeypatch):
+    journal = []
+    boite = _boite(tmp_path, monkeypatch, journal)
+    FauxSMTP.panne = smtplib.SMTPServerDisconnected("connexion perdue")
+    avant = time.time()
+    identifiant = boite.deposer(["a@example.fr"], "Rapport", "<p>1</p>")
+    # Premier essai immédiat par le thread d'envoi
+    _attendre(lambda: journal)
+    message = boite.obtenir(identifiant)
+    assert message["statut"] == EN_ATTENTE
+    assert message["tentatives"] == 1
+    assert message["erreur"] == "connexion perdue"
+    assert message["prochaine_tentative"] >= avant + boite_envoi.PAUSE_INITIALE
+
+    # Redémarrage : le message est relu depuis le disque, avec son contenu
+    relue = BoiteEnvoi("axi@example.fr", "", port=25, dossier=str(tmp_path), journaliser=lambda m: None)
+    assert relue.en_attente() == 1
+    assert relue._messages[identifiant]["html"] == "<p>1</p>"
+
+    FauxSMTP.panne = None
+    assert relue.vider(timeout=5)
+    assert relue.obtenir(identifiant)["statut"] == ENVOYE
+    assert relue.obtenir(identifiant)["tentatives"] == 2
+
+
+def test_refus_partiel(tmp_path, monkeypatch):
+    journal = []
+    boite = _boite(tmp_path, monkeypatch, journal)
+    FauxSMTP.refus = {"inconnu@example.fr": (550, b"adresse inconnue")}
+    identifiant = boite.deposer(["a@example.fr", "inconnu@example.fr"], "Rapport", "<p>1</p>")
+    assert boite.vider(timeout=5)
+    message = boite.obtenir(identifiant)
+    assert message["statut"] == ENVOYE
+    assert message["livraisons"] == {"a@example.fr": ENVOYE,
+                                     "inconnu@example.fr": "refusé : 550 adresse inconnue"}
+    assert "Email envoyé à ['a@example.fr']" in journal
+
+
+def test_tous_les_destinataires_refuses(tmp_path, monkeypatch):
+    journal = []
+    boite = _boite(tmp_path, monkeypatch, journal)
+    FauxSMTP.refus = {"inconnu@example.fr": (550, b"adresse inconnue")}
+    identifiant = boite.deposer(["inconnu@example.fr"], "Rapport", "<p>1</p>")
+    assert boite.vider(timeout=5)
+    message = boite.obtenir(identifiant)
+    assert message["statut"] == ECHEC
+    assert "550 adresse inconnue" in message["erreur"]
+    assert not any(ligne.startswith("Email envoyé") for ligne in journal)
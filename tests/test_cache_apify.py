@@ -0,0 +1,74 @@
+import os
+
+from cache_apify import STATUT_REUSSI, CacheApify
+
+
+def _cache(tmp_path, horloge):
+    return CacheApify(dossier=str(tmp_path), ttl=900, taille_max=10 * 1024 * 1024, horloge=lambda: horloge[0])
+
+
+def test_run_identique_reutilise(tmp_path):
+    horloge = [1000.0]
+    cache = _cache(tmp_path, horloge)
+    lances = []
+
+    def lancer(actor_id, input_data):
+        lances.append(input_data)
+        return {"run_id": f"run{len(lances)}", "status": "RUNNING"}
+
+    assert cache.lancer("actor", {"q": 1}, lancer)["run_id"] == "run1"
+    assert cache.lancer("actor", {"q": 1}, lancer)["status"] == "cache"
+    horloge[0] += 901
+    assert cache.lancer("actor", {"q": 1}, lancer)["run_id"] == "run2"
+    assert cache._verrous == {}
+
+
+def test_run_plus_long_que_le_ttl_mis_en_cache(tmp_path):
+    horloge = [1000.0]
+    cache = _cache(tmp_path, horloge)
+    cache.lancer("actor", {"q": 1}, lambda actor_id, input_data: {"run_id": "long"})
+    # Statut final connu bien après la fenêtre de réutilisation (autre run enregistré entre-temps)
+    horloge[0] += 3600
+    cache.lancer("actor", {"q": 2}, lambda actor_id, input_data: {"run_id": "autre"})
+    cache.noter_statut("long", STATUT_REUSSI)
+
+    telechargements = []
+
+    def telecharger():
+        telechargements.append(1)
+        return iter([{"id": 1}, {"id": 2}])
+
+    assert list(cache.dataset("long", telecharger)) == [{"id": 1}, {"id": 2}]
+    # Nouvelle instance (redémarrage), TTL dépassé : le dataset est relu sur disque
+    horloge[0] += 3600
+    relu = _cache(tmp_path, horloge)
+    assert relu.statut("long") == STATUT_REUSSI
+    assert list(relu.dataset("long", telecharger)) == [{"id": 1}, {"id": 2}]
+    assert len(telechargements) == 1
+    assert relu._verrous == {}
+
+
+def test_dataset_d_un_run_non_termine_non_garde(tmp_path):
+    cache = _cache(tmp_path, [1000.0])
+    assert list(cache.dataset("encours", lambda: iter([{"id": 1}]))) == [{"id": 1}]
+    assert list(cache.dataset("encours", lambda: iter([{"id": 1}, {"id": 2}]))) == [{"id": 1}, {"id": 2}]
+
+
+def test_dataset_produit_en_flux_et_parcours_interrompu_non_garde(tmp_path):
+    cache = _cache(tmp_path, [1000.0])
+    cache.noter_statut("flux", STATUT_REUSSI)
+    produits = []
+
+    def telecharger():
+        for numero in range(3):
+            produits.append(numero)
+            yield {"id": numero}
+
+    elements = cache.dataset("flux", telecharger)
+    assert next(elements) == {"id": 0}
+    assert produits == [0]
+    elements.close()
+    assert not os.path.exists(cache._chemin_dataset("flux"))
+    assert not os.path.exists(cache._chemin_dataset("flux") + ".tmp")
+    assert list(cache.dataset("flux", telecharger)) == [{"id": 0}, {"id": 1}, {"id": 2}]
+    assert os.path.exists(cache._chemin_dataset("flux"))
@@ -0,0 +1,66 @@
+import gzip
+import os
+import zlib
+
+from cache_rendu import CacheRendu, Rendu, choisir_encodage, etag_correspond
+
+
+def test_page_regeneree_quand_la_version_change(tmp_path):
+    source = tmp_path / "journal.txt"
+    source.write_text("ligne\n", encoding="utf-8")
+    version = ["e-1"]
+    rendus = []
+
+    def generer():
+        rendus.append(version[0])
+        return f"<p>/events?depuis={version[0]}</p>"
+
+    cache = CacheRendu(generer, [str(source)], version=lambda: version[0])
+    premier = cache.obtenir()
+    assert cache.obtenir() is premier
+    # Événements publiés sans changement de fichier : l'identifiant de reprise suit
+    version[0] = "e-1500"
+    second = cache.obtenir()
+    assert second is not premier
+    assert b"depuis=e-1500" in second.corps()
+    assert rendus == ["e-1", "e-1500"]
+
+
+def test_negociation_de_l_encodage():
+    assert choisir_encodage("gzip, deflate, br") == "gzip"
+    assert choisir_encodage("deflate;q=1.0, gzip;q=0.5") == "deflate"
+    assert choisir_encodage("gzip;q=0, deflate") == "deflate"
+    assert choisir_encodage("*;q=0.3, gzip;q=0") == "deflate"
+    assert choisir_encodage("identity") is None
+    assert choisir_encodage(None) is None
+
+
+def test_etag_propre_a_chaque_representation():
+    rendu = Rendu("<p>tableau de bord</p>".encode())
+    assert gzip.decompress(rendu.corps("gzip")) == rendu.corps_brut
+    assert zlib.decompress(rendu.corps("deflate")) == rendu.corps_brut
+    assert rendu.corps("gzip") is rendu.corps("gzip")
+    assert len({rendu.etag(), rendu.etag("gzip"), rendu.etag("deflate")}) == 3
+
+    assert etag_correspond(f'"autre", {rendu.etag("gzip")}', rendu.etag("gzip"))
+    assert not etag_correspond(rendu.etag(), rendu.etag("gzip"))
+    assert etag_correspond("*", rendu.etag())
+    assert not etag_correspond(None, rendu.etag())
+
+
+def test_page_regeneree_quand_une_source_change(tmp_path):
+    source = tmp_path / "veille.txt"
+    source.write_text("veille 1\n", encoding="utf-8")
+    cache = CacheRendu(lambda: source.read_text(encoding="utf-8") if source.exists() else "vide", [str(source)])
+    premier = cache.obtenir()
+    assert cache.obtenir() is premier
+
+    # Même taille, date de modification différente
+    source.write_text("veille 2\n", encoding="utf-8")
+    os.utime(source, ns=(0, source.stat().st_mtime_ns + 1_000_000))
+    second = cache.obtenir()
+    assert second.corps() == b"veille 2\n"
+    assert second.etag() != premier.etag()
+
+    source.unlink()
+    assert cache.obtenir().corps() == b"vide"
@@ -0,0 +1,99 @@
+import random
+import threading
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from client_http import ClientHTTP, SeauJetons
+from metriques import Registre
+
+
+@pytest.fixture
+def serveur():
+    """Serveur local qui répond dans l'ordre les (statut, en-têtes) de `serveur.reponses`"""
+
+    class Gestionnaire(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _repondre(self):
+            longueur = int(self.headers.get("Content-Length") or 0)
+            self.rfile.read(longueur)
+            statut, entetes = httpd.reponses.pop(0)
+            httpd.requetes.append((self.command, self.path))
+            corps = b'{"ok": true}'
+            self.send_response(statut)
+            for nom, valeur in entetes.items():
+                self.send_header(nom, valeur)
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+
+        do_GET = do_POST = _repondre
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Gestionnaire)
+    httpd.reponses, httpd.requetes = [], []
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _client(pauses):
+    return ClientHTTP(limites={}, registre=Registre(), dormir=pauses.append, aleatoire=random.Random(0))
+
+
+def test_retry_after_suspend_l_hote_puis_rejoue(serveur):
+    pauses = []
+    client = _client(pauses)
+    serveur.reponses = [(429, {"Retry-After": "2"}), (200, {})]
+    reponse = client.requete("GET", f"{serveur.url}/v2/acts")
+    assert reponse.statut == 200 and reponse.json() == {"ok": True}
+    # Attente imposée par le serveur, sans pause exponentielle en plus
+    assert len(pauses) == 1 and 1.5 < pauses[0] <= 2
+    statistiques = client.statistiques()["127.0.0.1"]
+    assert (statistiques["requetes"], statistiques["erreurs"], statistiques["reessais"]) == (2, 1, 1)
+    # Connexion persistante réutilisée pour le second essai
+    assert statistiques["connexions"] == 1
+
+
+def test_retry_after_trop_long_remonte_l_erreur(serveur):
+    client = _client([])
+    serveur.reponses = [(429, {"Retry-After": "600"})]
+    with pytest.raises(urllib.error.HTTPError) as erreur:
+        client.requete("GET", f"{serveur.url}/v2/acts")
+    assert erreur.value.code == 429
+    # L'hôte reste suspendu : l'appel suivant échoue sans être envoyé
+    with pytest.raises(urllib.error.URLError, match="limite de débit"):
+        client.requete("GET", f"{serveur.url}/v2/acts")
+    assert len(serveur.requetes) == 1
+
+
+def test_post_non_rejoue_apres_une_erreur_serveur(serveur):
+    pauses = []
+    client = _client(pauses)
+    serveur.reponses = [(503, {}), (200, {})]
+    with pytest.raises(urllib.error.HTTPError) as erreur:
+        client.requete("POST", f"{serveur.url}/v2/acts/runs", donnees={"q": 1})
+    assert erreur.value.code == 503
+    assert serveur.requetes == [("POST", "/v2/acts/runs")] and pauses == []
+
+
+def test_seau_de_jetons():
+    horloge = [0.0]
+    seau = SeauJetons(debit=2, capacite=2, horloge=lambda: horloge[0])
+    # Rafale de 2, puis un jeton toutes les 0,5 s, réservés dans l'ordre
+    assert [seau.reserver() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    horloge[0] = 2.0
+    assert seau.reserver() == 0
+
+    # Quota annoncé par le serveur : 10 requêtes en 100 s
+    seau.ajuster(10, 100)
+    assert seau.debit == 0.1 and seau.capacite == 2
+    # Quota épuisé : plus rien avant la réinitialisation
+    seau.ajuster(0, 30)
+    assert seau.reserver() == 30
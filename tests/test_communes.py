@@ -0,0 +1,71 @@
+import csv
+import json
+
+from communes import ReferentielCommunes, convertir_extrait
+from scraper_immo import ZONES, ZONES_AGENCES
+
+
+def test_perimetre_de_recherche_historique():
+    for nom, configuration in ZONES_AGENCES.items():
+        zone = ZONES[nom]
+        assert zone["codes_postaux"] == configuration["codes_postaux"]
+        assert zone["communes"][:len(configuration["communes"])] == configuration["communes"]
+
+
+def test_referentiel_officiel():
+    referentiel = ReferentielCommunes.charger()
+    assert len(referentiel.communes) == 503
+    assert all(commune.insee.startswith("24") for commune in referentiel.communes)
+    vergt = referentiel.rechercher("Vergt")
+    assert (vergt.insee, vergt.codes_postaux) == ("24571", ("24380",))
+    # Communes déléguées : variantes de la commune nouvelle
+    assert referentiel.rechercher("Cendrieux").nom == "Val de Louyre et Caudeau"
+    assert referentiel.rechercher("Saint-Cirq").nom == "Les Eyzies"
+
+
+def test_classement_par_commune_puis_code_postal():
+    assert ZONES.zone_de("24380", "Vergt") == "vergt"
+    assert ZONES.zone_de("", "St-Mayme-de-Péreyrol") == "vergt"
+    # Ancien nom épinglé dans une zone : il garde sa zone, le nom actuel suit l'autre épinglage
+    assert ZONES.zone_de("24510", "Sainte-Alvère") == "bugue"
+    assert ZONES.zone_de("24380", "Cendrieux") == "vergt"
+    assert ZONES.zone_de("24620", "Manaurie") == "bugue"
+    # Commune connue hors zone : son code postal ne la rattache pas
+    assert ZONES.zone_de("24110", "Manzac-sur-Vern") == ""
+    assert ZONES.zone_de("24000", "Périgueux") == ""
+    # Code postal partagé avec des communes hors du rayon (Saint-Astier pour 24110,
+    # Saint-Félix-de-Reillac-et-Mortemart à 10,1 km du Bugue pour 24260) : aucune zone
+    assert ZONES.zone_de("24110", "") == ""
+    assert ZONES.zone_de("24260", "") == ""
+
+
+def test_repli_par_code_postal():
+    referentiel = ReferentielCommunes.charger()
+    zones = referentiel.zones({"sud": {"centre": "Le Bugue", "rayon_km": 11}})
+    assert zones.zone_de("24260", "") == "sud"
+    assert zones.zone_de("24260", "Commune inconnue") == "sud"
+
+
+def test_conversion_de_l_extrait_officiel(tmp_path):
+    destination = tmp_path / "communes.csv"
+    destination.write_text("insee;nom;variantes;codes_postaux;latitude;longitude\n"
+                           "24172;Les Eyzies;Les Eyzies-de-Tayac;24620;44.9;1.0\n", encoding="utf-8")
+    source = tmp_path / "extrait.json"
+    source.write_text(json.dumps([
+        {"nom": "Les Eyzies", "code": "24172", "type": "commune-actuelle", "codesPostaux": ["24260", "24620"],
+         "centre": {"type": "Point", "coordinates": [1.0227, 44.9404]}},
+        {"nom": "Manaurie", "code": "24249", "type": "commune-deleguee", "chefLieu": "24172"},
+        {"nom": "Vergt", "code": "24571", "type": "commune-actuelle", "codesPostaux": ["24380"],
+         "centre": {"type": "Point", "coordinates": [0.7108, 45.0418]}},
+        {"nom": "Brive-la-Gaillarde", "code": "19031", "type": "commune-actuelle", "codesPostaux": ["19100"],
+         "centre": {"type": "Point", "coordinates": [1.53, 45.15]}},
+    ]), encoding="utf-8")
+
+    assert convertir_extrait(str(source), str(destination)) == 2
+    with open(destination, encoding="utf-8", newline="") as f:
+        lignes = list(csv.DictReader(f, delimiter=";"))
+    assert [ligne["insee"] for ligne in lignes] == ["24172", "24571"]
+    assert lignes[0]["variantes"] == "Les Eyzies-de-Tayac|Manaurie"
+    referentiel = ReferentielCommunes.charger(str(destination))
+    assert referentiel.rechercher("Les Eyzies-de-Tayac").insee == "24172"
+    assert referentiel.rechercher("Manaurie").insee == "24172"
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from annonces import Annonce
+from doublons import PHOTO_ANNONCES_MAX, regrouper_doublons
+
+DEBUT = datetime(2026, 3, 2, 8, 0)
+
+
+def _annonce(numero, commune, photos, titre=None, portail="leboncoin"):
+    return Annonce(
+        portail=portail, cle=str(numero), url=f"https://exemple.fr/{numero}",
+        titre=titre or f"Bien numéro {numero} lot {numero * 7}", prix=200000, surface=100.0,
+        commune=commune, code_postal="24380", zone="vergt",
+        premiere_vue=DEBUT + timedelta(minutes=numero), derniere_vue=DEBUT + timedelta(minutes=numero),
+        photos=tuple(photos),
+    )
+
+
+def test_photo_commune_meme_commune_regroupe():
+    annonces = [
+        _annonce(1, "Vergt", ["https://img.exemple.fr/a.jpg?w=800"]),
+        _annonce(2, "Vergt", ["http://img.exemple.fr/a.jpg"], portail="seloger"),
+    ]
+    assert len(regrouper_doublons(annonces)) == 1
+
+
+def test_photo_commune_autre_commune_ne_regroupe_pas():
+    annonces = [
+        _annonce(1, "Vergt", ["https://img.exemple.fr/a.jpg"]),
+        _annonce(2, "Le Bugue", ["https://img.exemple.fr/a.jpg"]),
+    ]
+    assert len(regrouper_doublons(annonces)) == 2
+
+
+def test_photo_generique_ignoree():
+    logo = "https://img.exemple.fr/logo-agence.png"
+    annonces = [_annonce(i, "Vergt", [logo]) for i in range(PHOTO_ANNONCES_MAX + 1)]
+    assert len(regrouper_doublons(annonces)) == len(annonces)
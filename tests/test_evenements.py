@@ -0,0 +1,67 @@
+import socket
+import time
+
+from evenements import REINITIALISATION, Diffuseur, TamponEvenements
+
+
+def test_reprise_depuis_le_tampon():
+    tampon = TamponEvenements(taille=3, epoque="a1")
+    for numero in range(1, 6):
+        tampon.publier("journal", {"ligne": numero})
+    assert tampon.dernier_id() == "a1-5"
+
+    manques, complet = tampon.depuis("a1-3")
+    assert complet and [e.id for e in manques] == ["a1-4", "a1-5"]
+    assert tampon.depuis("a1-5") == ([], True)
+    # Événements sortis du tampon, autre époque (redémarrage) ou identifiant invalide
+    manques, complet = tampon.depuis("a1-1")
+    assert not complet and [e.id for e in manques] == ["a1-3", "a1-4", "a1-5"]
+    assert tampon.depuis("b2-4") == ([], False)
+    assert tampon.depuis("a1-x") == ([], False)
+
+
+def _lire(client, attendu):
+    donnees = b""
+    while attendu not in donnees:
+        morceau = client.recv(4096)
+        assert morceau
+        donnees += morceau
+    return donnees.decode()
+
+
+def test_client_reconnecte_recoit_les_manques_puis_le_direct():
+    diffuseur = Diffuseur(TamponEvenements(taille=3, epoque="a1"), battement=60)
+    for numero in range(1, 5):
+        diffuseur.publier("journal", {"ligne": numero})
+
+    serveur, client = socket.socketpair()
+    client.settimeout(5)
+    diffuseur.accepter(serveur, dernier_id="a1-3")
+    recu = _lire(client, b'{"ligne": 4}\n\n')
+    assert recu.startswith("retry: 3000\n\n")
+    assert "id: a1-3\n" not in recu
+
+    diffuseur.publier("veille", {"nouvelles": 2})
+    assert _lire(client, b"\n\n").startswith('id: a1-5\nevent: veille\ndata: {"nouvelles": 2}\n\n')
+    assert diffuseur.nombre_clients() == 1
+
+    # Départ du client : la connexion est retirée
+    client.close()
+    diffuseur.publier("journal", {"ligne": 6})
+    fin = time.monotonic() + 5
+    while diffuseur.nombre_clients() and time.monotonic() < fin:
+        time.sleep(0.01)
+    assert diffuseur.nombre_clients() == 0
+
+
+def test_client_trop_en_retard_reinitialise():
+    diffuseur = Diffuseur(TamponEvenements(taille=3, epoque="a1"), battement=60)
+    for numero in range(1, 6):
+        diffuseur.publier("journal", {"ligne": numero})
+
+    serveur, client = socket.socketpair()
+    client.settimeout(5)
+    diffuseur.accepter(serveur, dernier_id="a1-1")
+    recu = _lire(client, b"data: {}\n\n")
+    assert f"id: a1-5\nevent: {REINITIALISATION}\n" in recu
+    assert '"ligne"' not in recu
@@ -0,0 +1,41 @@
+import json
+import os
+
+from index_journal import IndexJournal
+
+
+def _ecrire(chemin, messages):
+    with open(chemin, "a", encoding="utf-8") as f:
+        for numero, message in enumerate(messages):
+            f.write(json.dumps({"ts": f"2026-03-10T08:00:{numero:02d}+01:00", "niveau": "info",
+                                "tache": "veille", "message": message}) + "\n")
+
+
+def test_journal_remplace_reindexe_avant_la_lecture(tmp_path):
+    chemin = str(tmp_path / "journal_activite.jsonl")
+    index = IndexJournal(chemin, dossier=str(tmp_path / "index"))
+    _ecrire(chemin, [f"ancien {numero}" for numero in range(5)])
+    index.rattraper()
+
+    # Fichier remplacé (autre inode, plus long) entre deux recherches : les positions ne valent plus
+    temporaire = chemin + ".tmp"
+    _ecrire(temporaire, [f"nouveau {numero}" for numero in range(8)])
+    os.replace(temporaire, chemin)
+    assert [e["message"] for e in index.rechercher()["entrees"]] == [f"nouveau {numero}" for numero in range(7, -1, -1)]
+
+
+def test_ligne_qui_ne_correspond_plus_arrete_la_page_avec_un_curseur(tmp_path):
+    chemin = str(tmp_path / "journal_activite.jsonl")
+    index = IndexJournal(chemin, dossier=str(tmp_path / "index"))
+    _ecrire(chemin, [f"message {numero}" for numero in range(5)])
+    index.rattraper()
+
+    # Réécrit sur place, même taille : rien ne le signale à l'index
+    with open(chemin, "r+b") as f:
+        contenu = f.read()
+        debut = contenu.index(b"message 2")
+        f.seek(contenu.rindex(b"\n", 0, debut) + 1)
+        f.write(b"x" * (contenu.index(b"\n", debut) - contenu.rindex(b"\n", 0, debut) - 1))
+    page = index.rechercher()
+    assert [e["message"] for e in page["entrees"]] == ["message 4", "message 3"]
+    assert page["suivant"] == "3"
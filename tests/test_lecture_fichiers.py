@@ -0,0 +1,48 @@
+from lecture_fichiers import index_fin, lire_fin
+
+
+def test_limite_en_octets_commence_sur_une_ligne_entiere(tmp_path):
+    chemin = tmp_path / "journal.txt"
+    chemin.write_bytes("première ligne\ndeuxième ligne\ntroisième\n".encode())
+    assert lire_fin(chemin, lignes=3, octets=20) == "troisième\n"
+    assert lire_fin(chemin, lignes=3, octets=len("troisième\n".encode())) == "troisième\n"
+    assert lire_fin(chemin, lignes=2, octets=1000) == "deuxième ligne\ntroisième\n"
+
+
+def test_limite_en_octets_seule(tmp_path):
+    chemin = tmp_path / "veille.txt"
+    chemin.write_bytes("abc\nété\n".encode())
+    assert lire_fin(chemin, octets=4) == "té\n"
+    assert lire_fin(tmp_path / "absent.txt", lignes=5) == ""
+
+
+def test_limite_en_octets_coupant_un_caractere(tmp_path):
+    chemin = tmp_path / "veille.txt"
+    chemin.write_bytes("abc\nété\n🏠 maison\n".encode())
+    # 5 derniers octets de « été\n » : le premier est la suite d'un « é »
+    assert lire_fin(chemin, octets=len("🏠 maison\n".encode()) + 5) == "té\n🏠 maison\n"
+    assert lire_fin(chemin, octets=len(" maison\n".encode()) + 2) == " maison\n"
+
+
+def test_fichier_en_ajout_seul_indexe_la_partie_nouvelle(tmp_path):
+    chemin = tmp_path / "journal.txt"
+    chemin.write_text("ligne 1\nligne 2\nligne 3\n", encoding="utf-8")
+    assert lire_fin(chemin, lignes=2) == "ligne 2\nligne 3\n"
+    inode = index_fin._index[chemin][0]
+
+    with open(chemin, "a", encoding="utf-8") as f:
+        f.write("ligne 4\nligne 5\n")
+    assert lire_fin(chemin, lignes=3) == "ligne 3\nligne 4\nligne 5\n"
+    assert index_fin._index[chemin][:2] == (inode, chemin.stat().st_size)
+    assert len(index_fin._index[chemin][3]) == 5
+
+
+def test_fichier_reecrit_sur_le_meme_inode(tmp_path):
+    chemin = tmp_path / "journal.txt"
+    chemin.write_text("ancien 1\nancien 2\n", encoding="utf-8")
+    assert lire_fin(chemin, lignes=1) == "ancien 2\n"
+
+    # Réécrit en place (même inode), plus long : les positions indexées ne valent plus
+    with open(chemin, "r+", encoding="utf-8") as f:
+        f.write("nouveau 1\nnouveau 2\nnouveau 3\n")
+    assert lire_fin(chemin, lignes=2) == "nouveau 2\nnouveau 3\n"
@@ -0,0 +1,54 @@
+import pytest
+
+from metriques import Histogramme, Registre
+
+
+def test_histogramme_cumule_par_seuil():
+    histogramme = Histogramme("axi_duree_secondes", "Durée", ("operation",), seuils=(0.1, 1))
+    for duree in (0.05, 0.1, 0.5, 3):
+        histogramme.observer(duree, "github")
+    histogramme.observer(0.2, 'smtp "gmail"')
+    assert histogramme.exposer() == [
+        "# HELP axi_duree_secondes Durée",
+        "# TYPE axi_duree_secondes histogram",
+        'axi_duree_secondes_bucket{operation="github",le="0.1"} 2',
+        'axi_duree_secondes_bucket{operation="github",le="1"} 3',
+        'axi_duree_secondes_bucket{operation="github",le="+Inf"} 4',
+        'axi_duree_secondes_sum{operation="github"} 3.65',
+        'axi_duree_secondes_count{operation="github"} 4',
+        'axi_duree_secondes_bucket{operation="smtp \\"gmail\\"",le="0.1"} 0',
+        'axi_duree_secondes_bucket{operation="smtp \\"gmail\\"",le="1"} 1',
+        'axi_duree_secondes_bucket{operation="smtp \\"gmail\\"",le="+Inf"} 1',
+        'axi_duree_secondes_sum{operation="smtp \\"gmail\\""} 0.2',
+        'axi_duree_secondes_count{operation="smtp \\"gmail\\""} 1',
+    ]
+
+
+def test_appels_mesures_erreurs_et_appels_lents():
+    lents = []
+    registre = Registre(seuil_lent=0.5, tracer=lambda *appel: lents.append(appel))
+
+    @registre.mesurer("apify", echec=lambda resultat: resultat.get("error"))
+    def lancer(resultat):
+        return resultat
+
+    @registre.mesurer("smtp")
+    def envoyer():
+        raise OSError("refusé")
+
+    lancer({"run_id": "r1"})
+    lancer({"error": "quota"})
+    with pytest.raises(OSError):
+        envoyer()
+    registre.observer("github", 2.0)
+
+    assert registre.resume() == {
+        "apify": {"appels": 2, "erreurs": 1, "taux_erreur": 0.5},
+        "smtp": {"appels": 1, "erreurs": 1, "taux_erreur": 1.0},
+        "github": {"appels": 1, "erreurs": 0, "taux_erreur": 0.0},
+    }
+    assert lents == [("github", 2.0, None)]
+    texte = registre.exposer()
+    assert texte.endswith("\n")
+    assert 'axi_operations_total{operation="apify",resultat="erreur"} 1' in texte
+    assert 'axi_operation_duree_secondes_count{operation="github"} 1' in texte
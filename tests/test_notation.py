@@ -0,0 +1,90 @@
+import threading
+from datetime import datetime
+
+from annonces import TIMEZONE_FRANCE, Annonce
+from notation import ClientLocal, NotationOpportunites
+
+MAINTENANT = datetime(2026, 3, 10, 12, tzinfo=TIMEZONE_FRANCE)
+
+
+def _annonce(cle, description, prix=100000, commune="Vergt"):
+    return Annonce("leboncoin", cle, f"https://exemple.fr/{cle}", f"Maison {cle}", prix, 100, commune,
+                   "24380", "vergt", MAINTENANT, MAINTENANT, description)
+
+
+class ClientDiffere(ClientLocal):
+    """Doublure dont les lots restent en cours pendant `attentes` sondages"""
+
+    def __init__(self, attentes):
+        super().__init__()
+        self.attentes = attentes
+        self.soumissions = []
+
+    def soumettre(self, consignes, demandes):
+        self.soumissions.append(dict(demandes))
+        return super().soumettre(consignes, demandes)
+
+    def recuperer(self, id_lot):
+        if self.attentes > 0:
+            self.attentes -= 1
+            return None
+        return super().recuperer(id_lot)
+
+
+def _notation(tmp_path, client, **options):
+    return NotationOpportunites(client, dossier=str(tmp_path), journaliser=lambda message: None,
+                                sommeil=lambda secondes: None, **options)
+
+
+def test_soumission_puis_cache(tmp_path):
+    annonces = [_annonce("1", "Particulier vend, urgent cause mutation", prix=80000),
+                _annonce("2", "Notre agence vous propose, honoraires charge vendeur")]
+    client = ClientDiffere(attentes=0)
+    notes = _notation(tmp_path, client).noter(annonces, {"vergt": 1200})
+
+    assert len(client.soumissions) == 1 and len(client.soumissions[0]) == 2
+    assert [note.annonce.cle for note in notes] == ["1", "2"]
+    assert notes[0].particulier and notes[0].vente_motivee and notes[0].sous_evaluee
+    assert not notes[1].particulier
+
+    # Nouvelle instance, même texte : lu sur disque, aucun lot
+    client = ClientDiffere(attentes=0)
+    assert len(_notation(tmp_path, client).noter(annonces)) == 2
+    assert client.soumissions == []
+
+    # Seule l'annonce dont le texte a changé est renotée
+    annonces[1].description += " Jardin."
+    _notation(tmp_path, client).noter(annonces)
+    assert [len(demandes) for demandes in client.soumissions] == [1]
+
+
+def test_lot_en_cours_repris_sans_nouvelle_soumission(tmp_path):
+    annonces = [_annonce("1", "Je vends ma grange, prix négociable")]
+    horloge = [0]
+    client = ClientDiffere(attentes=3)
+    notation = _notation(tmp_path, client, attente_max=1, horloge=lambda: horloge[0])
+    notation.sommeil = lambda secondes: horloge.__setitem__(0, horloge[0] + 1)
+    assert notation.noter(annonces) == []
+    assert notation.statistiques()["lot_en_cours"]
+
+    notation.attente_max = 10
+    notes = notation.noter(annonces)
+    assert len(client.soumissions) == 1
+    assert len(notes) == 1 and notes[0].vente_motivee
+    assert not notation.statistiques()["lot_en_cours"]
+
+
+def test_statistiques_pendant_l_attente_d_un_lot(tmp_path):
+    client = ClientDiffere(attentes=1)
+    notation = _notation(tmp_path, client)
+    lues = []
+
+    def sommeil(secondes):
+        # /status interrogé depuis un autre thread pendant que le lot est en cours
+        lecteur = threading.Thread(target=lambda: lues.append(notation.statistiques()))
+        lecteur.start()
+        lecteur.join(timeout=5)
+
+    notation.sommeil = sommeil
+    notation.noter([_annonce("1", "Maison de particulier")])
+    assert lues and lues[0]["lot_en_cours"]
@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+
+from planificateur import TIMEZONE_FRANCE, Cron, Planificateur
+
+
+def _date(*valeurs):
+    return datetime(*valeurs, tzinfo=TIMEZONE_FRANCE)
+
+
+def _planificateur(tmp_path, taches, dernieres, maintenant):
+    fichier_etat = tmp_path / "planificateur.json"
+    fichier_etat.write_text(json.dumps({nom: date.isoformat() for nom, date in dernieres.items()}))
+    planificateur = Planificateur(taches, file_travaux=None, journaliser=lambda message: None,
+                                  fichier_etat=str(fichier_etat), horloge=lambda: maintenant)
+    planificateur._initialiser()
+    return dict(planificateur.prochaines())
+
+
+def test_prochaine_echeance():
+    cron = Cron("0 8-16/2 * * *")
+    assert cron.prochaine(_date(2026, 3, 10, 9, 30)) == _date(2026, 3, 10, 10, 0)
+    assert cron.prochaine(_date(2026, 3, 10, 16, 0)) == _date(2026, 3, 11, 8, 0)
+
+
+def test_rattrape_la_derniere_echeance_manquee(tmp_path):
+    # Dernière veille hier à 16h, redémarrage aujourd'hui à 16h20 : l'échéance de 16h est rattrapée
+    taches = [{"nom": "veille", "cron": "0 8-16/2 * * *", "fonction": None, "rattrapage": 3600}]
+    prochaines = _planificateur(tmp_path, taches, {"veille": _date(2026, 3, 9, 16, 0)},
+                                _date(2026, 3, 10, 16, 20))
+    assert prochaines == {"veille": _date(2026, 3, 10, 16, 0)}
+
+
+def test_rapport_rattrape_apres_un_arret_de_plusieurs_jours(tmp_path):
+    taches = [{"nom": "rapport", "cron": "0 18 * * *", "fonction": None, "rattrapage": 5 * 3600}]
+    prochaines = _planificateur(tmp_path, taches, {"rapport": _date(2026, 3, 7, 18, 0)},
+                                _date(2026, 3, 10, 19, 0))
+    assert prochaines == {"rapport": _date(2026, 3, 10, 18, 0)}
+
+
+def test_echeance_trop_ancienne_non_rattrapee(tmp_path):
+    taches = [{"nom": "veille", "cron": "0 8-16/2 * * *", "fonction": None, "rattrapage": 3600}]
+    prochaines = _planificateur(tmp_path, taches, {"veille": _date(2026, 3, 9, 16, 0)},
+                                _date(2026, 3, 10, 17, 30))
+    assert prochaines == {"veille": _date(2026, 3, 11, 8, 0)}
+
+
+def test_conteneur_neuf_rattrape_sans_historique(tmp_path):
+    # Aucun état (conteneur neuf) : l'échéance de 18h, dans la fenêtre, est rattrapée
+    taches = [{"nom": "rapport", "cron": "0 18 * * *", "fonction": None, "rattrapage": 5 * 3600}]
+    assert _planificateur(tmp_path, taches, {}, _date(2026, 3, 10, 19, 0)) == {
+        "rapport": _date(2026, 3, 10, 18, 0)}
+    assert _planificateur(tmp_path, taches, {}, _date(2026, 3, 10, 23, 30)) == {
+        "rapport": _date(2026, 3, 11, 18, 0)}
+
+
+def test_etat_restaure_avant_demarrage_de_la_boucle(tmp_path):
+    # L'état restauré depuis GitHub après la construction évite une double exécution
+    taches = [{"nom": "rapport", "cron": "0 18 * * *", "fonction": None, "rattrapage": 5 * 3600}]
+    fichier_etat = tmp_path / "planificateur.json"
+    enregistres = []
+    planificateur = Planificateur(taches, file_travaux=None, journaliser=lambda message: None,
+                                  fichier_etat=str(fichier_etat),
+                                  horloge=lambda: _date(2026, 3, 10, 19, 0),
+                                  apres_enregistrement=enregistres.append)
+    fichier_etat.write_text(json.dumps({"rapport": _date(2026, 3, 10, 18, 0).isoformat()}))
+    planificateur._initialiser()
+    assert dict(planificateur.prochaines()) == {"rapport": _date(2026, 3, 11, 18, 0)}
+    planificateur._noter_execution("rapport", _date(2026, 3, 10, 19, 0))
+    assert enregistres == [str(fichier_etat)]
@@ -0,0 +1,83 @@
+import gzip
+import os
+import shutil
+from datetime import datetime, timedelta
+
+from rotation import SUFFIXE_ROTATION, TIMEZONE_FRANCE, FichierSegmente
+
+
+def _fichier(dossier, horloge, **options):
+    return FichierSegmente(str(dossier / "journal.txt"), dossier=str(dossier / "archives"),
+                           horloge=lambda: horloge[0], **options)
+
+
+def _ajouter(fichier, ligne):
+    fichier.preparer()
+    with open(fichier.chemin, 'a', encoding='utf-8') as f:
+        f.write(ligne + "\n")
+
+
+def test_rotation_quotidienne_et_lecture(tmp_path):
+    horloge = [datetime(2026, 3, 9, 10, tzinfo=TIMEZONE_FRANCE)]
+    fichier = _fichier(tmp_path, horloge)
+    for i in range(3):
+        _ajouter(fichier, f"lundi {i}")
+    horloge[0] += timedelta(days=1)
+    _ajouter(fichier, "mardi")
+
+    segments = fichier.segments()
+    assert [os.path.basename(s["fichier"]) for s in segments] == ["2026-03-09.txt.gz"]
+    assert segments[0]["lignes"] == 3
+    assert fichier.lire().splitlines() == ["lundi 0", "lundi 1", "lundi 2", "mardi"]
+    assert fichier.lire_fin(2).splitlines() == ["lundi 2", "mardi"]
+
+
+def test_scellement_interrompu_repris(tmp_path):
+    horloge = [datetime(2026, 3, 9, 10, tzinfo=TIMEZONE_FRANCE)]
+    fichier = _fichier(tmp_path, horloge, taille_max=50)
+    _ajouter(fichier, "x" * 60)
+    os.replace(fichier.chemin, fichier.chemin + SUFFIXE_ROTATION)
+
+    repris = _fichier(tmp_path, horloge, taille_max=50)
+    repris.preparer()
+    assert not os.path.exists(fichier.chemin + SUFFIXE_ROTATION)
+    with gzip.open(repris.segments()[-1]["fichier"], 'rt') as f:
+        assert f.read() == "x" * 60 + "\n"
+
+
+def test_restauration_apres_lecture_au_demarrage(tmp_path, monkeypatch):
+    # Archives sauvegardées par une instance précédente (chemins relatifs, comme en service)
+    horloge = [datetime(2026, 3, 9, 10, tzinfo=TIMEZONE_FRANCE)]
+    sauvegarde = tmp_path / "sauvegarde"
+    local = tmp_path / "local"
+    sauvegarde.mkdir()
+    local.mkdir()
+    monkeypatch.chdir(sauvegarde)
+    ancien = FichierSegmente("journal.txt", horloge=lambda: horloge[0])
+    _ajouter(ancien, "ancien")
+    horloge[0] += timedelta(days=1)
+    ancien.preparer()
+
+    # Conteneur neuf : le tableau de bord lit (et une écriture crée un manifeste vide)
+    # avant la restauration
+    monkeypatch.chdir(local)
+    neuf = FichierSegmente("journal.txt", horloge=lambda: horloge[0])
+    assert neuf.lire_fin(10) == ""
+    neuf.preparer()
+
+    def recuperer(chemins):
+        restaures = []
+        for chemin in chemins:
+            source = sauvegarde / chemin
+            if not os.path.exists(chemin) and source.exists():
+                os.makedirs(os.path.dirname(chemin), exist_ok=True)
+                shutil.copy(source, chemin)
+                restaures.append(chemin)
+        return restaures
+
+    restaures = neuf.restaurer(recuperer)
+    assert len(restaures) == 2
+    assert len(neuf.segments()) == 1
+    assert neuf.lire() == "ancien\n"
+    _ajouter(neuf, "nouveau")
+    assert len(FichierSegmente("journal.txt", horloge=lambda: horloge[0]).segments()) == 1
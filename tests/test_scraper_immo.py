@@ -0,0 +1,39 @@
+import scraper_immo
+from cache_apify import CacheApify
+
+
+def test_veille_passe_chaque_dataset_en_flux(tmp_path, monkeypatch):
+    datasets = {"run-leboncoin-vergt": 3, "run-leboncoin-bugue": 2, "run-bienici-dordogne": 4}
+    monkeypatch.setattr(scraper_immo, "cache_apify", CacheApify(dossier=str(tmp_path)))
+    perimetres = []
+
+    def lancer(portail):
+        def lancement(perimetre):
+            perimetres.append((portail, perimetre))
+            return {"run_id": f"run-{portail}-{perimetre['nom']}"}
+        return lancement
+
+    monkeypatch.setattr(scraper_immo, "PORTAILS", {portail: lancer(portail) for portail in ("leboncoin", "bienici")})
+    monkeypatch.setattr(scraper_immo, "ZONES", {nom: dict(zone, nom=nom) for nom, zone in scraper_immo.ZONES.items()})
+    monkeypatch.setattr(scraper_immo, "attendre_fin_run", lambda run_id: {"status": "SUCCEEDED"})
+    monkeypatch.setattr(scraper_immo, "iterer_resultats_apify",
+                        lambda run_id: ({"id": f"{run_id}-{i}"} for i in range(datasets[run_id])))
+
+    recus = []
+
+    def traiter(biens):
+        assert not isinstance(biens, list)
+        nombre = 0
+        for bien in biens:
+            recus.append((bien["_portail"], bien["_zone"], bien["id"]))
+            nombre += 1
+        return nombre
+
+    resultats = scraper_immo.lancer_veille_complete(portails=["leboncoin", "bienici"], traiter=traiter)
+
+    assert "biens" not in resultats
+    assert resultats["nb_biens"] == len(recus) == 9
+    assert resultats["zones"]["vergt"]["leboncoin"]["nb_biens"] == 3
+    assert ("bienici", "dordogne", "run-bienici-dordogne-0") in recus
+    # Le portail départemental reçoit le département, pas une zone d'agence
+    assert ("bienici", scraper_immo.DEPARTEMENT) in perimetres
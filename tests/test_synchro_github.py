@@ -0,0 +1,95 @@
+import threading
+import urllib.error
+
+from synchro_github import SynchroGitHub, sha_blob
+
+
+class FauxGitHub:
+    """API Git Data simulée : branche `main`, commits refusés tant que `conflits` > 0"""
+
+    def __init__(self, tete="c1", arbre="t1", etag='"e1"', conflits=0, code_conflit=422):
+        self.tete = tete
+        self.arbres = {tete: arbre}
+        self.etag = etag
+        self.conflits = conflits
+        self.code_conflit = code_conflit
+        self.appels = []
+        self.commits = []
+
+    def __call__(self, methode, chemin, donnees=None, entetes=None):
+        self.appels.append((methode, chemin))
+        if (methode, chemin) == ("GET", "git/ref/heads/main"):
+            if (entetes or {}).get("If-None-Match") == self.etag:
+                raise urllib.error.HTTPError(chemin, 304, "Not Modified", {}, None)
+            return {"object": {"sha": self.tete}}, {"ETag": self.etag}
+        if methode == "GET" and chemin.startswith("git/commits/"):
+            return {"tree": {"sha": self.arbres[chemin.rsplit("/", 1)[1]]}}, {}
+        if (methode, chemin) == ("POST", "git/trees"):
+            return {"sha": f"arbre-{len(self.commits) + 1}"}, {}
+        if (methode, chemin) == ("POST", "git/commits"):
+            self.commits.append(donnees)
+            return {"sha": f"commit-{len(self.commits)}"}, {}
+        if (methode, chemin) == ("PATCH", "git/refs/heads/main"):
+            if self.conflits:
+                # Un autre client a avancé la branche entre-temps
+                self.conflits -= 1
+                self.tete, self.etag = "c2", '"e2"'
+                self.arbres["c2"] = "t2"
+                raise urllib.error.HTTPError(chemin, self.code_conflit, "Conflit", {}, None)
+            self.tete = donnees["sha"]
+            return {}, {}
+        raise AssertionError(f"Appel inattendu : {methode} {chemin}")
+
+
+def _synchro(tmp_path, github, etat=None, **options):
+    synchro = SynchroGitHub("jeton", "axi/sauvegarde", journaliser=lambda message: None,
+                            fichier_etat=str(tmp_path / "etat" / "synchro_github.json"), **options)
+    synchro._etat.update(etat or {})
+    synchro._requete = github
+    return synchro
+
+
+def test_tete_inchangee_relue_par_requete_conditionnelle(tmp_path):
+    github = FauxGitHub()
+    synchro = _synchro(tmp_path, github, {"ref": {"sha": "c1", "etag": '"e1"', "arbre": "t1"}})
+    assert synchro._lire_tete() == {"commit": "c1", "arbre": "t1"}
+    # 304 : ni corps ni relecture du commit
+    assert github.appels == [("GET", "git/ref/heads/main")]
+
+
+def test_commit_rejoue_sur_la_nouvelle_tete_apres_un_conflit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "rapport_quotidien.txt").write_text("rapport\n", encoding="utf-8")
+    for code in (409, 422):
+        github = FauxGitHub(conflits=1, code_conflit=code)
+        synchro = _synchro(tmp_path, github, {"tete": {"commit": "c1", "arbre": "t1"}, "blobs": {}})
+        assert synchro.pousser(["rapport_quotidien.txt"]) == "commit-2"
+        assert [commit["parents"] for commit in github.commits] == [["c1"], ["c2"]]
+        assert github.tete == "commit-2"
+        assert synchro._etat["blobs"] == {"rapport_quotidien.txt": sha_blob(b"rapport\n")}
+        # Contenu déjà poussé : pas de commit vide
+        assert synchro.pousser(["rapport_quotidien.txt"]) is None
+
+
+def test_ecritures_rapprochees_regroupees_en_un_commit(tmp_path):
+    synchro = _synchro(tmp_path, FauxGitHub(), delai=0.2, delai_max=5)
+    lots = []
+    pousse = threading.Event()
+
+    def pousser(fichiers):
+        lots.append(fichiers)
+        pousse.set()
+
+    synchro.pousser = pousser
+    synchro.marquer("journal_activite.txt")
+    synchro.marquer("veille_concurrence.txt")
+    synchro.marquer("journal_activite.txt")
+    assert pousse.wait(5)
+    assert lots == [["journal_activite.txt", "veille_concurrence.txt"]]
+
+    # vider() n'attend pas la fin de la fenêtre de regroupement
+    synchro.delai = 60
+    synchro.marquer("rapport_quotidien.txt")
+    assert synchro.vider(timeout=5)
+    assert lots[-1] == ["rapport_quotidien.txt"]
+    assert synchro.en_attente() == []
@@ -0,0 +1,45 @@
+import threading
+
+from travaux import EXPIRE, TERMINE, FileTravaux, travail_courant
+
+
+def test_soumission_en_double_rattachee_au_travail_en_cours():
+    file = FileTravaux(nb_ouvriers=2, journaliser=lambda message: None)
+    liberer = threading.Event()
+    executions = []
+
+    def veille():
+        executions.append(travail_courant())
+        liberer.wait(5)
+        return "ok"
+
+    premier = file.soumettre("veille", veille)
+    second = file.soumettre("veille", veille)
+    assert second is premier
+    assert premier.soumissions == 2
+
+    liberer.set()
+    assert premier.termine.wait(5)
+    assert premier.etat == TERMINE and premier.resultat == "ok"
+    assert executions == [premier]
+    # Terminé : une nouvelle soumission relance l'action
+    assert file.soumettre("veille", veille) is not premier
+
+
+def test_travail_expire_libere_l_ouvrier_sans_doublon():
+    journal = []
+    file = FileTravaux(nb_ouvriers=1, journaliser=journal.append)
+    liberer = threading.Event()
+    lent = file.soumettre("rapport", liberer.wait, 5, timeout=0.1)
+
+    # Le seul ouvrier passe au travail suivant pendant que le rapport tourne encore
+    rapide = file.soumettre("statut", lambda: "ok")
+    assert rapide.termine.wait(5)
+    assert lent.etat == EXPIRE
+    assert journal == ["⏱️ Travail rapport expiré après 0.1 s"]
+    assert file.soumettre("rapport", liberer.wait, 5) is lent
+
+    liberer.set()
+    assert lent.termine.wait(5)
+    assert lent.etat == TERMINE
+    assert file.soumettre("rapport", lambda: None) is not lent
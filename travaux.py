@@ -0,0 +1,170 @@
+"""
+File de travaux en arrière-plan
+Les actions longues (veille, rapport) sont exécutées par des threads ouvriers ;
+une même action soumise deux fois pendant qu'elle attend ou tourne n'est lancée qu'une fois.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+TIMEZONE_FRANCE = ZoneInfo("Europe/Paris")
+
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ERREUR = "erreur"
+EXPIRE = "expire"  # délai dépassé : l'ouvrier est libéré, le travail finit en arrière-plan
+
+_courant = threading.local()
+
+
+def travail_courant():
+    """Travail exécuté par le thread appelant, ou None (pour rattacher les logs à leur tâche)"""
+    return getattr(_courant, "travail", None)
+
+
+class Travail:
+    """Un travail soumis à la file, avec son état et ses horaires"""
+
+    def __init__(self, nom, fonction, args=(), kwargs=None, timeout=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.nom = nom
+        self.fonction = fonction
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.timeout = timeout
+        self.etat = EN_ATTENTE
+        self.soumis_le = datetime.now(TIMEZONE_FRANCE)
+        self.debut = None
+        self.fin = None
+        self.duree = None
+        self.resultat = None
+        self.erreur = None
+        self.soumissions = 1
+        self.termine = threading.Event()
+
+    @property
+    def actif(self):
+        return self.etat in (EN_ATTENTE, EN_COURS)
+
+    def en_dict(self):
+        return {
+            "id": self.id,
+            "nom": self.nom,
+            "etat": self.etat,
+            "soumis_le": self.soumis_le.isoformat(),
+            "debut": self.debut.isoformat() if self.debut else None,
+            "fin": self.fin.isoformat() if self.fin else None,
+            "duree_s": round(self.duree, 3) if self.duree is not None else None,
+            "soumissions": self.soumissions,
+            "erreur": self.erreur,
+        }
+
+
+class FileTravaux:
+    """File de travaux servie par un groupe de threads ouvriers"""
+
+    def __init__(self, nb_ouvriers=2, historique=200, journaliser=print, observateur=None):
+        self.nb_ouvriers = max(1, nb_ouvriers)
+        self.historique = historique
+        self.journaliser = journaliser
+        # Appelé avec chaque travail terminé (bilan du jour, métriques...)
+        self.observateur = observateur
+        self._file = queue.Queue()
+        self._verrou = threading.Lock()
+        self._travaux = OrderedDict()
+        self._actifs = {}  # nom -> travail en attente ou en cours
+        self._ouvriers = []
+
+    def demarrer(self):
+        with self._verrou:
+            if self._ouvriers:
+                return
+            for i in range(self.nb_ouvriers):
+                ouvrier = threading.Thread(target=self._boucle, name=f"travaux-{i + 1}", daemon=True)
+                ouvrier.start()
+                self._ouvriers.append(ouvrier)
+
+    def soumettre(self, nom, fonction, *args, timeout=None, **kwargs):
+        """Ajoute un travail, ou retourne celui du même nom déjà en attente/en cours
+
+        Passé `timeout` secondes, l'ouvrier n'attend plus le travail et passe au suivant.
+        """
+        self.demarrer()
+        with self._verrou:
+            existant = self._actifs.get(nom)
+            if existant is not None:
+                existant.soumissions += 1
+                return existant
+            travail = Travail(nom, fonction, args, kwargs, timeout)
+            self._actifs[nom] = travail
+            self._travaux[travail.id] = travail
+            self._purger()
+        self._file.put(travail)
+        return travail
+
+    def obtenir(self, id_travail):
+        with self._verrou:
+            return self._travaux.get(id_travail)
+
+    def lister(self):
+        with self._verrou:
+            return list(reversed(self._travaux.values()))
+
+    def _purger(self):
+        """Oublie les plus anciens travaux terminés au-delà de l'historique"""
+        surplus = len(self._travaux) - self.historique
+        for id_travail in list(self._travaux):
+            if surplus <= 0:
+                break
+            if not self._travaux[id_travail].actif:
+                del self._travaux[id_travail]
+                surplus -= 1
+
+    def _boucle(self):
+        while True:
+            travail = self._file.get()
+            try:
+                if travail.timeout:
+                    executant = threading.Thread(target=self._executer, args=(travail,),
+                                                 name=f"travail-{travail.nom}", daemon=True)
+                    executant.start()
+                    if not travail.termine.wait(travail.timeout):
+                        travail.etat = EXPIRE
+                        self.journaliser(f"⏱️ Travail {travail.nom} expiré après {travail.timeout} s")
+                else:
+                    self._executer(travail)
+            finally:
+                self._file.task_done()
+
+    def _executer(self, travail):
+        travail.etat = EN_COURS
+        travail.debut = datetime.now(TIMEZONE_FRANCE)
+        depart = time.monotonic()
+        _courant.travail = travail
+        try:
+            travail.resultat = travail.fonction(*travail.args, **travail.kwargs)
+            travail.etat = TERMINE
+        except Exception as e:
+            travail.erreur = str(e)
+            travail.etat = ERREUR
+            self.journaliser(f"Erreur travail {travail.nom}: {e}")
+        finally:
+            _courant.travail = None
+            travail.duree = time.monotonic() - depart
+            travail.fin = datetime.now(TIMEZONE_FRANCE)
+            with self._verrou:
+                # Un travail expiré garde sa place jusqu'à sa vraie fin : pas de doublon
+                if self._actifs.get(travail.nom) is travail:
+                    del self._actifs[travail.nom]
+            travail.termine.set()
+            if self.observateur:
+                try:
+                    self.observateur(travail)
+                except Exception as e:
+                    self.journaliser(f"Erreur observateur travaux: {e}")